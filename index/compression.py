@@ -0,0 +1,80 @@
+"""
+Compressão das listas de ocorrências: os doc_ids (ordenados) são armazenados como a diferença
+para o doc_id anterior e, assim como as frequências, codificados em varint (7 bits por byte,
+o bit mais significativo indica que o número continua no próximo byte).
+Uma lista com n ocorrências é gravada como n gaps de doc_id seguidos das n frequências.
+"""
+from array import array
+from typing import Tuple
+
+
+def encode_varints(values, buffer: bytearray):
+    append = buffer.append
+    for value in values:
+        # a maioria dos gaps e frequências cabe em um byte
+        if value < 0x80:
+            append(value)
+            continue
+        while value >= 0x80:
+            append((value & 0x7F) | 0x80)
+            value >>= 7
+        append(value)
+
+
+def decode_varints(buffer, count: int, pos: int = 0) -> Tuple[array, int]:
+    """
+    Decodifica `count` inteiros a partir da posição `pos` de `buffer`.
+    Retorna os inteiros e a posição logo após o último byte lido.
+    """
+    values = array("I", bytes(4 * count))
+    for i in range(count):
+        byte = buffer[pos]
+        pos += 1
+        if byte < 0x80:
+            values[i] = byte
+            continue
+        value = byte & 0x7F
+        shift = 7
+        while True:
+            byte = buffer[pos]
+            pos += 1
+            value |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                break
+            shift += 7
+        values[i] = value
+    return values, pos
+
+
+def delta_encode(doc_ids) -> array:
+    gaps = array("I", doc_ids)
+    for i in range(len(gaps) - 1, 0, -1):
+        gaps[i] -= gaps[i - 1]
+    return gaps
+
+
+def delta_decode(gaps: array) -> array:
+    doc_ids = gaps
+    for i in range(1, len(doc_ids)):
+        doc_ids[i] += doc_ids[i - 1]
+    return doc_ids
+
+
+def encode_postings(doc_ids, term_freqs) -> bytes:
+    """
+    Codifica uma lista de ocorrências. Os doc_ids devem estar em ordem estritamente crescente.
+    """
+    buffer = bytearray()
+    encode_varints(delta_encode(doc_ids), buffer)
+    encode_varints(term_freqs, buffer)
+    return bytes(buffer)
+
+
+def decode_postings(buffer, count: int) -> Tuple[array, array]:
+    """
+    Decodifica uma lista de `count` ocorrências gravada por `encode_postings`.
+    Retorna os arrays de doc_ids e de frequências.
+    """
+    gaps, pos = decode_varints(buffer, count)
+    term_freqs, _ = decode_varints(buffer, count, pos)
+    return delta_decode(gaps), term_freqs
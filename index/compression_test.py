@@ -0,0 +1,63 @@
+from index.compression import *
+from index.structure import TermOccurrence
+from util.performance import CheckPerformance
+from random import randrange, seed
+import unittest
+
+
+class CompressionTest(unittest.TestCase):
+    def test_varints(self):
+        lst_values = [0, 1, 127, 128, 300, 16383, 16384, 2 ** 21, 2 ** 32 - 1]
+        buffer = bytearray()
+        encode_varints(lst_values, buffer)
+        self.assertEqual(buffer[:4], bytearray([0, 1, 127, 0x80]))
+        values, pos = decode_varints(buffer, len(lst_values))
+        self.assertListEqual(list(values), lst_values)
+        self.assertEqual(pos, len(buffer))
+
+    def test_postings_round_trip(self):
+        doc_ids = [0, 3, 4, 130, 100102, 4000000000]
+        term_freqs = [1, 2, 200, 1, 70000, 3]
+        encoded = encode_postings(doc_ids, term_freqs)
+        decoded_doc_ids, decoded_term_freqs = decode_postings(encoded, len(doc_ids))
+        self.assertListEqual(list(decoded_doc_ids), doc_ids)
+        self.assertListEqual(list(decoded_term_freqs), term_freqs)
+
+        self.assertEqual(encode_postings([], []), b"")
+        decoded_doc_ids, decoded_term_freqs = decode_postings(b"", 0)
+        self.assertEqual(len(decoded_doc_ids), 0)
+
+    def test_throughput(self):
+        # lista com gaps e frequências pequenos, como a de um termo frequente
+        seed(10)
+        num_postings = 200000
+        doc_ids = []
+        doc_id = 0
+        for i in range(num_postings):
+            doc_id += randrange(1, 50)
+            doc_ids.append(doc_id)
+        term_freqs = [randrange(1, 10) for i in range(num_postings)]
+
+        perfomance = CheckPerformance()
+        encoded = encode_postings(doc_ids, term_freqs)
+        time_encode = perfomance.elapsed_seconds()
+        perfomance = CheckPerformance()
+        decoded_doc_ids, decoded_term_freqs = decode_postings(encoded, num_postings)
+        time_decode = perfomance.elapsed_seconds()
+        self.assertListEqual(list(decoded_doc_ids), doc_ids)
+        self.assertListEqual(list(decoded_term_freqs), term_freqs)
+
+        raw_size = num_postings * TermOccurrence.STRUCT.size
+        print(
+            f"varint: {len(encoded)} bytes ({len(encoded) / num_postings:.2f} bytes/ocorrência), "
+            f"formato de 12 bytes: {raw_size} bytes"
+        )
+        print(
+            f"codificação: {num_postings / time_encode:.0f} ocorrências/s, "
+            f"decodificação: {num_postings / time_decode:.0f} ocorrências/s"
+        )
+        self.assertLess(len(encoded), raw_size / 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,11 +1,15 @@
 from .structure import *
 import unittest
-from .index_structure_test import StructureTest
+from .index_structure_test import StructureTest, use_temporary_dir
 from .performance_test import PerformanceTest
 
 
 class FileIndexTest(unittest.TestCase):
-    def check_idx_file(self, obj_index, set_occurrences):
+    def setUp(self):
+        # term_test, teste_file.idx e os arquivos de ocorrências são gravados no diretório temporário
+        use_temporary_dir(self)
+
+    def check_idx_file(self, obj_index, set_occurrences, str_file_name=None):
         # verifica a ordem das ocorrencias
         list_size = (
             obj_index.idx_tmp_occur_last_element
@@ -17,11 +21,11 @@ class FileIndexTest(unittest.TestCase):
             0,
             "A lista de ocorrencias deve ser zerada após chamar o método save_tmp_occurrences",
         )
+        if str_file_name is None:
+            str_file_name = f"{obj_index.str_idx_file_name}_{obj_index.idx_file_counter}"
         last_occur = TermOccurrence(float("-inf"), float("-inf"), 10)
         set_file_occurrences = set()
-        with open(
-            f"{obj_index.str_idx_file_name}_{obj_index.idx_file_counter}", "rb"
-        ) as idx_file:
+        with open(str_file_name, "rb") as idx_file:
             occur = obj_index.next_from_file(idx_file)
             while occur is not None:
                 self.assertTrue(
@@ -73,6 +77,33 @@ class FileIndexTest(unittest.TestCase):
                 "Não há 3o elemento, assim, deveria retornar None na terceira leitura",
             )
 
+    def test_pack_unpack_many(self):
+        lst_occurrences = [
+            TermOccurrence(2, 1, 5),
+            TermOccurrence(10, 2, 1),
+            TermOccurrence(100102, 7, 300),
+        ]
+        with open("term_test", "wb") as idx_new_file:
+            for occur in lst_occurrences:
+                occur.write(idx_new_file)
+        with open("term_test", "rb") as file:
+            bytes_written = file.read()
+
+        packed = TermOccurrence.pack_many(lst_occurrences)
+        self.assertEqual(
+            packed,
+            bytes_written,
+            "pack_many deveria gerar o mesmo formato que o método write",
+        )
+
+        lst_unpacked = TermOccurrence.unpack_many(packed + b"\x00\x01")
+        self.assertListEqual(lst_unpacked, lst_occurrences)
+        self.assertListEqual(
+            [occur.term_freq for occur in lst_unpacked],
+            [occur.term_freq for occur in lst_occurrences],
+        )
+        self.assertListEqual(TermOccurrence.unpack_many(b""), [])
+
     def test_next_from_list(self):
         self.index = FileIndex()
         # testa o size
@@ -138,8 +169,10 @@ class FileIndexTest(unittest.TestCase):
         set_occurrences = set(self.index.lst_occurrences_tmp) - {None}
         self.index.idx_tmp_occur_last_element = 3
         self.index.save_tmp_occurrences()
-        self.check_idx_file(self.index, set_occurrences)
-        print("Primeira execução (criação inicial do indice) [ok]")
+        # cada chamada grava uma run ordenada e independente
+        self.check_idx_file(self.index, set_occurrences, self.index.lst_run_files[-1])
+        set_all_occurrences = set_occurrences
+        print("Primeira execução (criação da primeira run) [ok]")
 
         # adicina alguns
         self.index.lst_occurrences_tmp = [
@@ -147,9 +180,10 @@ class FileIndexTest(unittest.TestCase):
             TermOccurrence(2, 3, 4),
         ]
         self.index.idx_tmp_occur_last_element = 1
-        set_occurrences = set_occurrences | set(self.index.lst_occurrences_tmp)
+        set_occurrences = set(self.index.lst_occurrences_tmp)
+        set_all_occurrences = set_all_occurrences | set_occurrences
         self.index.save_tmp_occurrences()
-        self.check_idx_file(self.index, set_occurrences)
+        self.check_idx_file(self.index, set_occurrences, self.index.lst_run_files[-1])
         print("Inserção de alguns itens - teste 1/2 [ok]")
 
         # adiciona mais alguns
@@ -159,12 +193,64 @@ class FileIndexTest(unittest.TestCase):
             TermOccurrence(3, 1, 1),
         ]
         self.index.idx_tmp_occur_last_element = 2
-        # checa ordenação do arquivo e verifica todas as ocorrencias existem
-        set_occurrences = set_occurrences | set(self.index.lst_occurrences_tmp)
+        set_occurrences = set(self.index.lst_occurrences_tmp)
+        set_all_occurrences = set_all_occurrences | set_occurrences
         self.index.save_tmp_occurrences()
-        self.check_idx_file(self.index, set_occurrences)
+        self.check_idx_file(self.index, set_occurrences, self.index.lst_run_files[-1])
         print("Inserção de alguns itens - teste 2/2 [ok]")
 
+        # o merge final combina todas as runs e remove os arquivos intermediários
+        lst_run_files = list(self.index.lst_run_files)
+        self.assertEqual(len(lst_run_files), 3)
+        self.index.merge_runs()
+        self.check_idx_file(self.index, set_all_occurrences)
+        for str_run_file in lst_run_files:
+            self.assertFalse(
+                os.path.exists(str_run_file),
+                f"A run {str_run_file} deveria ter sido removida após o merge",
+            )
+        print("Merge das runs [ok]")
+
+    def test_multiway_merge(self):
+        # com fan-in 4 e 20 runs são necessários 3 passos de merge (20 -> 5 -> 2 -> 1)
+        self.index = FileIndex(tmp_occurrences_limit=9, merge_fan_in=4)
+        hash_index = HashIndex()
+        for doc_id in range(1, 41):
+            for term_id in range(5):
+                term = f"termo{(doc_id * 7 + term_id) % 13}"
+                self.index.index(term, doc_id, term_id + 1)
+                hash_index.index(term, doc_id, term_id + 1)
+        int_occurrences = 40 * 5
+        self.index.finish_indexing()
+
+        self.assertEqual(self.index.merge_passes, 3)
+        # cada ocorrência é gravada uma vez na run e no máximo uma vez por passo de merge
+        int_size = int_occurrences * TermOccurrence.STRUCT.size
+        self.assertLessEqual(
+            self.index.bytes_written, int_size * (1 + self.index.merge_passes)
+        )
+        self.assertGreaterEqual(self.index.bytes_written, int_size * 2)
+        self.assertEqual(
+            os.path.getsize(
+                f"{self.index.str_idx_file_name}_{self.index.idx_file_counter}"
+            ),
+            int_occurrences * TermOccurrence.STRUCT.size,
+        )
+        for run_id in range(self.index.run_counter):
+            self.assertFalse(
+                os.path.exists(f"{self.index.str_idx_file_name}_run_{run_id}"),
+                f"A run {run_id} deveria ter sido removida",
+            )
+        for term in hash_index.vocabulary:
+            self.assertListEqual(
+                self.index.get_occurrence_list(term),
+                sorted(hash_index.get_occurrence_list(term)),
+            )
+            self.assertEqual(
+                self.index.document_count_with_term(term),
+                hash_index.document_count_with_term(term),
+            )
+
     def test_finish_indexing(self):
         self.index = FileIndex()
         self.index.idx_tmp_occur_last_element = 8
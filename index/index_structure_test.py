@@ -1,8 +1,32 @@
 from index.structure import *
 
+from typing import List
+import tempfile
+import os
 import unittest
 
 
+# raiz do repositório, a partir da qual os testes são executados
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def use_temporary_dir(test_case: unittest.TestCase, lst_repo_paths: List[str] = ()):
+    """
+    Executa o teste em um diretório temporário, removido ao final: os arquivos gravados com caminhos
+    relativos (índices, ocorrências de um FileIndex, wiki.idx de finish_indexing) não ficam na raiz do repositório.
+    Os arquivos do repositório usados pelo teste (`lst_repo_paths`, relativos à raiz) continuam acessíveis pelo
+    mesmo caminho relativo, por meio de links simbólicos.
+    """
+    tmp_dir = tempfile.TemporaryDirectory()
+    test_case.addCleanup(tmp_dir.cleanup)
+    test_case.addCleanup(os.chdir, os.getcwd())
+    os.chdir(tmp_dir.name)
+    for str_path in lst_repo_paths:
+        if os.path.dirname(str_path):
+            os.makedirs(os.path.dirname(str_path), exist_ok=True)
+        os.symlink(os.path.join(REPO_DIR, str_path), str_path)
+
+
 class StructureTest(unittest.TestCase):
     def create_terms(self):
         # casa apareceu 10 vezes no doc. 1
@@ -24,6 +48,7 @@ class StructureTest(unittest.TestCase):
         print(self.index)
 
     def setUp(self):
+        use_temporary_dir(self)
         self.index = HashIndex()
         self.create_terms()
 
@@ -109,11 +134,90 @@ class StructureTest(unittest.TestCase):
         self.occur_list_test(self.index)
 
 
+class ShardStructureTest(StructureTest):
+    def setUp(self):
+        use_temporary_dir(self)
+        # dois shards com documentos disjuntos, combinados em ordem
+        shard_1 = HashIndex()
+        shard_1.index("casa", 1, 10)
+        shard_1.index("vermelho", 1, 3)
+        shard_1.index("verde", 1, 1)
+        shard_2 = FileIndex("occur_file_shard")
+        shard_2.index("vermelho", 2, 1)
+        shard_2.index("vermelho", 3, 1)
+        shard_2.index("casa", 2, 3)
+
+        self.index = HashIndex()
+        self.index.add_index(shard_1)
+        self.index.add_index(shard_2)
+        shard_2.remove_index_files()
+        self.index.finish_indexing()
+
+    def test_same_as_serial(self):
+        serial_index = HashIndex()
+        serial_index.index("casa", 1, 10)
+        serial_index.index("vermelho", 1, 3)
+        serial_index.index("verde", 1, 1)
+        serial_index.index("vermelho", 2, 1)
+        serial_index.index("vermelho", 3, 1)
+        serial_index.index("casa", 2, 3)
+
+        self.assertListEqual(self.index.vocabulary, serial_index.vocabulary)
+        self.assertListEqual(list(self.index.documents), list(serial_index.documents))
+        for doc_id in serial_index.documents:
+            self.assertEqual(
+                self.index.documents.length(doc_id), serial_index.documents.length(doc_id)
+            )
+        for term in serial_index.vocabulary:
+            self.assertEqual(self.index.get_term_id(term), serial_index.get_term_id(term))
+            self.assertListEqual(
+                self.index.get_occurrence_list(term),
+                serial_index.get_occurrence_list(term),
+            )
+
+
+class CompactHashStructureTest(StructureTest):
+    def setUp(self):
+        use_temporary_dir(self)
+        self.index = CompactHashIndex()
+        self.create_terms()
+
+    def test_get_postings(self):
+        postings = self.index.get_postings("vermelho")
+        self.assertListEqual(list(postings.doc_ids), [1, 2, 3])
+        self.assertListEqual(list(postings.term_freqs), [3, 1, 1])
+        self.assertEqual(postings.term_id, self.index.get_term_id("vermelho"))
+        self.assertEqual(len(self.index.get_postings("xuxu")), 0)
+
+
 class FileStructureTest(StructureTest):
     def setUp(self):
+        use_temporary_dir(self)
         self.index = FileIndex()
         self.create_terms()
 
 
+class MappedFileStructureTest(StructureTest):
+    def setUp(self):
+        use_temporary_dir(self)
+        self.index = FileIndex()
+        self.create_terms()
+        self.index.open_for_serving()
+
+    def tearDown(self):
+        self.index.close()
+
+    def test_get_postings(self):
+        buffer = self.index.get_postings_buffer("vermelho")
+        self.assertIsInstance(buffer, memoryview)
+        self.assertEqual(len(buffer), 3 * TermOccurrence.STRUCT.size)
+
+        postings = self.index.get_postings("vermelho")
+        self.assertListEqual(list(postings.doc_ids), [1, 2, 3])
+        self.assertListEqual(list(postings.term_freqs), [3, 1, 1])
+        self.assertEqual(len(self.index.get_postings("xuxu")), 0)
+        self.assertEqual(len(self.index.get_postings_buffer("xuxu")), 0)
+
+
 if __name__ == "__main__":
     unittest.main()
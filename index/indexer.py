@@ -1,13 +1,104 @@
 from nltk.stem.snowball import SnowballStemmer
 from bs4 import BeautifulSoup
 import string
+import re
 from nltk.tokenize import word_tokenize
-from collections import Counter
+from collections import Counter, OrderedDict
+from html.parser import HTMLParser
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
+import tempfile
 import os
 from tqdm import tqdm
 
+from index.structure import Index, HashIndex, CompactHashIndex, FileIndex
+from index.segments import file_hash
+from index.storage import DiskIndex, write_index
+
+
+class PlainTextExtractor(HTMLParser):
+    """
+    Extrai o texto de um html à medida que ele é lido (feed), sem construir a árvore do documento.
+    Assim como o get_text do BeautifulSoup, ignora o conteúdo de <script>, <style> e <template>,
+    comentários e declarações.
+    """
+
+    SKIPPED_TAGS = {"script", "style", "template"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.lst_text = []
+        self.int_skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIPPED_TAGS:
+            self.int_skip_depth += 1
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIPPED_TAGS and self.int_skip_depth > 0:
+            self.int_skip_depth -= 1
+
+    def handle_data(self, data):
+        if self.int_skip_depth == 0:
+            self.lst_text.append(data)
+
+    def pop_text(self) -> str:
+        """
+        Retorna o texto extraído desde a última chamada
+        """
+        text = "".join(self.lst_text)
+        self.lst_text.clear()
+        return text
+
+
+class TermCache:
+    """
+    Cache LRU de tamanho limitado, com contadores de acertos (hits) e faltas (misses).
+    Quando cheio, descarta a entrada usada há mais tempo.
+    """
+
+    MISSING = object()
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.dic_cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, compute):
+        """
+        Retorna o valor de `key`, calculando-o com compute(key) caso não esteja no cache
+        """
+        value = self.dic_cache.get(key, TermCache.MISSING)
+        if value is not TermCache.MISSING:
+            self.hits += 1
+            self.dic_cache.move_to_end(key)
+            return value
+        self.misses += 1
+        value = compute(key)
+        if self.max_size > 0:
+            self.dic_cache[key] = value
+            if len(self.dic_cache) > self.max_size:
+                self.dic_cache.popitem(last=False)
+        return value
+
+    def clear(self):
+        self.dic_cache.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self.dic_cache)
+
 
 class Cleaner:
+    TERM_CACHE_SIZE = 100000
+    # tokenizador rápido: números com separadores ou palavras (unicode), incluindo as ligadas por hífen ou apóstrofo.
+    # A pontuação nunca faz parte de um token, portanto não precisa ser filtrada depois
+    WORD_PATTERN = re.compile(r"\d+(?:[.,]\d+)+|\w+(?:[-']\w+)*")
+    # último espaço de um texto (seguido apenas de caracteres que não são espaço)
+    LAST_SPACE_PATTERN = re.compile(r"\s(?=\S*$)")
+
     def __init__(
         self,
         stop_words_file: str,
@@ -15,6 +106,9 @@ class Cleaner:
         perform_stop_words_removal: bool,
         perform_accents_removal: bool,
         perform_stemming: bool,
+        fast_html_extraction: bool = False,
+        term_cache_size: int = None,
+        fast_tokenizer: bool = False,
     ):
         self.set_stop_words = self.read_stop_words(stop_words_file)
 
@@ -22,15 +116,30 @@ class Cleaner:
         in_table = "áéíóúâêôçãẽõü"
         out_table = "aeiouaeocaeou"
         # altere a linha abaixo para remoção de acentos (Atividade 11)
-        self.accents_translation_table = {i: j for i, j in zip(in_table, out_table)}
+        self.accents_translation_table = str.maketrans(in_table, out_table)
         self.set_punctuation = set(string.punctuation)
 
+        # normalização de cada palavra (None para as descartadas), indexada pela palavra original
+        self.term_cache = TermCache(
+            term_cache_size if term_cache_size is not None else Cleaner.TERM_CACHE_SIZE
+        )
+
         # flags
         self.perform_stop_words_removal = perform_stop_words_removal
         self.perform_accents_removal = perform_accents_removal
         self.perform_stemming = perform_stemming
+        # extrai o texto com o PlainTextExtractor em vez do BeautifulSoup
+        self.fast_html_extraction = fast_html_extraction
+        # tokeniza com WORD_PATTERN em vez do word_tokenize do NLTK
+        # (a consulta deve usar a mesma configuração usada na indexação)
+        self.fast_tokenizer = fast_tokenizer
 
     def html_to_plain_text(self, html_doc: str) -> str:
+        if self.fast_html_extraction:
+            extractor = PlainTextExtractor()
+            extractor.feed(html_doc)
+            extractor.close()
+            return extractor.pop_text()
         soup = BeautifulSoup(html_doc, "html.parser")
         return soup.get_text()
 
@@ -54,23 +163,85 @@ class Cleaner:
 
     def remove_accents(self, term: str) -> str:
         if self.perform_accents_removal:
-            for i, j in self.accents_translation_table.items():
-                term = term.replace(i, j)
-            return term
+            return term.translate(self.accents_translation_table)
         else:
             return term
 
-    def preprocess_text(self, text: str) -> str or None:
-        words = list()
-        for word in word_tokenize(text.lower()):
-            if self.is_stop_word(word) or word in self.set_punctuation:
+    def normalize_word(self, word: str) -> str or None:
+        """
+        Retorna o termo correspondente a palavra (já em minúsculas) ou None, caso ela deva ser descartada
+        """
+        if self.is_stop_word(word) or word in self.set_punctuation:
+            return None
+        return (
+            self.word_stem(self.remove_accents(word))
+            if self.perform_stemming
+            else self.remove_accents(word)
+        )
+
+    def iter_plain_text(self, html_chunks):
+        """
+        Gera o texto de um html recebido em pedaços (html_chunks), sem reter o documento inteiro.
+        Com o BeautifulSoup (fast_html_extraction=False) o documento precisa ser montado por completo.
+        """
+        if not self.fast_html_extraction:
+            yield self.html_to_plain_text("".join(html_chunks))
+            return
+        extractor = PlainTextExtractor()
+        for chunk in html_chunks:
+            extractor.feed(chunk)
+            text = extractor.pop_text()
+            if text:
+                yield text
+        extractor.close()
+        text = extractor.pop_text()
+        if text:
+            yield text
+
+    @staticmethod
+    def iter_text_segments(text_chunks):
+        """
+        Reagrupa pedaços de texto em segmentos terminados em espaço, para que nenhuma palavra seja dividida
+        """
+        carry = ""
+        for chunk in text_chunks:
+            text = carry + chunk
+            match = Cleaner.LAST_SPACE_PATTERN.search(text)
+            if match is None:
+                carry = text
                 continue
-            words.append(
-                self.word_stem(self.remove_accents(word))
-                if self.perform_stemming
-                else self.remove_accents(word)
-            )
-        return words
+            yield text[: match.end()]
+            carry = text[match.end() :]
+        if carry:
+            yield carry
+
+    def iter_text_terms(self, text_chunks):
+        """
+        Gera os termos (ver iter_terms) de um texto recebido em pedaços
+        """
+        for segment in self.iter_text_segments(text_chunks):
+            yield from self.iter_terms(segment)
+
+    def tokenize(self, text: str) -> List[str]:
+        if self.fast_tokenizer:
+            return Cleaner.WORD_PATTERN.findall(text)
+        return word_tokenize(text)
+
+    def iter_terms(self, text: str):
+        """
+        Gera os termos do texto em uma única passada: minúsculas, tokenização,
+        remoção de pontuação e stop words e normalização de cada palavra
+        """
+        # como as palavras se repetem muito, a normalização de cada uma é mantida em cache
+        get_term = self.term_cache.get
+        normalize_word = self.normalize_word
+        for word in self.tokenize(text.lower()):
+            term = get_term(word, normalize_word)
+            if term is not None:
+                yield term
+
+    def preprocess_text(self, text: str) -> str or None:
+        return list(self.iter_terms(text))
 
 
 class HTMLIndexer:
@@ -82,27 +253,253 @@ class HTMLIndexer:
         perform_stemming=True,
     )
 
-    def __init__(self, index):
+    # quantidade de caracteres lidos por vez de cada arquivo
+    READ_CHUNK_SIZE = 1 << 16
+
+    def __init__(self, index, num_workers: int = 1, chunk_size: int = 64):
+        """
+        num_workers: quantidade de processos que fazem o preprocessamento dos documentos em index_text_dir
+            (1 para processar tudo no processo atual)
+        chunk_size: quantidade de documentos enviada de uma vez para cada processo
+        """
         self.index = index
+        self.num_workers = num_workers
+        self.chunk_size = chunk_size
 
     def text_word_count(self, plain_text: str):
         dic_word_count = dict(Counter(self.cleaner.preprocess_text(plain_text)))
         return dic_word_count
 
-    def index_text(self, doc_id: int, text_html: str):
-        for term, term_freq in self.text_word_count(
-            self.cleaner.html_to_plain_text(text_html)
-        ).items():
+    def html_word_count(self, text_html: str) -> Dict[str, int]:
+        return self.text_word_count(self.cleaner.html_to_plain_text(text_html))
+
+    def index_word_count(self, doc_id: int, dic_word_count: Dict[str, int]):
+        for term, term_freq in dic_word_count.items():
             self.index.index(term, doc_id, term_freq)
 
-    def index_text_dir(self, path: str):
-        for str_sub_dir in tqdm(os.listdir(path)):
+    def index_text(self, doc_id: int, text_html: str):
+        self.index_word_count(doc_id, self.html_word_count(text_html))
+
+    @staticmethod
+    def document_name(filepath: str) -> str:
+        """
+        Nome original do documento: o nome do arquivo sem a extensão (por exemplo, 100102 de 100/100102.html)
+        """
+        return os.path.splitext(os.path.basename(filepath))[0]
+
+    def register_document(self, doc_id: int, filepath: str):
+        """
+        Registra, na tabela de documentos do índice, o nome e o caminho do documento `doc_id`.
+        Documentos sem nenhum termo não são registrados: não estão em nenhuma lista de ocorrências
+        e, portanto, não entram na contagem de documentos (nem no idf).
+        """
+        if doc_id in self.index.documents:
+            self.index.documents.set_source(doc_id, self.document_name(filepath), filepath)
+
+    # Indexação em fluxo: cada documento passa por geradores encadeados
+    #   leitura (iter_file_chunks) -> texto (Cleaner.iter_plain_text) -> termos (Cleaner.iter_text_terms)
+    #   -> contagem (file_word_count) -> índice (index_word_count)
+    # Cada etapa só produz quando a seguinte pede, e nenhuma retém o documento inteiro
+    # (exceto a extração com o BeautifulSoup).
+
+    @staticmethod
+    def iter_file_chunks(filepath: str, chunk_size: int = None):
+        chunk_size = chunk_size if chunk_size is not None else HTMLIndexer.READ_CHUNK_SIZE
+        with open(filepath, "r") as file:
+            while True:
+                chunk = file.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+    def iter_document_terms(self, filepath: str):
+        return self.cleaner.iter_text_terms(
+            self.cleaner.iter_plain_text(self.iter_file_chunks(filepath))
+        )
+
+    def file_word_count(self, filepath: str) -> Dict[str, int]:
+        return dict(Counter(self.iter_document_terms(filepath)))
+
+    def iter_word_counts(self, documents):
+        for doc_id, filepath in documents:
+            yield doc_id, filepath, self.file_word_count(filepath)
+
+    def index_document(self, doc_id: int, filepath: str):
+        self.index_word_count(doc_id, self.file_word_count(filepath))
+        self.register_document(doc_id, filepath)
+
+    @staticmethod
+    def list_documents(
+        path: str, lst_sub_dirs: List[str] = None, first_doc_id: int = 1
+    ) -> List[Tuple[int, str]]:
+        """
+        Lista os pares (doc_id, caminho) dos arquivos html de cada subdiretório de `path` (ou apenas
+        dos subdiretórios `lst_sub_dirs`), em ordem de subdiretório e de nome de arquivo,
+        para que a indexação seja determinística.
+        Os doc_ids são densos e consecutivos a partir de `first_doc_id` (o 0 não é usado, pois um
+        registro zerado marca o fim de um arquivo do FileIndex); o nome original de cada documento
+        é mantido na tabela de documentos do índice (ver register_document).
+        """
+        lst_documents = []
+        if lst_sub_dirs is None:
+            lst_sub_dirs = os.listdir(path)
+        for str_sub_dir in sorted(lst_sub_dirs):
             path_sub_dir = f"{path}/{str_sub_dir}"
-            for filename in os.listdir(path_sub_dir):
-                idx, format = filename.split(".")
-                if format == "html":
-                    filepath = f"{path_sub_dir}/{filename}"
-                    with open(filepath, "r") as file:
-                        html = file.read()
-                        self.index_text(idx, html)
+            for filename in sorted(os.listdir(path_sub_dir)):
+                if filename.endswith(".html"):
+                    lst_documents.append(
+                        (first_doc_id + len(lst_documents), f"{path_sub_dir}/{filename}")
+                    )
+        return lst_documents
+
+    def index_text_dir(self, path: str):
+        lst_documents = self.list_documents(path)
+        if self.num_workers > 1:
+            # os processos fazem o preprocessamento; a indexação é feita aqui, na ordem de lst_documents
+            with ProcessPoolExecutor(
+                max_workers=self.num_workers,
+                initializer=init_worker,
+                initargs=(self.cleaner,),
+            ) as executor:
+                for doc_id, filepath, dic_word_count in tqdm(
+                    executor.map(
+                        count_document_terms, lst_documents, chunksize=self.chunk_size
+                    ),
+                    total=len(lst_documents),
+                ):
+                    self.index_word_count(doc_id, dic_word_count)
+                    self.register_document(doc_id, filepath)
+        else:
+            for doc_id, filepath, dic_word_count in tqdm(
+                self.iter_word_counts(lst_documents), total=len(lst_documents)
+            ):
+                self.index_word_count(doc_id, dic_word_count)
+                self.register_document(doc_id, filepath)
         self.index.finish_indexing()
+
+    def index_text_dir_sharded(
+        self, path: str, num_shards: int = None, shard_index_class=HashIndex
+    ):
+        """
+        Indexa `path` dividindo seus documentos (em ordem) em `num_shards` partes consecutivas.
+        Cada parte é indexada por um processo em um índice próprio (um shard do tipo `shard_index_class`),
+        que também o finaliza e o grava no formato em disco (ver build_shard). Os shards são então
+        combinados, em ordem, em self.index por meio de Index.add_index.
+        O resultado é o mesmo da indexação serial de index_text_dir.
+        """
+        num_shards = num_shards if num_shards is not None else self.num_workers
+        lst_documents = self.list_documents(path)
+        shards_dir = tempfile.TemporaryDirectory(prefix="shards_")
+        lst_shards = [
+            (
+                shard_id,
+                lst_documents[
+                    shard_id
+                    * len(lst_documents)
+                    // num_shards : (shard_id + 1)
+                    * len(lst_documents)
+                    // num_shards
+                ],
+                shard_index_class,
+                shards_dir.name,
+            )
+            for shard_id in range(num_shards)
+        ]
+        with shards_dir, ProcessPoolExecutor(
+            max_workers=min(self.num_workers, num_shards),
+            initializer=init_worker,
+            initargs=(self.cleaner,),
+        ) as executor:
+            for str_shard_file in tqdm(
+                executor.map(build_shard, lst_shards), total=num_shards
+            ):
+                with DiskIndex(str_shard_file) as shard_index:
+                    self.index.add_index(shard_index)
+                os.remove(str_shard_file)
+        self.index.finish_indexing()
+
+    def update_text_dir(self, path: str, segmented_index) -> Tuple[int, int, int]:
+        """
+        Indexação incremental de `path` em `segmented_index` (um SegmentedIndex).
+        Arquivos novos ou alterados (mtime diferente e hash diferente do manifesto) são indexados
+        em um novo segmento delta e arquivos que não existem mais são marcados como removidos.
+        Um arquivo alterado mantém seu doc_id e os novos recebem os próximos doc_ids livres.
+        Retorna as quantidades de arquivos novos, alterados e removidos.
+        """
+        delta_indexer = HTMLIndexer(CompactHashIndex())
+        delta_indexer.cleaner = self.cleaner
+        lst_delta_documents = []
+        set_paths = set()
+        int_new, int_changed = 0, 0
+        for _, filepath in tqdm(self.list_documents(path)):
+            str_path = os.path.relpath(filepath, path)
+            set_paths.add(str_path)
+            mtime = os.path.getmtime(filepath)
+            entry = segmented_index.document_entry(str_path)
+            if entry is not None and entry["mtime"] == mtime:
+                continue
+            str_hash = file_hash(filepath)
+            if entry is not None and entry["hash"] == str_hash:
+                segmented_index.touch_document(str_path, mtime)
+                continue
+            if entry is None:
+                doc_id = segmented_index.new_doc_id()
+                int_new += 1
+            else:
+                doc_id = entry["doc_id"]
+                int_changed += 1
+            delta_indexer.index_document(doc_id, filepath)
+            lst_delta_documents.append((str_path, doc_id, mtime, str_hash))
+
+        lst_removed = [
+            str_path
+            for str_path in segmented_index.dic_documents
+            if str_path not in set_paths
+        ]
+        for str_path in lst_removed:
+            segmented_index.delete_document(str_path)
+        segmented_index.add_segment(delta_indexer.index, lst_delta_documents)
+        return int_new, int_changed, len(lst_removed)
+
+
+# indexador de cada processo de preprocessamento (ver HTMLIndexer.index_text_dir)
+worker_indexer = None
+
+
+def init_worker(cleaner: Cleaner):
+    global worker_indexer
+    worker_indexer = HTMLIndexer(None)
+    worker_indexer.cleaner = cleaner
+
+
+def count_document_terms(document: Tuple[int, str]) -> Tuple[int, str, Dict[str, int]]:
+    doc_id, filepath = document
+    return doc_id, filepath, worker_indexer.file_word_count(filepath)
+
+
+def new_shard_index(shard_index_class, str_occur_file: str) -> Index:
+    if issubclass(shard_index_class, FileIndex):
+        # cada shard precisa de seus próprios arquivos de ocorrências
+        return shard_index_class(str_occur_file)
+    return shard_index_class()
+
+
+def build_shard(shard: Tuple[int, List[Tuple[int, str]], type, str]) -> str:
+    """
+    Indexa os documentos do shard e o grava no formato em disco (ver index.storage), em `str_dir`.
+    Um FileIndex é finalizado aqui (ordenação e intercalação de suas runs), no processo do shard.
+    Retorna o caminho do arquivo gravado, que contém também o registro dos documentos do shard.
+    """
+    shard_id, lst_documents, shard_index_class, str_dir = shard
+    shard_index = new_shard_index(shard_index_class, f"{str_dir}/occur_file_shard_{shard_id}")
+    worker_indexer.index = shard_index
+    for doc_id, filepath in lst_documents:
+        worker_indexer.index_document(doc_id, filepath)
+    if isinstance(shard_index, FileIndex):
+        shard_index.finish_indexing()
+    str_shard_file = f"{str_dir}/shard_{shard_id}.idx"
+    write_index(shard_index, str_shard_file)
+    if isinstance(shard_index, FileIndex):
+        shard_index.remove_index_files()
+    worker_indexer.index = None
+    return str_shard_file
@@ -1,9 +1,20 @@
 from index.indexer import *
 from index.structure import *
+from index.compression import encode_postings
+from index.segments import SegmentedIndex
+from index.index_structure_test import use_temporary_dir, REPO_DIR
+from util.performance import CheckPerformance
+from random import randrange, seed
+import shutil
+import tempfile
+import tracemalloc
 import unittest
 
 
 class IndexerTest(unittest.TestCase):
+    def setUp(self):
+        use_temporary_dir(self, ["index/docs_test", "stopwords.txt"])
+
     def test_indexer(self):
         obj_index = FileIndex()
         html_indexer = HTMLIndexer(obj_index)
@@ -18,10 +29,11 @@ class IndexerTest(unittest.TestCase):
             len(sobra_expected) == 0 and len(sobra_vocab) == 0,
             f"O Vocabulário indexado não é o esperado!\nVocabulario indexado: {set_vocab}\nVocabulário esperado: {set_expected_vocab}",
         )
+        # doc_ids densos, na ordem de list_documents: 100/100102, 100/100110 e 111/111
         lst_occur = obj_index.get_occurrence_list("cas")
         dic_expected = {
-            111: TermOccurrence(111, 2, 1),
-            100102: TermOccurrence(100102, 2, 2),
+            3: TermOccurrence(3, 2, 1),
+            1: TermOccurrence(1, 2, 2),
         }
         for occur in lst_occur:
             self.assertTrue(
@@ -37,8 +49,357 @@ class IndexerTest(unittest.TestCase):
                 f"A frequencia do termo 'cas' no documento {occur.doc_id} deveria ser {occur.term_freq}",
             )
 
+    def test_document_table(self):
+        obj_index = HashIndex()
+        HTMLIndexer(obj_index).index_text_dir("index/docs_test")
+        self.assertListEqual(list(obj_index.documents), [1, 2, 3])
+        self.assertListEqual(
+            [obj_index.documents.name(doc_id) for doc_id in obj_index.documents],
+            ["100102", "100110", "111"],
+        )
+        self.assertEqual(obj_index.documents.path(3), "index/docs_test/111/111.html")
+        self.assertEqual(obj_index.documents.doc_id_by_name("100110"), 2)
+        self.assertIsNone(obj_index.documents.doc_id_by_name("999"))
+
+        # a tabela de documentos é persistida no formato em disco
+        with tempfile.TemporaryDirectory() as str_dir:
+            obj_index.write(f"{str_dir}/teste.idx")
+            with Index.read(f"{str_dir}/teste.idx") as disk_index:
+                self.assertListEqual(disk_index.documents.lst_names, obj_index.documents.lst_names)
+                self.assertListEqual(disk_index.documents.lst_paths, obj_index.documents.lst_paths)
+                for doc_id in obj_index.documents:
+                    self.assertEqual(
+                        disk_index.documents.length(doc_id), obj_index.documents.length(doc_id)
+                    )
+
+    def test_empty_document(self):
+        # um documento sem termos não entra na contagem de documentos (usada no idf)
+        with tempfile.TemporaryDirectory() as str_dir:
+            str_docs = f"{str_dir}/docs"
+            shutil.copytree("index/docs_test", str_docs)
+            with open(f"{str_docs}/111/112.html", "w") as file:
+                file.write("<html><body></body></html>")
+            obj_index = HashIndex()
+            HTMLIndexer(obj_index).index_text_dir(str_docs)
+        self.assertListEqual(list(obj_index.documents), [1, 2, 3])
+        self.assertEqual(obj_index.document_count, 3)
+        self.assertEqual(obj_index.get_document_stats().doc_count, 3)
+        self.assertIsNone(obj_index.documents.doc_id_by_name("112"))
+
+    def test_parallel_indexer(self):
+        serial_index = HashIndex()
+        HTMLIndexer(serial_index).index_text_dir("index/docs_test")
+        parallel_index = HashIndex()
+        HTMLIndexer(parallel_index, num_workers=2, chunk_size=1).index_text_dir(
+            "index/docs_test"
+        )
+
+        self.assertListEqual(parallel_index.vocabulary, serial_index.vocabulary)
+        self.assertListEqual(list(parallel_index.documents), list(serial_index.documents))
+        for term in serial_index.vocabulary:
+            self.assertEqual(
+                parallel_index.get_term_id(term), serial_index.get_term_id(term)
+            )
+            lst_serial = serial_index.get_occurrence_list(term)
+            lst_parallel = parallel_index.get_occurrence_list(term)
+            self.assertListEqual(lst_parallel, lst_serial)
+            self.assertListEqual(
+                [occur.term_freq for occur in lst_parallel],
+                [occur.term_freq for occur in lst_serial],
+            )
+
+    def test_sharded_indexer(self):
+        serial_index = HashIndex()
+        HTMLIndexer(serial_index).index_text_dir("index/docs_test")
+        for shard_index_class in [HashIndex, FileIndex]:
+            sharded_index = HashIndex()
+            HTMLIndexer(sharded_index, num_workers=2).index_text_dir_sharded(
+                "index/docs_test", shard_index_class=shard_index_class
+            )
+            self.assertEqual(sharded_index.document_count, serial_index.document_count)
+            self.assertListEqual(sharded_index.vocabulary, serial_index.vocabulary)
+            for term in serial_index.vocabulary:
+                self.assertListEqual(
+                    sharded_index.get_occurrence_list(term),
+                    serial_index.get_occurrence_list(term),
+                )
+                self.assertListEqual(
+                    [occur.term_freq for occur in sharded_index.get_occurrence_list(term)],
+                    [occur.term_freq for occur in serial_index.get_occurrence_list(term)],
+                )
+
+    def test_parallel_throughput(self):
+        # coleção sintética: 8 subdiretórios com 50 documentos cada
+        seed(10)
+        lst_words = ["casa", "verde", "prédio", "amarelo", "cidade", "rio", "estado"]
+        with tempfile.TemporaryDirectory() as str_dir:
+            for sub_dir in range(8):
+                os.mkdir(f"{str_dir}/{sub_dir}")
+                for doc in range(50):
+                    text = " ".join(
+                        lst_words[randrange(0, len(lst_words))] for i in range(2000)
+                    )
+                    with open(f"{str_dir}/{sub_dir}/{sub_dir * 100 + doc}.html", "w") as file:
+                        file.write(f"<html><body><p>{text}</p></body></html>")
+
+            for num_workers in [1, 2, 4]:
+                obj_index = HashIndex()
+                perfomance = CheckPerformance()
+                HTMLIndexer(obj_index, num_workers=num_workers).index_text_dir(str_dir)
+                elapsed = perfomance.elapsed_seconds()
+                self.assertEqual(obj_index.document_count, 400)
+                print(
+                    f"{num_workers} processo(s): {obj_index.document_count / elapsed:.1f} documentos/s"
+                )
+
+    def test_fast_html_extraction(self):
+        cleaner = Cleaner(
+            stop_words_file="./stopwords.txt",
+            language="portuguese",
+            perform_stop_words_removal=True,
+            perform_accents_removal=True,
+            perform_stemming=True,
+        )
+        fast_cleaner = Cleaner(
+            stop_words_file="./stopwords.txt",
+            language="portuguese",
+            perform_stop_words_removal=True,
+            perform_accents_removal=True,
+            perform_stemming=True,
+            fast_html_extraction=True,
+        )
+        lst_html = [
+            "<html><head><style>p {color: red}</style><script>var casa = 1;</script></head>"
+            "<body><!-- comentário --><p>Ser &amp; n&atilde;o ser</p><br/>verde</body></html>"
+        ]
+        for doc_id, filepath in HTMLIndexer.list_documents("index/docs_test"):
+            with open(filepath, "r") as file:
+                lst_html.append(file.read())
+
+        time_soup = 0
+        time_fast = 0
+        for html in lst_html:
+            perfomance = CheckPerformance()
+            text_soup = cleaner.html_to_plain_text(html)
+            time_soup += perfomance.elapsed_seconds()
+            perfomance = CheckPerformance()
+            text_fast = fast_cleaner.html_to_plain_text(html)
+            time_fast += perfomance.elapsed_seconds()
+            self.assertEqual(
+                " ".join(text_fast.split()),
+                " ".join(text_soup.split()),
+                "O texto extraído deveria ser o mesmo do BeautifulSoup",
+            )
+        print(
+            f"BeautifulSoup: {1000 * time_soup / len(lst_html):.3f} ms/documento, "
+            f"PlainTextExtractor: {1000 * time_fast / len(lst_html):.3f} ms/documento"
+        )
+
+    def test_term_cache(self):
+        cache = TermCache(2)
+        self.assertEqual(cache.get("a", str.upper), "A")
+        self.assertEqual(cache.get("b", str.upper), "B")
+        self.assertEqual(cache.get("a", str.upper), "A")
+        # "b" é o usado há mais tempo e deve ser descartado
+        self.assertEqual(cache.get("c", str.upper), "C")
+        self.assertEqual(len(cache), 2)
+        self.assertNotIn("b", cache.dic_cache)
+        self.assertEqual((cache.hits, cache.misses), (1, 3))
+
+    def test_cached_preprocess_text(self):
+        text = "A casa verde é a casa do João. A CASA, não; o prédio é amarelo!"
+        cleaner = Cleaner(
+            stop_words_file="./stopwords.txt",
+            language="portuguese",
+            perform_stop_words_removal=True,
+            perform_accents_removal=True,
+            perform_stemming=True,
+        )
+        uncached_cleaner = Cleaner(
+            stop_words_file="./stopwords.txt",
+            language="portuguese",
+            perform_stop_words_removal=True,
+            perform_accents_removal=True,
+            perform_stemming=True,
+            term_cache_size=0,
+        )
+        lst_terms = cleaner.preprocess_text(text)
+        self.assertListEqual(lst_terms, uncached_cleaner.preprocess_text(text))
+        self.assertListEqual(lst_terms, cleaner.preprocess_text(text))
+        # a segunda chamada só encontra palavras já normalizadas
+        self.assertEqual(cleaner.term_cache.misses, len(cleaner.term_cache))
+        self.assertGreater(cleaner.term_cache.hits, cleaner.term_cache.misses)
+        self.assertEqual(len(uncached_cleaner.term_cache), 0)
+        self.assertEqual(cleaner.remove_accents("ação ênfase"), "acao enfase")
+
+    def test_fast_tokenizer_parity(self):
+        dic_params = dict(
+            stop_words_file="./stopwords.txt",
+            language="portuguese",
+            perform_stop_words_removal=True,
+            perform_accents_removal=True,
+            perform_stemming=True,
+        )
+        cleaner = Cleaner(**dic_params)
+        fast_cleaner = Cleaner(**dic_params, fast_tokenizer=True)
+        lst_texts = [
+            "O guarda-chuva custou R$ 1.000,50 em São Paulo... (segundo \"ele\") -- d'água!"
+        ]
+        for doc_id, filepath in HTMLIndexer.list_documents("index/docs_test"):
+            with open(filepath, "r") as file:
+                lst_texts.append(cleaner.html_to_plain_text(file.read()))
+
+        # relatório de paridade: termos gerados por apenas um dos tokenizadores
+        int_total = 0
+        int_equal = 0
+        for text in lst_texts:
+            counter_nltk = Counter(cleaner.preprocess_text(text))
+            counter_fast = Counter(fast_cleaner.preprocess_text(text))
+            int_total += sum((counter_nltk | counter_fast).values())
+            int_equal += sum((counter_nltk & counter_fast).values())
+            if counter_nltk != counter_fast:
+                print(
+                    f"Somente NLTK: {dict(counter_nltk - counter_fast)} Somente regex: {dict(counter_fast - counter_nltk)}"
+                )
+        print(f"Paridade de termos com o NLTK: {int_equal}/{int_total}")
+
+        # na coleção de teste os termos devem ser os mesmos
+        for text in lst_texts[1:]:
+            self.assertListEqual(
+                fast_cleaner.preprocess_text(text), cleaner.preprocess_text(text)
+            )
+
+    def test_text_segments(self):
+        lst_chunks = ["A ca", "sa é ve", "rde", ", não é?\ncasa", "!"]
+        lst_segments = list(Cleaner.iter_text_segments(lst_chunks))
+        self.assertEqual("".join(lst_segments), "".join(lst_chunks))
+        self.assertListEqual(lst_segments, ["A ", "casa é ", "verde, não é?\n", "casa!"])
+
+    def test_streaming_peak_memory(self):
+        cleaner = Cleaner(
+            stop_words_file="./stopwords.txt",
+            language="portuguese",
+            perform_stop_words_removal=True,
+            perform_accents_removal=True,
+            perform_stemming=True,
+            fast_html_extraction=True,
+            fast_tokenizer=True,
+        )
+        seed(10)
+        lst_words = ["casa", "verde", "prédio", "amarelo", "cidade", "rio", "estado"]
+        with tempfile.TemporaryDirectory() as str_dir:
+            filepath = f"{str_dir}/1.html"
+            with open(filepath, "w") as file:
+                file.write("<html><body>")
+                for i in range(2000):
+                    text = " ".join(
+                        lst_words[randrange(0, len(lst_words))] for j in range(500)
+                    )
+                    file.write(f"<p>{text} &amp; <b>{i}</b></p>\n")
+                file.write("</body></html>")
+            file_size = os.path.getsize(filepath)
+
+            html_indexer = HTMLIndexer(HashIndex())
+            html_indexer.cleaner = cleaner
+            tracemalloc.start()
+            html_indexer.index_document(1, filepath)
+            _, peak_streaming = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            streaming_index = html_indexer.index
+            html_indexer.index = HashIndex()
+            tracemalloc.start()
+            with open(filepath, "r") as file:
+                html_indexer.index_text(1, file.read())
+            _, peak_full = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+        print(
+            f"Arquivo de {file_size / 2 ** 20:.1f} MiB - pico de memória em fluxo: {peak_streaming / 2 ** 20:.2f} MiB, "
+            f"com o documento inteiro: {peak_full / 2 ** 20:.2f} MiB"
+        )
+        self.assertLess(peak_streaming, file_size / 2)
+        self.assertLess(peak_streaming * 10, peak_full)
+        self.assertCountEqual(streaming_index.vocabulary, html_indexer.index.vocabulary)
+        for term in streaming_index.vocabulary:
+            self.assertListEqual(
+                [occur.term_freq for occur in streaming_index.get_occurrence_list(term)],
+                [occur.term_freq for occur in html_indexer.index.get_occurrence_list(term)],
+            )
+
+    def test_update_text_dir(self):
+        with tempfile.TemporaryDirectory() as str_dir:
+            str_docs = f"{str_dir}/docs"
+            shutil.copytree("index/docs_test", str_docs)
+            html_indexer = HTMLIndexer(None)
+            segmented_index = SegmentedIndex(f"{str_dir}/segments")
+            self.assertTupleEqual(
+                html_indexer.update_text_dir(str_docs, segmented_index), (3, 0, 0)
+            )
+            # sem alterações, nenhum segmento é criado
+            self.assertTupleEqual(
+                html_indexer.update_text_dir(str_docs, segmented_index), (0, 0, 0)
+            )
+            self.assertEqual(segmented_index.segment_count, 1)
+
+            # mtime alterado com o mesmo conteúdo
+            os.utime(f"{str_docs}/111/111.html", (0, 0))
+            with open(f"{str_docs}/100/100110.html", "a") as file:
+                file.write("<p>Casa azul</p>")
+            os.remove(f"{str_docs}/100/100102.html")
+            self.assertTupleEqual(
+                html_indexer.update_text_dir(str_docs, segmented_index), (0, 1, 1)
+            )
+            self.assertEqual(segmented_index.segment_count, 2)
+
+            # o resultado deve ser o mesmo da reindexação completa, antes e depois da compactação
+            full_index = HashIndex()
+            full_indexer = HTMLIndexer(full_index)
+            for doc_id, filepath in HTMLIndexer.list_documents(str_docs):
+                full_indexer.index_document(doc_id, filepath)
+            self.check_same_postings(segmented_index, full_index)
+            # um arquivo alterado mantém seu doc_id
+            self.assertEqual(segmented_index.documents.doc_id_by_name("100110"), 2)
+            segmented_index.compact()
+            self.assertEqual(segmented_index.segment_count, 1)
+            self.check_same_postings(segmented_index, full_index)
+            segmented_index.close()
+
+    def check_same_postings(self, segmented_index, full_index):
+        # os doc_ids podem ser diferentes: os documentos são comparados pelo nome
+        self.assertEqual(segmented_index.document_count, full_index.document_count)
+        for term in full_index.vocabulary:
+            self.assertCountEqual(
+                [
+                    (segmented_index.documents.name(occur.doc_id), occur.term_freq)
+                    for occur in segmented_index.get_occurrence_list(term)
+                ],
+                [
+                    (full_index.documents.name(occur.doc_id), occur.term_freq)
+                    for occur in full_index.get_occurrence_list(term)
+                ],
+            )
+
+    def test_compressed_postings_size(self):
+        obj_index = FileIndex()
+        html_indexer = HTMLIndexer(obj_index)
+        html_indexer.index_text_dir("index/docs_test")
+
+        raw_size = path.getsize(
+            f"{obj_index.str_idx_file_name}_{obj_index.idx_file_counter}"
+        )
+        compressed_size = sum(
+            len(encode_postings(postings.doc_ids, postings.term_freqs))
+            for _, postings in obj_index.iter_postings()
+        )
+        print(
+            f"index/docs_test: {raw_size} bytes no formato de 12 bytes, {compressed_size} bytes em varint"
+        )
+        self.assertLess(compressed_size, raw_size)
+
     def test_wiki_idx(self):
-        wiki_idx = Index.read("wiki.idx")
+        # índice da coleção completa, gravado na raiz do repositório por index/wikipedia_indexer.py
+        wiki_idx = Index.read(os.path.join(REPO_DIR, "wiki.idx"))
 
         self.assertTrue(wiki_idx.document_count > 60000)
         self.assertEqual(len(wiki_idx.get_occurrence_list("casa")), 4632)
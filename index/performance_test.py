@@ -1,5 +1,6 @@
 from IPython.display import clear_output
 from index.structure import *
+from index.index_structure_test import use_temporary_dir
 
 from datetime import datetime
 import math
@@ -7,7 +8,7 @@ import tracemalloc
 import unittest
 from random import randrange, seed
 
-from util.performance import CheckPerformance
+from util.performance import CheckPerformance, CHECK_TIMINGS
 
 
 class PerformanceTest(unittest.TestCase):
@@ -15,9 +16,13 @@ class PerformanceTest(unittest.TestCase):
     NUM_TERM_PER_DOC = 500
 
     def setUp(self):
-        self.index = HashIndex()
+        use_temporary_dir(self)
+        self.index = self.new_index()
         self.perfomance = CheckPerformance()
 
+    def new_index(self):
+        return HashIndex()
+
     def create_vocabulary(self):
         vocabulary = []
         for i in range(65, 91):
@@ -48,15 +53,172 @@ class PerformanceTest(unittest.TestCase):
 
         self.vocabulary = self.create_vocabulary()
 
+        tracemalloc.start()
         total = self.index_words()
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(
+            f"{type(self.index).__name__}: {total} ocorrências indexadas, pico de memória: {peak_memory / 2 ** 20:.1f} MiB"
+        )
+
+    def test_linear_growth(self):
+        # o tempo por ocorrência não pode crescer com o número de documentos indexados
+        self.vocabulary = self.create_vocabulary()
+        num_term_per_doc = 50
+        arr_num_docs = [500, 1000, 2000, 4000]
+        arr_time_per_occur = []
+        seed(10)
+        for num_docs in arr_num_docs:
+            self.index = self.new_index()
+            self.perfomance = CheckPerformance()
+            for doc_i in range(num_docs):
+                for term_j in range(num_term_per_doc):
+                    str_term = self.vocabulary[randrange(0, len(self.vocabulary))]
+                    self.index.index(str_term, doc_i, (term_j % 10) + 1)
+            total = num_docs * num_term_per_doc
+            time_per_occur = self.perfomance.elapsed_seconds() / total
+            arr_time_per_occur.append(time_per_occur)
+            self.assertEqual(self.index.document_count, num_docs)
+            print(
+                f"{type(self.index).__name__} NUM_DOCS={num_docs}: {total} ocorrências, {time_per_occur * 1e6:.2f} µs/ocorrência"
+            )
+        if CHECK_TIMINGS:
+            self.assertLess(
+                arr_time_per_occur[-1],
+                3 * arr_time_per_occur[0],
+                f"A indexação não está linear no número de documentos: {arr_time_per_occur}",
+            )
 
 
 import time
 
 
-class FilePerformanceTest(PerformanceTest):
+class FileReaderPerformanceTest(unittest.TestCase):
+    NUM_OCCURRENCES = 300000
+
     def setUp(self):
+        use_temporary_dir(self)
         self.index = FileIndex()
+        self.str_file_name = "occur_file_reader_test"
+        seed(10)
+        lst_occurrences = [
+            TermOccurrence(doc_id, randrange(1, 1000), randrange(1, 10))
+            for doc_id in range(1, FileReaderPerformanceTest.NUM_OCCURRENCES + 1)
+        ]
+        with open(self.str_file_name, "wb") as file:
+            file.write(TermOccurrence.pack_many(lst_occurrences))
+
+    def tearDown(self):
+        os.remove(self.str_file_name)
+
+    def read_with_next_from_file(self) -> int:
+        count = 0
+        with open(self.str_file_name, "rb") as file:
+            occur = self.index.next_from_file(file)
+            while occur is not None:
+                count += 1
+                occur = self.index.next_from_file(file)
+        return count
+
+    def read_with_block_reader(self, block_size: int) -> int:
+        count = 0
+        with open(self.str_file_name, "rb") as file:
+            for occur in OccurrenceBlockReader(file, block_size):
+                count += 1
+        return count
+
+    def test_block_reader_performance(self):
+        total = FileReaderPerformanceTest.NUM_OCCURRENCES
+        perfomance = CheckPerformance()
+        self.assertEqual(self.read_with_next_from_file(), total)
+        time_next_from_file = perfomance.elapsed_seconds()
+        print(f"next_from_file: {total / time_next_from_file:.0f} registros/s")
+
+        for block_size in [1 << 12, 1 << 16, 1 << 20]:
+            perfomance = CheckPerformance()
+            self.assertEqual(self.read_with_block_reader(block_size), total)
+            time_block_reader = perfomance.elapsed_seconds()
+            print(
+                f"OccurrenceBlockReader (bloco de {block_size} bytes): {total / time_block_reader:.0f} registros/s"
+            )
+            if CHECK_TIMINGS:
+                self.assertLess(time_block_reader, time_next_from_file)
+
+
+class DocumentNormPerformanceTest(unittest.TestCase):
+    NUM_DOCS = 50000
+    NUM_POSTINGS = 1000000
+
+    def setUp(self):
+        # índice sintético com NUM_POSTINGS ocorrências, criado diretamente em arrays
+        seed(10)
+        self.index = CompactHashIndex()
+        total = 0
+        while total < DocumentNormPerformanceTest.NUM_POSTINGS:
+            doc_ids = array(
+                "I",
+                sorted(
+                    set(
+                        randrange(1, DocumentNormPerformanceTest.NUM_DOCS + 1)
+                        for i in range(randrange(1, 2000))
+                    )
+                ),
+            )
+            term_freqs = array("I", (randrange(1, 20) for doc_id in doc_ids))
+            int_term_id = len(self.index.dic_index) + 1
+            self.index.dic_index[f"t{int_term_id}"] = Postings(
+                int_term_id, doc_ids, term_freqs
+            )
+            for doc_id, term_freq in zip(doc_ids, term_freqs):
+                self.index.documents.add(doc_id, term_freq)
+            total += len(doc_ids)
+        self.total = total
+
+    def norms_per_occurrence(self):
+        # cálculo anterior: tf e idf calculados a cada ocorrência e acumulados em um dicionário
+        from index.statistics import tf_weight, idf_weight
+
+        document_norm = {}
+        doc_count = self.index.document_count
+        for term in self.index.vocabulary:
+            postings = self.index.get_postings(term)
+            for doc_id, term_freq in zip(postings.doc_ids, postings.term_freqs):
+                tfxidf = (tf_weight(term_freq) * idf_weight(doc_count, len(postings))) ** 2
+                document_norm[doc_id] = (
+                    document_norm[doc_id] + tfxidf if doc_id in document_norm else tfxidf
+                )
+        for doc_id in document_norm:
+            document_norm[doc_id] = document_norm[doc_id] ** 0.5
+        return document_norm
+
+    def test_norm_performance(self):
+        from index.statistics import DocumentStats
+
+        perfomance = CheckPerformance()
+        document_norm = self.norms_per_occurrence()
+        time_per_occurrence = perfomance.elapsed_seconds()
+
+        perfomance = CheckPerformance()
+        document_stats = DocumentStats.from_index(self.index)
+        time_stats = perfomance.elapsed_seconds()
+        print(
+            f"Normas de {self.total} ocorrências: {time_per_occurrence:.2f}s por ocorrência, "
+            f"{time_stats:.2f}s com DocumentStats"
+        )
+        for doc_id, norm in document_norm.items():
+            self.assertAlmostEqual(document_stats.norms[doc_id], norm, places=6)
+        if CHECK_TIMINGS:
+            self.assertLess(time_stats, time_per_occurrence)
+
+
+class CompactHashPerformanceTest(PerformanceTest):
+    def new_index(self):
+        return CompactHashIndex()
+
+
+class FilePerformanceTest(PerformanceTest):
+    def new_index(self):
+        return FileIndex()
 
 
 def test():
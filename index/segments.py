@@ -0,0 +1,327 @@
+"""
+Índice incremental: em vez de reindexar toda a coleção a cada alteração, o índice é formado por
+segmentos imutáveis no formato em disco (ver index.storage), todos em um mesmo diretório:
+
+    manifest.json   segmentos ativos (do mais antigo ao mais recente) e, para cada arquivo indexado,
+                    seu doc_id, mtime, hash e o segmento que contém sua versão atual
+                    (None se a versão atual não possui termos e, portanto, não está em nenhum segmento)
+    segment_N.idx   um segmento: o primeiro é a base e os seguintes são deltas com os documentos
+                    novos ou alterados desde então
+    segment_N.del   bitmap de remoções do segmento (um bit por posição de documento): documentos
+                    removidos ou substituídos por uma versão mais recente em outro segmento
+
+As consultas combinam as ocorrências de todos os segmentos, ignorando os documentos removidos.
+`compact` reescreve os documentos válidos em um único segmento.
+"""
+from typing import Dict, List, Tuple
+from array import array
+import hashlib
+import heapq
+import json
+import os
+
+from index.storage import DiskIndex, write_index
+from index.structure import Index, DocumentRegistry, Postings
+
+MANIFEST_FILE = "manifest.json"
+
+
+def file_hash(filepath: str, chunk_size: int = 1 << 16) -> str:
+    digest = hashlib.sha1()
+    with open(filepath, "rb") as file:
+        while True:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                return digest.hexdigest()
+            digest.update(chunk)
+
+
+class TombstoneBitmap:
+    """
+    Conjunto de posições de documentos removidos de um segmento, um bit por posição
+    """
+
+    def __init__(self, size: int, bits: bytes = None):
+        self.size = size
+        self.bits = bytearray((size + 7) // 8) if bits is None else bytearray(bits)
+        self.count = sum(bin(byte).count("1") for byte in self.bits)
+
+    def add(self, position: int):
+        if position not in self:
+            self.bits[position >> 3] |= 1 << (position & 7)
+            self.count += 1
+
+    def __contains__(self, position: int) -> bool:
+        return bool(self.bits[position >> 3] & (1 << (position & 7)))
+
+    def __len__(self) -> int:
+        return self.count
+
+    def write(self, str_file_name: str):
+        with open(str_file_name, "wb") as file:
+            file.write(self.bits)
+
+    @staticmethod
+    def read(str_file_name: str, size: int) -> "TombstoneBitmap":
+        if not os.path.exists(str_file_name):
+            return TombstoneBitmap(size)
+        with open(str_file_name, "rb") as file:
+            return TombstoneBitmap(size, file.read())
+
+
+class Segment:
+    def __init__(self, str_name: str, str_dir: str):
+        self.str_name = str_name
+        self.index = DiskIndex(f"{str_dir}/{str_name}.idx")
+        self.tombstones = TombstoneBitmap.read(
+            f"{str_dir}/{str_name}.del", len(self.index.documents)
+        )
+
+    def delete(self, doc_id: int):
+        self.tombstones.add(self.index.documents.position(doc_id))
+
+    def is_live(self, doc_id: int) -> bool:
+        return self.index.documents.position(doc_id) not in self.tombstones
+
+    def get_postings(self, term: str) -> Postings:
+        """
+        Ocorrências do termo no segmento (em ordem de doc_id), sem os documentos removidos
+        """
+        postings = self.index.get_postings(term)
+        if not self.tombstones or not len(postings):
+            return postings
+        live_postings = Postings(postings.term_id)
+        for doc_id, term_freq in zip(postings.doc_ids, postings.term_freqs):
+            if self.is_live(doc_id):
+                live_postings.append(doc_id, term_freq)
+        return live_postings
+
+    def close(self):
+        self.index.close()
+
+
+class SegmentedIndex(Index):
+    """
+    Índice somente leitura formado pelos segmentos do diretório `str_dir` (ver o início do módulo).
+    Os termos recebem term_ids na ordem em que aparecem nos segmentos, do mais antigo ao mais recente.
+    Novos segmentos são criados por `add_segment` (ver HTMLIndexer.update_text_dir).
+    """
+
+    def __init__(self, str_dir: str):
+        super().__init__()
+        self.str_dir = str_dir
+        self.lst_segments = []
+        # caminho do arquivo -> {"doc_id", "mtime", "hash", "segment"}
+        self.dic_documents = {}
+        self.segment_counter = 0
+        # próximo doc_id livre (os doc_ids são densos e não são reutilizados)
+        self.next_doc_id = 1
+
+        os.makedirs(str_dir, exist_ok=True)
+        str_manifest = f"{str_dir}/{MANIFEST_FILE}"
+        if os.path.exists(str_manifest):
+            with open(str_manifest, "r") as file:
+                dic_manifest = json.load(file)
+            self.segment_counter = dic_manifest["segment_counter"]
+            self.next_doc_id = dic_manifest["next_doc_id"]
+            self.dic_documents = dic_manifest["documents"]
+            self.lst_segments = [
+                Segment(str_name, str_dir) for str_name in dic_manifest["segments"]
+            ]
+        self.refresh()
+
+    @staticmethod
+    def is_segmented_index(str_dir: str) -> bool:
+        return os.path.exists(f"{str_dir}/{MANIFEST_FILE}")
+
+    def refresh(self):
+        """
+        Recalcula o vocabulário e o registro dos documentos válidos a partir dos segmentos
+        """
+        self.dic_index = {}
+        # calculadas sob demanda (ver Index.get_document_stats)
+        self.document_stats = None
+        lst_doc_ids, arr_term_count, arr_length = [], array("I"), array("I")
+        lst_names, lst_paths = [], []
+        for segment in self.lst_segments:
+            for term in sorted(segment.index.dic_index, key=segment.index.get_term_id):
+                if term not in self.dic_index:
+                    self.dic_index[term] = len(self.dic_index) + 1
+            registry = segment.index.documents
+            for position, doc_id in enumerate(registry.lst_doc_ids):
+                if position not in segment.tombstones:
+                    lst_doc_ids.append(doc_id)
+                    arr_term_count.append(registry.arr_term_count[position])
+                    arr_length.append(registry.arr_length[position])
+                    lst_names.append(registry.lst_names[position])
+                    lst_paths.append(registry.lst_paths[position])
+        self.documents = DocumentRegistry.from_arrays(
+            lst_doc_ids, arr_term_count, arr_length, lst_names, lst_paths
+        )
+
+    def new_segment_name(self) -> str:
+        str_name = f"segment_{self.segment_counter}"
+        self.segment_counter += 1
+        return str_name
+
+    def segment_file(self, str_name: str, str_extension: str) -> str:
+        return f"{self.str_dir}/{str_name}.{str_extension}"
+
+    def get_segment(self, str_name: str) -> Segment:
+        for segment in self.lst_segments:
+            if segment.str_name == str_name:
+                return segment
+        raise KeyError(str_name)
+
+    def new_doc_id(self) -> int:
+        doc_id = self.next_doc_id
+        self.next_doc_id += 1
+        return doc_id
+
+    def document_entry(self, str_path: str) -> Dict:
+        return self.dic_documents.get(str_path)
+
+    def touch_document(self, str_path: str, mtime: float):
+        """
+        Atualiza o mtime de um arquivo cujo conteúdo (hash) não mudou
+        """
+        self.dic_documents[str_path]["mtime"] = mtime
+
+    def delete_document(self, str_path: str):
+        entry = self.dic_documents.pop(str_path)
+        if entry["segment"] is not None:
+            self.get_segment(entry["segment"]).delete(entry["doc_id"])
+
+    def add_segment(
+        self, index: Index, lst_documents: List[Tuple[str, int, float, str]]
+    ):
+        """
+        Grava `index` como um novo segmento. `lst_documents` são os arquivos indexados nele,
+        como tuplas (caminho, doc_id, mtime, hash); as versões anteriores desses arquivos são removidas.
+        Todos os arquivos são registrados no manifesto, mesmo os que não possuem termos (que não ficam
+        em nenhum segmento); se nenhum documento possuir termos, o segmento não é gravado.
+        """
+        for str_path, _, _, _ in lst_documents:
+            if str_path in self.dic_documents:
+                self.delete_document(str_path)
+        str_name = None
+        if index.document_count > 0:
+            str_name = self.new_segment_name()
+            write_index(index, self.segment_file(str_name, "idx"))
+            self.lst_segments.append(Segment(str_name, self.str_dir))
+        for str_path, doc_id, mtime, str_hash in lst_documents:
+            self.next_doc_id = max(self.next_doc_id, doc_id + 1)
+            self.dic_documents[str_path] = {
+                "doc_id": doc_id,
+                "mtime": mtime,
+                "hash": str_hash,
+                "segment": str_name if doc_id in index.documents else None,
+            }
+        self.save()
+
+    def save(self):
+        """
+        Grava os bitmaps de remoções e o manifesto (substituído atomicamente)
+        """
+        for segment in self.lst_segments:
+            segment.tombstones.write(self.segment_file(segment.str_name, "del"))
+        str_manifest = f"{self.str_dir}/{MANIFEST_FILE}"
+        with open(f"{str_manifest}.tmp", "w") as file:
+            json.dump(
+                {
+                    "segment_counter": self.segment_counter,
+                    "next_doc_id": self.next_doc_id,
+                    "segments": [segment.str_name for segment in self.lst_segments],
+                    "documents": self.dic_documents,
+                },
+                file,
+            )
+        os.replace(f"{str_manifest}.tmp", str_manifest)
+        self.refresh()
+
+    def compact(self):
+        """
+        Reescreve os documentos válidos de todos os segmentos em um único segmento (a nova base)
+        e remove os segmentos anteriores e seus bitmaps de remoções
+        """
+        if len(self.lst_segments) <= 1 and not any(
+            segment.tombstones for segment in self.lst_segments
+        ):
+            return
+        str_name = self.new_segment_name()
+        write_index(self, self.segment_file(str_name, "idx"))
+        self.close()
+        for segment in self.lst_segments:
+            for str_extension in ("idx", "del"):
+                str_file = self.segment_file(segment.str_name, str_extension)
+                if os.path.exists(str_file):
+                    os.remove(str_file)
+        self.lst_segments = [Segment(str_name, self.str_dir)]
+        for entry in self.dic_documents.values():
+            if entry["segment"] is not None:
+                entry["segment"] = str_name
+        self.save()
+
+    def close(self):
+        for segment in self.lst_segments:
+            segment.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def segment_count(self) -> int:
+        return len(self.lst_segments)
+
+    def get_term_id(self, term: str):
+        return self.dic_index[term]
+
+    def create_index_entry(self, termo_id: int):
+        raise NotImplementedError("SegmentedIndex é somente leitura")
+
+    def add_index_occur(
+        self, entry_dic_index, doc_id: int, term_id: int, freq_termo: int
+    ):
+        raise NotImplementedError("SegmentedIndex é somente leitura")
+
+    def finish_indexing(self):
+        pass
+
+    def get_postings(self, term: str) -> Postings:
+        """
+        Combina, em ordem de doc_id, as ocorrências do termo em cada segmento.
+        Cada documento válido está em um único segmento.
+        """
+        if term not in self.dic_index:
+            return Postings(None)
+        lst_postings = [
+            segment.get_postings(term)
+            for segment in self.lst_segments
+            if term in segment.index.dic_index
+        ]
+        if len(lst_postings) == 1:
+            return Postings(
+                self.dic_index[term], lst_postings[0].doc_ids, lst_postings[0].term_freqs
+            )
+        postings = Postings(self.dic_index[term])
+        for doc_id, term_freq in heapq.merge(
+            *[zip(p.doc_ids, p.term_freqs) for p in lst_postings]
+        ):
+            postings.append(doc_id, term_freq)
+        return postings
+
+    def get_occurrence_list(self, term: str) -> List:
+        return list(self.get_postings(term)) if term in self.dic_index else list()
+
+    def document_count_with_term(self, term: str) -> int:
+        if term not in self.dic_index:
+            return 0
+        return sum(
+            segment.index.document_count_with_term(term)
+            if not segment.tombstones
+            else len(segment.get_postings(term))
+            for segment in self.lst_segments
+        )
@@ -0,0 +1,128 @@
+from index.structure import *
+from index.segments import SegmentedIndex, TombstoneBitmap
+import tempfile
+import unittest
+
+
+class SegmentedIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.str_dir = f"{self.tmp_dir.name}/segments"
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def new_segment(self, dic_docs):
+        index = CompactHashIndex()
+        for doc_id, dic_terms in dic_docs.items():
+            for term, term_freq in dic_terms.items():
+                index.index(term, doc_id, term_freq)
+        return index
+
+    def create_segments(self, segmented_index):
+        segmented_index.add_segment(
+            self.new_segment(
+                {
+                    1: {"casa": 10, "vermelho": 3, "verde": 1},
+                    2: {"vermelho": 1, "casa": 3},
+                    3: {"vermelho": 1, "prédio": 2},
+                }
+            ),
+            [("a/1.html", 1, 1.0, "h1"), ("a/2.html", 2, 1.0, "h2"), ("a/3.html", 3, 1.0, "h3")],
+        )
+        # o documento 2 foi alterado e o 4 é novo
+        segmented_index.add_segment(
+            self.new_segment({4: {"casa": 1, "azul": 2}, 2: {"azul": 5}}),
+            [("b/4.html", 4, 2.0, "h4"), ("a/2.html", 2, 2.0, "h2'")],
+        )
+
+    def check_expected(self, segmented_index):
+        self.assertEqual(segmented_index.document_count, 4)
+        self.assertListEqual(
+            [(occur.doc_id, occur.term_freq) for occur in segmented_index.get_occurrence_list("casa")],
+            [(1, 10), (4, 1)],
+        )
+        self.assertListEqual(
+            [(occur.doc_id, occur.term_freq) for occur in segmented_index.get_occurrence_list("azul")],
+            [(2, 5), (4, 2)],
+        )
+        self.assertEqual(segmented_index.document_count_with_term("vermelho"), 2)
+        self.assertEqual(segmented_index.document_count_with_term("azul"), 2)
+        self.assertEqual(segmented_index.documents.length(2), 5)
+        self.assertListEqual(segmented_index.get_occurrence_list("inexistente"), [])
+
+    def test_tombstone_bitmap(self):
+        tombstones = TombstoneBitmap(20)
+        tombstones.add(3)
+        tombstones.add(17)
+        tombstones.add(3)
+        self.assertEqual(len(tombstones), 2)
+        self.assertIn(17, tombstones)
+        self.assertNotIn(4, tombstones)
+        self.assertEqual(len(TombstoneBitmap(20, tombstones.bits)), 2)
+
+    def test_delta_segments(self):
+        with SegmentedIndex(self.str_dir) as segmented_index:
+            self.create_segments(segmented_index)
+            self.assertEqual(segmented_index.segment_count, 2)
+            self.check_expected(segmented_index)
+            # term_ids dos termos da base são mantidos
+            self.assertEqual(segmented_index.get_term_id("casa"), 1)
+            self.assertEqual(segmented_index.get_term_id("azul"), 5)
+
+        # o manifesto e os bitmaps são persistidos
+        with Index.read(self.str_dir) as segmented_index:
+            self.assertIsInstance(segmented_index, SegmentedIndex)
+            self.check_expected(segmented_index)
+            self.assertEqual(segmented_index.document_entry("a/2.html")["hash"], "h2'")
+
+    def test_delete_document(self):
+        with SegmentedIndex(self.str_dir) as segmented_index:
+            self.create_segments(segmented_index)
+            segmented_index.delete_document("a/1.html")
+            segmented_index.save()
+            self.assertEqual(segmented_index.document_count, 3)
+            self.assertNotIn(1, segmented_index.documents)
+            self.assertListEqual(
+                [occur.doc_id for occur in segmented_index.get_occurrence_list("casa")], [4]
+            )
+            self.assertIsNone(segmented_index.document_entry("a/1.html"))
+
+    def test_empty_delta(self):
+        # o documento 3 foi alterado e não possui mais termos: nenhum segmento é gravado,
+        # mas a versão anterior é removida e o arquivo continua registrado no manifesto
+        with SegmentedIndex(self.str_dir) as segmented_index:
+            self.create_segments(segmented_index)
+            segmented_index.add_segment(CompactHashIndex(), [("a/3.html", 3, 3.0, "h3'")])
+            self.assertEqual(segmented_index.segment_count, 2)
+            self.assertNotIn(3, segmented_index.documents)
+            self.assertIsNone(segmented_index.document_entry("a/3.html")["segment"])
+            self.assertListEqual(
+                [occur.doc_id for occur in segmented_index.get_occurrence_list("prédio")], []
+            )
+        with SegmentedIndex(self.str_dir) as segmented_index:
+            self.assertEqual(segmented_index.document_entry("a/3.html")["hash"], "h3'")
+            self.assertEqual(segmented_index.next_doc_id, 5)
+            segmented_index.compact()
+            self.assertIsNone(segmented_index.document_entry("a/3.html")["segment"])
+            segmented_index.delete_document("a/3.html")
+            segmented_index.save()
+            self.assertIsNone(segmented_index.document_entry("a/3.html"))
+            self.assertEqual(segmented_index.document_count, 3)
+
+    def test_compact(self):
+        with SegmentedIndex(self.str_dir) as segmented_index:
+            self.create_segments(segmented_index)
+            segmented_index.compact()
+            self.assertEqual(segmented_index.segment_count, 1)
+            self.assertFalse(segmented_index.lst_segments[0].tombstones)
+            self.check_expected(segmented_index)
+            self.assertEqual(
+                len(os.listdir(self.str_dir)), 3, "Deveriam restar o manifesto, o segmento e seu bitmap"
+            )
+        with SegmentedIndex(self.str_dir) as segmented_index:
+            self.check_expected(segmented_index)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,179 @@
+"""
+Estatísticas dos documentos calculadas ao final da indexação (ver Index.finish_indexing), para que as
+consultas não precisem percorrer todo o índice ao iniciar:
+
+    norms               norma de cada documento, considerando o peso tf x idf de cada termo,
+                        em um array de floats indexado pelo doc_id
+    collection_length   total de ocorrências de termos da coleção (o tamanho de cada documento
+                        fica na tabela de documentos do índice)
+
+São gravadas ao lado do índice, em `{arquivo do índice}.stats`. Como o arquivo pode ficar
+desatualizado em relação ao índice, ele guarda a quantidade de documentos, de termos e o tamanho
+da coleção do índice que o gerou (ver is_stale).
+"""
+from typing import List
+from array import array
+import math
+import struct
+import os
+
+from index.storage import array_to_bytes, array_from_bytes
+
+MAGIC = b"RISTATS\x00"
+VERSION = 1
+HEADER = struct.Struct(">8sHIIQ")
+
+
+def tf_weight(term_freq: int) -> float:
+    return 1 + math.log2(term_freq) if term_freq > 0 else 0.0
+
+
+def idf_weight(doc_count: int, doc_count_with_term: int) -> float:
+    return math.log2(doc_count / doc_count_with_term)
+
+
+class WeightTable:
+    """
+    Tabela de `function(tf)` para tf = 0, 1, 2, ..., que cresce até a maior frequência pedida.
+    Evita o cálculo de log2 a cada ocorrência: a maior parte das frequências é pequena e se repete.
+    """
+
+    INITIAL_SIZE = 64
+
+    def __init__(self, function):
+        self.function = function
+        self.lst_weights = [function(term_freq) for term_freq in range(self.INITIAL_SIZE)]
+
+    def get(self, max_term_freq: int) -> List[float]:
+        lst_weights = self.lst_weights
+        if max_term_freq >= len(lst_weights):
+            lst_weights.extend(
+                self.function(term_freq)
+                for term_freq in range(len(lst_weights), max_term_freq + 1)
+            )
+        return lst_weights
+
+
+def tf_weight_square(term_freq: int) -> float:
+    return tf_weight(term_freq) ** 2
+
+
+def stats_file_name(str_index_file: str) -> str:
+    return f"{str_index_file}.stats"
+
+
+class DocumentStats:
+    def __init__(
+        self,
+        doc_count: int,
+        term_count: int,
+        collection_length: int,
+        norms: array,
+    ):
+        self.doc_count = doc_count
+        self.term_count = term_count
+        self.collection_length = collection_length
+        self.norms = norms
+
+    @property
+    def avg_length(self) -> float:
+        return self.collection_length / self.doc_count if self.doc_count else 0.0
+
+    @staticmethod
+    def fingerprint(index) -> tuple:
+        return (
+            index.document_count,
+            len(index.dic_index),
+            sum(index.documents.arr_length),
+        )
+
+    def is_stale(self, index) -> bool:
+        """
+        Indica se as estatísticas não correspondem mais a `index` (por exemplo, se ele foi alterado depois)
+        """
+        return (
+            self.doc_count,
+            self.term_count,
+            self.collection_length,
+        ) != DocumentStats.fingerprint(index)
+
+    @staticmethod
+    def from_index(index) -> "DocumentStats":
+        """
+        Calcula as estatísticas percorrendo uma única vez as ocorrências de `index` (ver Index.iter_postings)
+        """
+        builder = DocumentStatsBuilder(index)
+        for _, postings in index.iter_postings():
+            builder.add_postings(postings.doc_ids, postings.term_freqs)
+        return builder.build()
+
+    def write(self, str_file_name: str):
+        with open(str_file_name, "wb") as file:
+            file.write(
+                HEADER.pack(
+                    MAGIC, VERSION, self.doc_count, self.term_count, self.collection_length
+                )
+            )
+            file.write(array_to_bytes(self.norms))
+
+    @staticmethod
+    def read(str_file_name: str) -> "DocumentStats":
+        """
+        Lê as estatísticas gravadas por `write`. Retorna None se o arquivo não existir.
+        """
+        if not os.path.exists(str_file_name):
+            return None
+        with open(str_file_name, "rb") as file:
+            data = file.read()
+        magic, version, doc_count, term_count, collection_length = HEADER.unpack_from(data)
+        if magic != MAGIC or version > VERSION:
+            raise ValueError(f"{str_file_name} não é um arquivo de estatísticas suportado")
+        return DocumentStats(
+            doc_count,
+            term_count,
+            collection_length,
+            array_from_bytes("d", data[HEADER.size :]),
+        )
+
+
+class DocumentStatsBuilder:
+    """
+    Acumula as normas dos documentos à medida que as ocorrências de cada termo são percorridas.
+    A quantidade de documentos do índice (usada no idf) já deve ser a final.
+
+    Como (tf x idf)² = tf² x idf², o idf² é calculado uma única vez por termo e o tf² de cada
+    frequência é obtido de uma tabela (que cresce até a maior frequência encontrada), sem chamadas de
+    log2 por ocorrência. O quadrado de cada peso é somado diretamente no array de normas.
+    """
+
+    def __init__(self, index):
+        self.index = index
+        self.doc_count = index.document_count
+        self.arr_sum_squares = array(
+            "d", bytes(8 * (max(index.documents, default=0) + 1))
+        )
+        self.tf_squares = WeightTable(tf_weight_square)
+
+    def add_postings(self, doc_ids, term_freqs):
+        """
+        Soma o peso (tf x idf)² do termo em cada documento em que ele ocorre
+        """
+        if not doc_ids:
+            return
+        if len(doc_ids) > self.doc_count:
+            # ocorrências de documentos fora da tabela de documentos do índice: o idf não é definido
+            return
+        idf_square = idf_weight(self.doc_count, len(doc_ids)) ** 2
+        arr_sum_squares = self.arr_sum_squares
+        get_tf_square = self.tf_squares.get(max(term_freqs)).__getitem__
+        for doc_id, tf_square in zip(doc_ids, map(get_tf_square, term_freqs)):
+            arr_sum_squares[doc_id] += tf_square * idf_square
+
+    def build(self) -> DocumentStats:
+        doc_count, term_count, collection_length = DocumentStats.fingerprint(self.index)
+        return DocumentStats(
+            doc_count,
+            term_count,
+            collection_length,
+            array("d", map(math.sqrt, self.arr_sum_squares)),
+        )
@@ -0,0 +1,101 @@
+from index.structure import *
+from index.statistics import DocumentStats, stats_file_name, tf_weight, idf_weight
+from index.index_structure_test import use_temporary_dir
+from random import randrange, seed
+import tempfile
+import unittest
+
+
+class DocumentStatsTest(unittest.TestCase):
+    def setUp(self):
+        use_temporary_dir(self)
+
+    def create_terms(self, index):
+        index.index("new", 1, 4)
+        index.index("york", 1, 1)
+        index.index("times", 1, 1)
+        index.index("new", 2, 1)
+        index.index("york", 2, 1)
+        index.index("post", 2, 1)
+        index.index("los", 3, 1)
+        index.index("angeles", 3, 1)
+        index.index("times", 3, 1)
+        return index
+
+    def check_stats(self, document_stats):
+        self.assertEqual(document_stats.doc_count, 3)
+        self.assertEqual(document_stats.term_count, 6)
+        self.assertEqual(document_stats.collection_length, 12)
+        self.assertAlmostEqual(document_stats.avg_length, 4)
+        for doc_id, norm in {1: 1.94, 2: 1.79, 3: 2.32}.items():
+            self.assertAlmostEqual(document_stats.norms[doc_id], norm, places=2)
+
+    def test_finish_indexing(self):
+        # o FileIndex acumula as normas na mesma passada em que registra a posição dos termos
+        index = self.create_terms(FileIndex())
+        index.finish_indexing()
+        self.check_stats(index.document_stats)
+        self.assertIs(index.get_document_stats(), index.document_stats)
+        self.check_stats(DocumentStats.from_index(self.create_terms(CompactHashIndex())))
+
+    def test_norms_tolerance(self):
+        # mesmas normas do cálculo por ocorrência (uma chamada de tf e idf por ocorrência, acumulando em um dicionário)
+        seed(10)
+        index = CompactHashIndex()
+        for doc_id in range(1, 301):
+            for term_id in range(randrange(1, 50)):
+                # inclui frequências maiores que o tamanho inicial da tabela de tf²
+                index.index(f"termo{randrange(0, 200)}_{term_id}", doc_id, randrange(1, 300))
+        dic_norms = {}
+        for term in index.vocabulary:
+            lst_occur = index.get_occurrence_list(term)
+            for occur in lst_occur:
+                weight = tf_weight(occur.term_freq) * idf_weight(
+                    index.document_count, len(lst_occur)
+                )
+                dic_norms[occur.doc_id] = dic_norms.get(occur.doc_id, 0) + weight ** 2
+
+        document_stats = DocumentStats.from_index(index)
+        for doc_id in index.documents:
+            self.assertAlmostEqual(
+                document_stats.norms[doc_id], dic_norms.get(doc_id, 0) ** 0.5, places=9
+            )
+
+    def test_persisted_stats(self):
+        index = self.create_terms(CompactHashIndex())
+        with tempfile.TemporaryDirectory() as str_dir:
+            str_file = f"{str_dir}/teste.idx"
+            index.write(str_file)
+            with Index.read(str_file) as disk_index:
+                self.assertIsNotNone(disk_index.document_stats)
+                self.assertFalse(disk_index.document_stats.is_stale(disk_index))
+                self.check_stats(disk_index.get_document_stats())
+
+            # estatísticas de outro índice ao lado do arquivo: devem ser recalculadas
+            other_index = self.create_terms(CompactHashIndex())
+            other_index.index("new", 4, 1)
+            other_index.compute_document_stats().write(stats_file_name(str_file))
+            with Index.read(str_file) as disk_index:
+                self.assertTrue(disk_index.document_stats.is_stale(disk_index))
+                self.check_stats(disk_index.get_document_stats())
+                self.assertFalse(disk_index.document_stats.is_stale(disk_index))
+
+    def test_file_index_write(self):
+        # as estatísticas calculadas em FileIndex.finish_indexing são gravadas por write, sem recálculo
+        with tempfile.TemporaryDirectory() as str_dir:
+            index = self.create_terms(FileIndex(f"{str_dir}/occur_file"))
+            index.finish_indexing()
+            document_stats = index.document_stats
+            str_file = f"{str_dir}/wiki.idx"
+            index.write(str_file)
+            index.remove_index_files()
+            self.assertIs(index.document_stats, document_stats)
+            self.assertTrue(os.path.exists(stats_file_name(str_file)))
+            with Index.read(str_file) as disk_index:
+                self.assertFalse(disk_index.document_stats.is_stale(disk_index))
+                self.assertIs(disk_index.get_document_stats(), disk_index.document_stats)
+                self.check_stats(disk_index.document_stats)
+
+
+if __name__ == "__main__":
+    unittest.main()
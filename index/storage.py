@@ -0,0 +1,301 @@
+"""
+Formato em disco do índice (todos os inteiros em big endian):
+
+    cabeçalho   magic, versão, codec, qtde de termos, qtde de documentos e
+                as posições das seções de termos, tabela de termos e documentos
+    ocorrências as listas de ocorrências de cada termo, uma após a outra, no codec do cabeçalho
+    termos      os termos, em utf-8, concatenados em ordem crescente
+    tabela      para cada termo (na mesma ordem): fim do termo na seção de termos,
+                term_id, quantidade de documentos, posição e tamanho da sua lista de ocorrências
+    documentos  doc_ids, quantidade de termos distintos e tamanho de cada documento e, a partir da versão 2,
+                o fim do nome e do caminho de cada documento seguidos dos nomes e dos caminhos
+                (em utf-8, concatenados)
+
+A abertura lê apenas o cabeçalho, os termos, a tabela e os documentos;
+as listas de ocorrências são lidas sob demanda de um mapeamento em memória.
+"""
+from typing import List
+from array import array
+from itertools import accumulate
+import mmap
+import struct
+import sys
+
+from index import compression
+from index.structure import (
+    Index,
+    DocumentRegistry,
+    Postings,
+    TermFilePosition,
+)
+
+MAGIC = b"RIINDEX\x00"
+VERSION = 2
+
+# codecs das listas de ocorrências
+# CODEC_RAW: pares (doc_id, term_freq) de inteiros de 4 bytes
+# CODEC_VARINT: gaps de doc_id e frequências em varint (ver index.compression)
+CODEC_RAW = 0
+CODEC_VARINT = 1
+
+HEADER = struct.Struct(">8sHHIIQQQ")
+TERM_ENTRY = struct.Struct(">IIIQQ")
+
+
+def array_to_bytes(arr: array) -> bytes:
+    if sys.byteorder == "little":
+        arr = array(arr.typecode, arr)
+        arr.byteswap()
+    return arr.tobytes()
+
+
+def array_from_bytes(typecode: str, buffer) -> array:
+    arr = array(typecode)
+    arr.frombytes(buffer)
+    if sys.byteorder == "little":
+        arr.byteswap()
+    return arr
+
+
+def encode_postings(postings: Postings, codec: int) -> bytes:
+    if codec == CODEC_RAW:
+        arr_records = array("I", bytes(8 * len(postings)))
+        arr_records[0::2] = postings.doc_ids
+        arr_records[1::2] = postings.term_freqs
+        return array_to_bytes(arr_records)
+    if codec == CODEC_VARINT:
+        return compression.encode_postings(postings.doc_ids, postings.term_freqs)
+    raise ValueError(f"Codec de ocorrências desconhecido: {codec}")
+
+
+def decode_postings(term_id: int, buffer, doc_count: int, codec: int) -> Postings:
+    if codec == CODEC_RAW:
+        arr_records = array_from_bytes("I", buffer)
+        return Postings(term_id, arr_records[0::2], arr_records[1::2])
+    if codec == CODEC_VARINT:
+        doc_ids, term_freqs = compression.decode_postings(bytes(buffer), doc_count)
+        return Postings(term_id, doc_ids, term_freqs)
+    raise ValueError(f"Codec de ocorrências desconhecido: {codec}")
+
+
+def write_index(index: Index, str_file_name: str, codec: int = CODEC_VARINT):
+    """
+    Grava `index` (qualquer subclasse de Index) no formato em disco.
+    As listas de ocorrências são gravadas ordenadas por doc_id, à medida que são obtidas de `index.iter_postings`.
+    """
+    lst_entries = []
+    with open(str_file_name, "wb") as file:
+        file.write(b"\x00" * HEADER.size)
+
+        # ocorrências
+        postings_pos = HEADER.size
+        for str_term, postings in index.iter_postings():
+            postings = postings.sorted_by_doc_id()
+            encoded = encode_postings(postings, codec)
+            file.write(encoded)
+            lst_entries.append(
+                (
+                    str_term.encode("utf-8"),
+                    postings.term_id,
+                    len(postings),
+                    postings_pos,
+                    len(encoded),
+                )
+            )
+            postings_pos += len(encoded)
+
+        # termos e tabela de termos, em ordem crescente
+        lst_entries.sort()
+        terms_pos = postings_pos
+        term_end = 0
+        arr_table = bytearray(TERM_ENTRY.size * len(lst_entries))
+        for i, (term, term_id, doc_count, start, size) in enumerate(lst_entries):
+            file.write(term)
+            term_end += len(term)
+            TERM_ENTRY.pack_into(
+                arr_table, i * TERM_ENTRY.size, term_end, term_id, doc_count, start, size
+            )
+        table_pos = terms_pos + term_end
+        file.write(arr_table)
+
+        # documentos
+        documents_pos = table_pos + len(arr_table)
+        registry = index.documents
+        file.write(array_to_bytes(array("I", registry.lst_doc_ids)))
+        file.write(array_to_bytes(registry.arr_term_count))
+        file.write(array_to_bytes(registry.arr_length))
+        lst_names = [str_name.encode("utf-8") for str_name in registry.lst_names]
+        lst_paths = [str_path.encode("utf-8") for str_path in registry.lst_paths]
+        file.write(array_to_bytes(array("I", accumulate(map(len, lst_names)))))
+        file.write(array_to_bytes(array("I", accumulate(map(len, lst_paths)))))
+        file.write(b"".join(lst_names))
+        file.write(b"".join(lst_paths))
+
+        file.seek(0)
+        file.write(
+            HEADER.pack(
+                MAGIC,
+                VERSION,
+                codec,
+                len(lst_entries),
+                len(registry),
+                terms_pos,
+                table_pos,
+                documents_pos,
+            )
+        )
+
+
+def is_disk_index(str_file_name: str) -> bool:
+    with open(str_file_name, "rb") as file:
+        return file.read(len(MAGIC)) == MAGIC
+
+
+class TermPostingsPosition(TermFilePosition):
+    def __init__(
+        self,
+        term_id: int,
+        term_file_start_pos: int,
+        doc_count_with_term: int,
+        postings_size: int,
+    ):
+        super().__init__(term_id, term_file_start_pos, doc_count_with_term)
+        self.postings_size = postings_size
+
+
+class DiskIndex(Index):
+    """
+    Índice somente leitura aberto a partir do formato gravado por `write_index`.
+    Ao abrir, somente o vocabulário e a tabela de documentos são carregados;
+    as listas de ocorrências são decodificadas sob demanda a partir do arquivo mapeado em memória.
+    """
+
+    def __init__(self, str_file_name: str):
+        super().__init__()
+        self.str_file_name = str_file_name
+        with open(str_file_name, "rb") as file:
+            self.mm_file = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view_file = memoryview(self.mm_file)
+
+        (
+            magic,
+            self.version,
+            self.codec,
+            term_count,
+            doc_count,
+            terms_pos,
+            table_pos,
+            documents_pos,
+        ) = HEADER.unpack_from(self.view_file)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{str_file_name} não é um índice no formato em disco")
+        if self.version > VERSION:
+            self.close()
+            raise ValueError(
+                f"Versão {self.version} do formato em disco não suportada (máximo: {VERSION})"
+            )
+
+        # vocabulário
+        terms = bytes(self.view_file[terms_pos:table_pos])
+        table_end = table_pos + term_count * TERM_ENTRY.size
+        term_start = 0
+        for term_end, term_id, doc_count_with_term, start, size in TERM_ENTRY.iter_unpack(
+            self.view_file[table_pos:table_end]
+        ):
+            self.dic_index[terms[term_start:term_end].decode("utf-8")] = (
+                TermPostingsPosition(term_id, start, doc_count_with_term, size)
+            )
+            term_start = term_end
+
+        # documentos
+        arr_size = 4 * doc_count
+        int_arrays = 5 if self.version >= 2 else 3
+        lst_arrays = [
+            array_from_bytes(
+                "I",
+                self.view_file[
+                    documents_pos + i * arr_size : documents_pos + (i + 1) * arr_size
+                ],
+            )
+            for i in range(int_arrays)
+        ]
+        lst_names, lst_paths = None, None
+        if self.version >= 2:
+            arr_name_ends, arr_path_ends = lst_arrays[3:]
+            names_pos = documents_pos + int_arrays * arr_size
+            lst_names = self.read_strings(names_pos, arr_name_ends)
+            lst_paths = self.read_strings(
+                names_pos + (arr_name_ends[-1] if doc_count else 0), arr_path_ends
+            )
+        self.documents = DocumentRegistry.from_arrays(*lst_arrays[:3], lst_names, lst_paths)
+
+        # estatísticas gravadas ao lado do índice (ver Index.write)
+        from index.statistics import DocumentStats, stats_file_name
+
+        self.document_stats = DocumentStats.read(stats_file_name(str_file_name))
+
+    def read_strings(self, pos: int, arr_ends: array) -> List[str]:
+        """
+        Lê as strings (em utf-8 e concatenadas) que terminam nas posições `arr_ends` a partir de `pos`
+        """
+        data = bytes(self.view_file[pos : pos + (arr_ends[-1] if arr_ends else 0)])
+        lst_strings = []
+        start = 0
+        for end in arr_ends:
+            lst_strings.append(data[start:end].decode("utf-8"))
+            start = end
+        return lst_strings
+
+    def close(self):
+        if self.view_file is not None:
+            self.view_file.release()
+            self.view_file = None
+        if self.mm_file is not None:
+            self.mm_file.close()
+            self.mm_file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get_term_id(self, term: str):
+        return self.dic_index[term].term_id
+
+    def create_index_entry(self, termo_id: int):
+        raise NotImplementedError("DiskIndex é somente leitura")
+
+    def add_index_occur(
+        self, entry_dic_index, doc_id: int, term_id: int, freq_termo: int
+    ):
+        raise NotImplementedError("DiskIndex é somente leitura")
+
+    def finish_indexing(self):
+        pass
+
+    def get_postings(self, term: str) -> Postings:
+        if term not in self.dic_index:
+            return Postings(None)
+        obj_term = self.dic_index[term]
+        start = obj_term.term_file_start_pos
+        return decode_postings(
+            obj_term.term_id,
+            self.view_file[start : start + obj_term.postings_size],
+            obj_term.doc_count_with_term,
+            self.codec,
+        )
+
+    def get_occurrence_list(self, term: str) -> List:
+        return list(self.get_postings(term)) if term in self.dic_index else list()
+
+    def iter_postings(self):
+        # o vocabulário está em ordem alfabética; iter_postings deve seguir a ordem de term_id
+        for term in sorted(self.dic_index, key=self.get_term_id):
+            yield term, self.get_postings(term)
+
+    def document_count_with_term(self, term: str) -> int:
+        if term in self.dic_index:
+            return self.dic_index[term].doc_count_with_term
+        return 0
@@ -0,0 +1,170 @@
+from index.structure import *
+from index.storage import DiskIndex, is_disk_index, write_index, CODEC_RAW
+from index import index_structure_test
+from index.index_structure_test import use_temporary_dir
+import pickle
+import os
+import shutil
+import unittest
+
+BASELINE_PICKLE = os.path.join(os.path.dirname(__file__), "fixtures", "hash_index_baseline.idx")
+# FileIndex gravado com pickle pela versão anterior e seu arquivo de ocorrências (occur_file_2)
+BASELINE_FILE_INDEX = os.path.join(os.path.dirname(__file__), "fixtures", "file_index_baseline.idx")
+BASELINE_FILE_INDEX_OCCURRENCES = os.path.join(
+    os.path.dirname(__file__), "fixtures", "file_index_baseline_occur_file_2"
+)
+
+
+class DiskStructureTest(index_structure_test.StructureTest):
+    def setUp(self):
+        use_temporary_dir(self)
+        self.index = HashIndex()
+        self.create_terms()
+        self.index.write("teste_disk.idx")
+        self.index = Index.read("teste_disk.idx")
+
+    def tearDown(self):
+        self.index.close()
+
+
+class DiskIndexTest(unittest.TestCase):
+    def setUp(self):
+        use_temporary_dir(self)
+
+    def create_terms(self, index):
+        index.index("casa", 1, 10)
+        index.index("vermelho", 1, 3)
+        index.index("verde", 1, 1)
+        index.index("vermelho", 2, 1)
+        index.index("vermelho", 3, 1)
+        index.index("casa", 2, 3)
+        index.index("prédio", 3, 2)
+        index.finish_indexing()
+        return index
+
+    def check_round_trip(self, index):
+        index.write("teste_disk.idx")
+        self.assertTrue(is_disk_index("teste_disk.idx"))
+        with Index.read("teste_disk.idx") as disk_index:
+            self.assertIsInstance(disk_index, DiskIndex)
+            self.assertEqual(disk_index.document_count, index.document_count)
+            self.assertCountEqual(disk_index.vocabulary, index.vocabulary)
+            self.assertListEqual(
+                list(disk_index.documents), list(index.documents), "doc_ids diferentes"
+            )
+            for doc_id in index.documents:
+                self.assertEqual(
+                    disk_index.documents.length(doc_id), index.documents.length(doc_id)
+                )
+                self.assertEqual(
+                    disk_index.documents.term_count(doc_id),
+                    index.documents.term_count(doc_id),
+                )
+            for term in index.vocabulary:
+                self.assertEqual(disk_index.get_term_id(term), index.get_term_id(term))
+                self.assertEqual(
+                    disk_index.document_count_with_term(term),
+                    index.document_count_with_term(term),
+                )
+                lst_expected = sorted(
+                    index.get_occurrence_list(term), key=lambda occur: occur.doc_id
+                )
+                lst_occur = disk_index.get_occurrence_list(term)
+                self.assertListEqual(lst_occur, lst_expected)
+                self.assertListEqual(
+                    [occur.term_freq for occur in lst_occur],
+                    [occur.term_freq for occur in lst_expected],
+                )
+            self.assertListEqual(disk_index.get_occurrence_list("xuxu"), [])
+            self.assertEqual(disk_index.document_count_with_term("xuxu"), 0)
+        self.assertIsNone(disk_index.view_file, "O índice deveria estar fechado")
+
+    def test_round_trip_hash_index(self):
+        self.check_round_trip(self.create_terms(HashIndex()))
+
+    def test_round_trip_compact_hash_index(self):
+        self.check_round_trip(self.create_terms(CompactHashIndex()))
+
+    def test_round_trip_file_index(self):
+        self.check_round_trip(self.create_terms(FileIndex()))
+
+    def test_round_trip_raw_codec(self):
+        index = self.create_terms(HashIndex())
+        write_index(index, "teste_disk.idx", CODEC_RAW)
+        with DiskIndex("teste_disk.idx") as disk_index:
+            self.assertEqual(disk_index.codec, CODEC_RAW)
+            for term in index.vocabulary:
+                self.assertListEqual(
+                    list(disk_index.get_postings(term).term_freqs),
+                    list(index.get_postings(term).term_freqs),
+                )
+
+    def test_unsorted_postings(self):
+        index = HashIndex()
+        index.index("casa", 5, 1)
+        index.index("casa", 2, 7)
+        index.index("casa", 9, 3)
+        write_index(index, "teste_disk.idx")
+        with DiskIndex("teste_disk.idx") as disk_index:
+            postings = disk_index.get_postings("casa")
+            self.assertListEqual(list(postings.doc_ids), [2, 5, 9])
+            self.assertListEqual(list(postings.term_freqs), [7, 1, 3])
+
+    def test_empty_index(self):
+        with DiskIndex(self.write_empty()) as disk_index:
+            self.assertEqual(disk_index.document_count, 0)
+            self.assertListEqual(disk_index.vocabulary, [])
+
+    def write_empty(self) -> str:
+        write_index(HashIndex(), "teste_disk.idx")
+        return "teste_disk.idx"
+
+    def test_read_only(self):
+        with DiskIndex(self.write_empty()) as disk_index:
+            with self.assertRaises(NotImplementedError):
+                disk_index.index("casa", 1, 1)
+
+    def test_read_pickle(self):
+        index = self.create_terms(HashIndex())
+        with open("teste_pickle.idx", "wb") as file:
+            pickle.dump(index, file)
+        self.assertFalse(is_disk_index("teste_pickle.idx"))
+        idx_lido = Index.read("teste_pickle.idx")
+        self.assertIsInstance(idx_lido, HashIndex)
+        self.assertEqual(idx_lido.document_count, 3)
+
+    def test_read_baseline_pickle(self):
+        # HashIndex gravado com pickle pela versão anterior ao registro de documentos e aos __slots__
+        idx_lido = Index.read(BASELINE_PICKLE)
+        self.assertIsInstance(idx_lido, HashIndex)
+        self.assertEqual(idx_lido.document_count, 3)
+        self.assertListEqual(list(idx_lido.documents), [1, 2, 3])
+        self.assertEqual(idx_lido.documents.length(1), 11)
+        self.assertEqual(idx_lido.documents.term_count(2), 2)
+        self.assertListEqual(
+            [(occur.doc_id, occur.term_freq) for occur in idx_lido.get_occurrence_list("casa")],
+            [(1, 10), (2, 3)],
+        )
+        self.assertEqual(idx_lido.get_document_stats().doc_count, 3)
+
+    def test_read_baseline_file_index(self):
+        # o pickle referencia o arquivo de ocorrências pelo caminho relativo ao diretório atual
+        shutil.copy(BASELINE_FILE_INDEX_OCCURRENCES, "occur_file_2")
+        idx_lido = Index.read(BASELINE_FILE_INDEX)
+        self.assertIsInstance(idx_lido, FileIndex)
+        self.assertListEqual(list(idx_lido.documents), [1, 2, 3])
+        self.assertEqual(idx_lido.documents.length(1), 11)
+        self.assertListEqual(
+            [(occur.doc_id, occur.term_freq) for occur in idx_lido.get_occurrence_list("casa")],
+            [(1, 10), (2, 3)],
+        )
+        self.assertListEqual(list(idx_lido.get_postings("vermelho").doc_ids), [2, 3])
+        self.assertEqual(idx_lido.document_count_with_term("verde"), 1)
+        self.assertEqual(idx_lido.get_document_stats().doc_count, 3)
+        idx_lido.open_for_serving()
+        self.assertListEqual(list(idx_lido.get_postings("casa").term_freqs), [10, 3])
+        idx_lido.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,24 +2,153 @@ from IPython.display import clear_output
 from typing import List, Set, Union
 from abc import abstractmethod
 from functools import total_ordering
+from array import array
+from operator import attrgetter, itemgetter
+from itertools import chain
 from os import path
 import os
 import pickle
+import struct
+import heapq
+import mmap
+import sys
 import gc
 
 
+class DocumentRegistry:
+    """
+    Registro (tabela) dos documentos indexados. Cada doc_id recebe uma posição densa (ordem de chegada)
+    e, para cada posição, são mantidos a quantidade de termos distintos e o total de ocorrências
+    de termos do documento. Tudo é atualizado in place, em O(1) por ocorrência.
+    Opcionalmente, cada documento também possui o nome e o caminho do arquivo de origem (ver set_source).
+    """
+
+    def __init__(self):
+        self.dic_positions = {}
+        self.lst_doc_ids = []
+        self.arr_term_count = array("I")
+        self.arr_length = array("I")
+        self.lst_names = []
+        self.lst_paths = []
+        # nome -> doc_id, criado na primeira chamada de doc_id_by_name
+        self.dic_doc_ids_per_name = None
+
+    @staticmethod
+    def from_arrays(
+        lst_doc_ids: List[int],
+        arr_term_count: array,
+        arr_length: array,
+        lst_names: List[str] = None,
+        lst_paths: List[str] = None,
+    ) -> "DocumentRegistry":
+        registry = DocumentRegistry()
+        registry.lst_doc_ids = list(lst_doc_ids)
+        registry.dic_positions = {
+            doc_id: position for position, doc_id in enumerate(registry.lst_doc_ids)
+        }
+        registry.arr_term_count = arr_term_count
+        registry.arr_length = arr_length
+        registry.lst_names = (
+            list(lst_names) if lst_names is not None else [""] * len(lst_doc_ids)
+        )
+        registry.lst_paths = (
+            list(lst_paths) if lst_paths is not None else [""] * len(lst_doc_ids)
+        )
+        return registry
+
+    def register(self, doc_id: int) -> int:
+        position = self.dic_positions.get(doc_id)
+        if position is None:
+            position = len(self.lst_doc_ids)
+            self.dic_positions[doc_id] = position
+            self.lst_doc_ids.append(doc_id)
+            self.arr_term_count.append(0)
+            self.arr_length.append(0)
+            self.lst_names.append("")
+            self.lst_paths.append("")
+        return position
+
+    def add(self, doc_id: int, term_freq: int) -> int:
+        position = self.register(doc_id)
+        self.arr_term_count[position] += 1
+        self.arr_length[position] += term_freq
+        return position
+
+    def set_source(self, doc_id: int, str_name: str, str_path: str):
+        position = self.register(doc_id)
+        self.lst_names[position] = str_name
+        self.lst_paths[position] = str_path
+        self.dic_doc_ids_per_name = None
+
+    def extend(self, other: "DocumentRegistry"):
+        """
+        Acrescenta os documentos de `other` (que não podem estar registrados aqui), na mesma ordem
+        """
+        for doc_id, term_count, length, str_name, str_path in zip(
+            other.lst_doc_ids,
+            other.arr_term_count,
+            other.arr_length,
+            other.lst_names,
+            other.lst_paths,
+        ):
+            self.dic_positions[doc_id] = len(self.lst_doc_ids)
+            self.lst_doc_ids.append(doc_id)
+            self.arr_term_count.append(term_count)
+            self.arr_length.append(length)
+            self.lst_names.append(str_name)
+            self.lst_paths.append(str_path)
+        self.dic_doc_ids_per_name = None
+
+    def position(self, doc_id: int) -> int:
+        return self.dic_positions[doc_id]
+
+    def term_count(self, doc_id: int) -> int:
+        return self.arr_term_count[self.dic_positions[doc_id]]
+
+    def length(self, doc_id: int) -> int:
+        return self.arr_length[self.dic_positions[doc_id]]
+
+    def name(self, doc_id: int) -> str:
+        return self.lst_names[self.dic_positions[doc_id]]
+
+    def path(self, doc_id: int) -> str:
+        return self.lst_paths[self.dic_positions[doc_id]]
+
+    def doc_id_by_name(self, str_name: str) -> int:
+        if self.dic_doc_ids_per_name is None:
+            self.dic_doc_ids_per_name = {
+                str_name: doc_id
+                for doc_id, str_name in zip(self.lst_doc_ids, self.lst_names)
+                if str_name
+            }
+        return self.dic_doc_ids_per_name.get(str_name)
+
+    def __contains__(self, doc_id: int) -> bool:
+        return doc_id in self.dic_positions
+
+    def __iter__(self):
+        return iter(self.lst_doc_ids)
+
+    def __len__(self) -> int:
+        return len(self.lst_doc_ids)
+
+
 class Index:
     def __init__(self):
         self.dic_index = {}
-        self.set_documents = set()
+        self.documents = DocumentRegistry()
+        # estatísticas dos documentos (ver index.statistics), calculadas em finish_indexing
+        self.document_stats = None
 
     def index(self, term: str, doc_id: int, term_freq: int):
+        if type(doc_id) is str:
+            doc_id = int(doc_id)
         if term not in self.dic_index:
             int_term_id = len(self.dic_index) + 1
             self.dic_index[term] = self.create_index_entry(int_term_id)
         else:
             int_term_id = self.get_term_id(term)
-        self.set_documents = set.union(self.set_documents, {doc_id})
+        self.documents.add(doc_id, term_freq)
         self.add_index_occur(self.dic_index[term], doc_id, int_term_id, term_freq)
 
     @property
@@ -28,10 +157,7 @@ class Index:
 
     @property
     def document_count(self) -> int:
-        try:
-            return len(self.set_documents)
-        except:
-            return 0
+        return len(self.documents)
 
     @abstractmethod
     def get_term_id(self, term: str):
@@ -65,18 +191,116 @@ class Index:
             "Voce deve criar uma subclasse e a mesma deve sobrepor este método"
         )
 
+    def get_postings(self, term: str) -> "Postings":
+        """
+        Retorna as ocorrências do termo em arrays (doc_ids e frequências).
+        Subclasses que já armazenam as ocorrências dessa forma devem sobrepor este método.
+        """
+        if term not in self.dic_index:
+            return Postings(None)
+        postings = Postings(self.get_term_id(term))
+        for occur in self.get_occurrence_list(term):
+            postings.append(occur.doc_id, occur.term_freq)
+        return postings
+
     def finish_indexing(self):
+        self.compute_document_stats()
         self.write("wiki.idx")
 
+    def compute_document_stats(self):
+        from index.statistics import DocumentStats
+
+        self.document_stats = DocumentStats.from_index(self)
+        return self.document_stats
+
+    def get_document_stats(self):
+        """
+        Retorna as estatísticas dos documentos, recalculando-as caso não existam ou estejam desatualizadas
+        """
+        document_stats = getattr(self, "document_stats", None)
+        if document_stats is not None and not document_stats.is_stale(self):
+            return document_stats
+        if document_stats is not None:
+            print("Estatísticas dos documentos desatualizadas: recalculando")
+        return self.compute_document_stats()
+
+    def iter_postings(self):
+        """
+        Gera os pares (termo, Postings) de todo o vocabulário, em ordem de term_id.
+        Usado para exportar o índice e para combinar índices (ver add_index).
+        """
+        for term in self.vocabulary:
+            yield term, self.get_postings(term)
+
+    def add_index(self, other: "Index"):
+        """
+        Acrescenta a este índice os documentos e as ocorrências de `other`, um índice construído sobre
+        documentos disjuntos (por exemplo, um shard). Os termos de `other` são percorridos em ordem de
+        term_id e os que ainda não existem aqui recebem novos term_ids. Assim, combinar em ordem shards
+        construídos sobre partes consecutivas de uma coleção gera os mesmos term_ids da indexação serial.
+        """
+        self.documents.extend(other.documents)
+        for term, postings in other.iter_postings():
+            if term not in self.dic_index:
+                int_term_id = len(self.dic_index) + 1
+                self.dic_index[term] = self.create_index_entry(int_term_id)
+            else:
+                int_term_id = self.get_term_id(term)
+            entry = self.dic_index[term]
+            for doc_id, term_freq in zip(postings.doc_ids, postings.term_freqs):
+                self.add_index_occur(entry, doc_id, int_term_id, term_freq)
+
     def write(self, arq_index: str):
-        with open(arq_index, "wb") as f:
-            pickle.dump(self, f)
+        """
+        Grava o índice no formato em disco de `index.storage` (ver DiskIndex) e, ao seu lado,
+        as estatísticas dos documentos (ver index.statistics)
+        """
+        from index.storage import write_index
+        from index.statistics import stats_file_name
+
+        write_index(self, arq_index)
+        self.get_document_stats().write(stats_file_name(arq_index))
 
     @staticmethod
     def read(arq_index: str):
+        """
+        Abre um índice gravado por `write` como um DiskIndex (somente leitura, carregado sob demanda).
+        Um diretório de índice incremental é aberto como um SegmentedIndex (ver index.segments).
+        Arquivos antigos, gravados com pickle, continuam sendo lidos por completo.
+        """
+        from index.storage import is_disk_index, DiskIndex
+        from index.segments import SegmentedIndex
+
+        if SegmentedIndex.is_segmented_index(arq_index):
+            return SegmentedIndex(arq_index)
+        if is_disk_index(arq_index):
+            return DiskIndex(arq_index)
         with open(arq_index, "rb") as f:
             return pickle.load(f)
 
+    def __setstate__(self, state):
+        """
+        Índices gravados com pickle antes do registro de documentos possuíam apenas o conjunto
+        `set_documents`: o registro é reconstruído a partir das ocorrências
+        """
+        set_documents = state.pop("set_documents", None)
+        self.__dict__.update(state)
+        if "documents" not in state:
+            self.documents = DocumentRegistry()
+            self.rebuild_documents(set_documents or ())
+        if "document_stats" not in state:
+            self.document_stats = None
+
+    def rebuild_documents(self, set_documents):
+        """
+        Registra os documentos de um índice antigo (ver __setstate__) e soma suas ocorrências
+        """
+        for doc_id in sorted(set_documents):
+            self.documents.register(doc_id)
+        for _, postings in self.iter_postings():
+            for doc_id, term_freq in zip(postings.doc_ids, postings.term_freqs):
+                self.documents.add(doc_id, term_freq)
+
     def __str__(self):
         arr_index = []
         for str_term in self.vocabulary:
@@ -90,15 +314,68 @@ class Index:
 
 @total_ordering
 class TermOccurrence:
+    # registro binário de uma ocorrência: doc_id, term_id e term_freq em inteiros de 4 bytes (big endian)
+    STRUCT = struct.Struct(">III")
+    # chave de ordenação equivalente a __lt__, para uso em sort/heapq
+    SORT_KEY = attrgetter("term_id", "doc_id")
+    # mesma chave para as tuplas (doc_id, term_id, term_freq) lidas com STRUCT
+    RECORD_SORT_KEY = itemgetter(1, 0)
+
+    __slots__ = ("doc_id", "term_id", "term_freq")
+
     def __init__(self, doc_id: int, term_id: int, term_freq: int):
-        self.doc_id = int(doc_id) if type(doc_id) is str else doc_id
-        self.term_id = int(term_id) if type(term_id) is str else term_id
-        self.term_freq = int(term_freq) if type(term_freq) is str else term_freq
+        self.doc_id = doc_id
+        self.term_id = term_id
+        self.term_freq = term_freq
+
+    def __setstate__(self, state):
+        """
+        Aceita tanto o estado de __slots__, (None, {atributo: valor}), quanto o __dict__ dos índices
+        gravados com pickle antes de TermOccurrence usar __slots__
+        """
+        if isinstance(state, tuple):
+            dic_state, dic_slots = state
+            state = {**(dic_state or {}), **(dic_slots or {})}
+        for str_name, value in state.items():
+            setattr(self, str_name, value)
 
     def write(self, idx_file):
-        idx_file.write(self.doc_id.to_bytes(4, byteorder="big"))
-        idx_file.write(self.term_id.to_bytes(4, byteorder="big"))
-        idx_file.write(self.term_freq.to_bytes(4, byteorder="big"))
+        idx_file.write(
+            TermOccurrence.STRUCT.pack(self.doc_id, self.term_id, self.term_freq)
+        )
+
+    @staticmethod
+    def pack_many(lst_occurrences: List["TermOccurrence"]) -> bytes:
+        """
+        Serializa as ocorrências em um único buffer, no mesmo formato de `write`.
+        """
+        rec_size = TermOccurrence.STRUCT.size
+        buffer = bytearray(rec_size * len(lst_occurrences))
+        pack_into = TermOccurrence.STRUCT.pack_into
+        offset = 0
+        for occur in lst_occurrences:
+            pack_into(buffer, offset, occur.doc_id, occur.term_id, occur.term_freq)
+            offset += rec_size
+        return bytes(buffer)
+
+    @staticmethod
+    def pack_records(lst_records: List[tuple]) -> bytes:
+        """
+        Serializa tuplas (doc_id, term_id, term_freq) no mesmo formato de `write`.
+        """
+        return struct.pack(f">{3 * len(lst_records)}I", *chain.from_iterable(lst_records))
+
+    @staticmethod
+    def unpack_many(buffer) -> List["TermOccurrence"]:
+        """
+        Lê todas as ocorrências completas de `buffer` (bytes, bytearray, memoryview ou mmap) sem copiá-lo.
+        """
+        view = memoryview(buffer)
+        view = view[: len(view) - len(view) % TermOccurrence.STRUCT.size]
+        return [
+            TermOccurrence(doc_id, term_id, term_freq)
+            for doc_id, term_id, term_freq in TermOccurrence.STRUCT.iter_unpack(view)
+        ]
 
     def __hash__(self):
         return hash((self.doc_id, self.term_id))
@@ -116,15 +393,10 @@ class TermOccurrence:
         if other_occurrence is None or self is None:
             # raise ValueError("Não é possíve comparar TermOccurrence com NoneType")
             return False
-        if self.term_id < other_occurrence.term_id:
-            return True
-        elif self.term_id == other_occurrence.term_id:
-            if self.doc_id < other_occurrence.doc_id:
-                return True
-            else:
-                return False
-        else:
-            return False
+        return (self.term_id, self.doc_id) < (
+            other_occurrence.term_id,
+            other_occurrence.doc_id,
+        )
 
     def __str__(self):
         return f"( doc: {self.doc_id} term_id:{self.term_id} freq: {self.term_freq})"
@@ -135,6 +407,22 @@ class TermOccurrence:
 
 # HashIndex é subclasse de Index
 class HashIndex(Index):
+    """
+    As ocorrências de cada termo são mantidas na ordem em que foram indexadas. Caso algum documento seja
+    indexado fora de ordem de doc_id (como nos índices antigos, cujos doc_ids seguiam a ordem de os.listdir),
+    as listas são ordenadas antes da próxima consulta (ver sort_postings): quem consulta o índice sempre
+    recebe as ocorrências em ordem de doc_id.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.sorted_postings = True
+
+    def __setstate__(self, state):
+        # índices gravados com pickle antes de sorted_postings podem estar fora de ordem
+        self.sorted_postings = False
+        super().__setstate__(state)
+
     def get_term_id(self, term: str):
         return self.dic_index[term][0].term_id
 
@@ -148,15 +436,132 @@ class HashIndex(Index):
         term_id: int,
         term_freq: int,
     ):
+        if entry_dic_index and entry_dic_index[-1].doc_id >= doc_id:
+            self.sorted_postings = False
         entry_dic_index.append(TermOccurrence(doc_id, term_id, term_freq))
 
+    def sort_postings(self):
+        for term, entry in self.dic_index.items():
+            self.dic_index[term] = self.sorted_entry(entry)
+        self.sorted_postings = True
+
+    @staticmethod
+    def sorted_entry(entry: List[TermOccurrence]) -> List[TermOccurrence]:
+        if all(entry[i].doc_id < entry[i + 1].doc_id for i in range(len(entry) - 1)):
+            return entry
+        return sorted(entry, key=attrgetter("doc_id"))
+
     def get_occurrence_list(self, term: str) -> List:
+        if not self.sorted_postings:
+            self.sort_postings()
         return self.dic_index[term] if term in self.dic_index else list()
 
     def document_count_with_term(self, term: str) -> int:
         return len(self.dic_index[term]) if term in self.dic_index else 0
 
 
+class Postings:
+    """
+    Lista de ocorrências de um termo em arrays tipados: doc_ids e frequências ficam em
+    arrays paralelos e o term_id é armazenado uma única vez. Instâncias de TermOccurrence
+    só são criadas quando a lista é iterada ou acessada por posição.
+    """
+
+    __slots__ = ("term_id", "doc_ids", "term_freqs")
+
+    def __init__(self, term_id: int, doc_ids: array = None, term_freqs: array = None):
+        self.term_id = term_id
+        self.doc_ids = array("I") if doc_ids is None else doc_ids
+        self.term_freqs = array("I") if term_freqs is None else term_freqs
+
+    @staticmethod
+    def from_buffer(term_id: int, buffer) -> "Postings":
+        """
+        Cria os arrays a partir de registros no formato de TermOccurrence.STRUCT (doc_id, term_id, term_freq)
+        """
+        arr_records = array("I")
+        arr_records.frombytes(buffer)
+        if sys.byteorder == "little":
+            arr_records.byteswap()
+        return Postings(term_id, arr_records[0::3], arr_records[2::3])
+
+    def append(self, doc_id: int, term_freq: int):
+        self.doc_ids.append(doc_id)
+        self.term_freqs.append(term_freq)
+
+    def is_sorted(self) -> bool:
+        doc_ids = self.doc_ids
+        return all(doc_ids[i] < doc_ids[i + 1] for i in range(len(doc_ids) - 1))
+
+    def sorted_by_doc_id(self) -> "Postings":
+        """
+        Retorna as ocorrências em ordem de doc_id: a própria instância, se já estiverem ordenadas,
+        ou uma cópia ordenada
+        """
+        if self.is_sorted():
+            return self
+        lst_pairs = sorted(zip(self.doc_ids, self.term_freqs))
+        return Postings(
+            self.term_id,
+            array("I", [doc_id for doc_id, _ in lst_pairs]),
+            array("I", [term_freq for _, term_freq in lst_pairs]),
+        )
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    def __getitem__(self, position: int) -> TermOccurrence:
+        return TermOccurrence(
+            self.doc_ids[position], self.term_id, self.term_freqs[position]
+        )
+
+    def __iter__(self):
+        term_id = self.term_id
+        for doc_id, term_freq in zip(self.doc_ids, self.term_freqs):
+            yield TermOccurrence(doc_id, term_id, term_freq)
+
+    def __str__(self):
+        return str(list(self))
+
+    def __repr__(self):
+        return str(self)
+
+
+# Versão compacta do HashIndex: cada termo possui um Postings em vez de uma lista de TermOccurrence
+class CompactHashIndex(HashIndex):
+    def get_term_id(self, term: str):
+        return self.dic_index[term].term_id
+
+    def create_index_entry(self, termo_id: int) -> Postings:
+        return Postings(termo_id)
+
+    def add_index_occur(
+        self,
+        entry_dic_index: Postings,
+        doc_id: int,
+        term_id: int,
+        term_freq: int,
+    ):
+        if entry_dic_index.doc_ids and entry_dic_index.doc_ids[-1] >= doc_id:
+            self.sorted_postings = False
+        entry_dic_index.append(doc_id, term_freq)
+
+    @staticmethod
+    def sorted_entry(entry: Postings) -> Postings:
+        return entry.sorted_by_doc_id()
+
+    def get_occurrence_list(self, term: str) -> List:
+        return list(self.get_postings(term)) if term in self.dic_index else list()
+
+    def get_postings(self, term: str) -> Postings:
+        if not self.sorted_postings:
+            self.sort_postings()
+        return self.dic_index[term] if term in self.dic_index else Postings(None)
+
+    def document_count_with_term(self, term: str) -> int:
+        return len(self.dic_index[term]) if term in self.dic_index else 0
+
+
 class TermFilePosition:
     def __init__(
         self,
@@ -177,18 +582,92 @@ class TermFilePosition:
         return str(self)
 
 
+class OccurrenceBlockReader:
+    """
+    Leitor sequencial de um arquivo de ocorrências: lê blocos de `block_size` bytes por vez
+    e os decodifica de uma só vez com `struct.iter_unpack`. Assim como `FileIndex.next_from_file`,
+    a leitura termina no fim do arquivo ou em um registro zerado.
+    """
+
+    BLOCK_SIZE = 1 << 16
+
+    def __init__(self, file_pointer, block_size: int = None):
+        rec_size = TermOccurrence.STRUCT.size
+        block_size = block_size if block_size is not None else self.BLOCK_SIZE
+        self.file_pointer = file_pointer
+        self.block_size = max(rec_size, block_size - block_size % rec_size)
+
+    def iter_records(self):
+        """
+        Gera as tuplas (doc_id, term_id, term_freq) do arquivo a partir da posição atual
+        """
+        rec_size = TermOccurrence.STRUCT.size
+        iter_unpack = TermOccurrence.STRUCT.iter_unpack
+        leftover = b""
+        while True:
+            block = self.file_pointer.read(self.block_size)
+            if not block:
+                return
+            if leftover:
+                block = leftover + block
+            int_complete = len(block) - len(block) % rec_size
+            leftover = block[int_complete:]
+            for record in iter_unpack(memoryview(block)[:int_complete]):
+                if record == (0, 0, 0):
+                    return
+                yield record
+
+    def __iter__(self):
+        for doc_id, term_id, term_freq in self.iter_records():
+            yield TermOccurrence(doc_id, term_id, term_freq)
+
+
 class FileIndex(Index):
     TMP_OCCURRENCES_LIMIT = 1000000
+    # quantidade de ocorrências serializadas por chamada de escrita no arquivo
+    WRITE_BATCH_SIZE = 4096
+    # quantidade máxima de runs combinadas por passo do merge
+    MERGE_FAN_IN = 64
 
-    def __init__(self, str_idx_file_name="occur_file"):
+    def __init__(
+        self,
+        str_idx_file_name="occur_file",
+        tmp_occurrences_limit: int = None,
+        merge_fan_in: int = None,
+        read_block_size: int = None,
+    ):
         super().__init__()
 
-        self.lst_occurrences_tmp = [None] * (FileIndex.TMP_OCCURRENCES_LIMIT + 1)
+        self.tmp_occurrences_limit = (
+            tmp_occurrences_limit
+            if tmp_occurrences_limit is not None
+            else FileIndex.TMP_OCCURRENCES_LIMIT
+        )
+        self.merge_fan_in = (
+            merge_fan_in if merge_fan_in is not None else FileIndex.MERGE_FAN_IN
+        )
+        self.read_block_size = (
+            read_block_size
+            if read_block_size is not None
+            else OccurrenceBlockReader.BLOCK_SIZE
+        )
+        self.lst_occurrences_tmp = [None] * (self.tmp_occurrences_limit + 1)
         self.idx_file_counter = 0
         self.str_idx_file_name = str_idx_file_name
         with open(f"{self.str_idx_file_name}_{self.idx_file_counter}", "wb") as file:
             file.write(b"")
 
+        # arquivo de índice mapeado em memória (ver open_for_serving)
+        self.mm_postings = None
+        self.view_postings = None
+
+        # runs ordenadas gravadas a cada esvaziamento da lst_occurrences_tmp (ainda não combinadas)
+        self.lst_run_files = []
+        self.run_counter = 0
+        # total de bytes gravados (runs e passos de merge) e quantidade de passos de merge
+        self.bytes_written = 0
+        self.merge_passes = 0
+
         # metodos auxiliares para verifica o tamanho da lst_occurrences_tmp
         self.idx_tmp_occur_last_element = -1
         self.idx_tmp_occur_first_element = 0
@@ -215,7 +694,7 @@ class FileIndex(Index):
         )
         self.idx_tmp_occur_last_element += 1
 
-        if self.idx_tmp_occur_last_element >= self.TMP_OCCURRENCES_LIMIT:
+        if self.idx_tmp_occur_last_element >= self.tmp_occurrences_limit:
             self.save_tmp_occurrences()
 
     def next_from_list(self) -> TermOccurrence:
@@ -232,72 +711,132 @@ class FileIndex(Index):
         return self.idx_tmp_occur_last_element - self.idx_tmp_occur_first_element + 1
 
     def next_from_file(self, file_pointer) -> TermOccurrence:
-        try:
-            doc_id = int.from_bytes(file_pointer.read(4), byteorder="big")
-            term_id = int.from_bytes(file_pointer.read(4), byteorder="big")
-            term_freq = int.from_bytes(file_pointer.read(4), byteorder="big")
-            if doc_id == 0 and term_id == 0 and term_freq == 0:
-                return None
-        except:
+        data = file_pointer.read(TermOccurrence.STRUCT.size)
+        if len(data) < TermOccurrence.STRUCT.size:
+            return None
+        doc_id, term_id, term_freq = TermOccurrence.STRUCT.unpack(data)
+        if doc_id == 0 and term_id == 0 and term_freq == 0:
             return None
         return TermOccurrence(doc_id, term_id, term_freq)
 
-    def save_tmp_occurrences(self):
+    def iter_file(self, file_name: str):
+        """
+        Gera as tuplas (doc_id, term_id, term_freq) de um arquivo de ocorrências usando o leitor em blocos
+        """
+        with open(file_name, "rb") as file:
+            yield from OccurrenceBlockReader(file, self.read_block_size).iter_records()
+
+    def new_run_file_name(self) -> str:
+        file_name = f"{self.str_idx_file_name}_run_{self.run_counter}"
+        self.run_counter += 1
+        return file_name
 
-        # Ordena pelo term_id, doc_id
+    def write_occurrences(
+        self, file_name: str, occurrences, pack=TermOccurrence.pack_many
+    ) -> int:
+        """
+        Grava `occurrences` (já ordenadas) em `file_name` em lotes de WRITE_BATCH_SIZE serializados por `pack`.
+        Retorna a quantidade de bytes gravados, que também é somada em `bytes_written`.
+        """
+        int_bytes = 0
+        lst_to_write = []
+        with open(file_name, "wb") as file:
+            for occur in occurrences:
+                lst_to_write.append(occur)
+                if len(lst_to_write) >= FileIndex.WRITE_BATCH_SIZE:
+                    int_bytes += file.write(pack(lst_to_write))
+                    lst_to_write.clear()
+            int_bytes += file.write(pack(lst_to_write))
+        self.bytes_written += int_bytes
+        return int_bytes
+
+    def merge_files(self, lst_file_names: List[str], str_output_file: str) -> int:
+        """
+        Combina os arquivos ordenados de `lst_file_names` em `str_output_file` por meio de um merge com heap.
+        O merge é feito diretamente sobre as tuplas decodificadas, sem criar instâncias de TermOccurrence.
+        """
+        return self.write_occurrences(
+            str_output_file,
+            heapq.merge(
+                *[self.iter_file(file_name) for file_name in lst_file_names],
+                key=TermOccurrence.RECORD_SORT_KEY,
+            ),
+            pack=TermOccurrence.pack_records,
+        )
+
+    def save_tmp_occurrences(self):
+        """
+        Ordena as ocorrências da lst_occurrences_tmp (por term_id, doc_id) e grava-as em uma nova run
+        independente. As runs só são combinadas em `merge_runs`, ao final da indexação.
+        """
         #    Para eficiência, todo o código deve ser feito com o garbage collector desabilitado gc.disable()
         gc.disable()
 
         to_save = self.lst_occurrences_tmp[
             self.idx_tmp_occur_first_element : self.idx_tmp_occur_last_element + 1
         ]
-        to_save.sort()
-        self.lst_occurrences_tmp = (
-            self.lst_occurrences_tmp[: self.idx_tmp_occur_first_element]
-            + to_save
-            + self.lst_occurrences_tmp[self.idx_tmp_occur_last_element + 1 :]
-        )
+        to_save.sort(key=TermOccurrence.SORT_KEY)
 
-        leitura = f"{self.str_idx_file_name}_{self.idx_file_counter}"
-        escrita = f"{self.str_idx_file_name}_{self.idx_file_counter + 1}"
-
-        with open(f"{leitura}", "rb") as file:
-            with open(escrita, "wb") as file_2:
-                next_from_list = self.next_from_list()
-                next_from_file = self.next_from_file(file)
-                while True:
-                    if next_from_list is None and next_from_file is None:
-                        break
-                    elif next_from_list is None and next_from_file is not None:
-                        while True:
-                            if next_from_file is None:
-                                break
-                            next_from_file.write(file_2)
-                            next_from_file = self.next_from_file(file)
-                    elif next_from_list is not None and next_from_file is None:
-                        while True:
-                            if next_from_list is None:
-                                break
-                            next_from_list.write(file_2)
-                            next_from_list = self.next_from_list()
-                    else:
-                        if next_from_list > next_from_file:
-                            next_from_file.write(file_2)
-                            next_from_file = self.next_from_file(file)
-                        else:
-                            next_from_list.write(file_2)
-                            next_from_list = self.next_from_list()
+        str_run_file = self.new_run_file_name()
+        self.write_occurrences(str_run_file, to_save)
+        self.lst_run_files.append(str_run_file)
         gc.enable()
-        self.idx_file_counter += 1
+
         self.idx_tmp_occur_last_element = -1
         self.idx_tmp_occur_first_element = 0
-        """comparar sempre a primeira posição
-        da lista com a primeira posição do arquivo usando os métodos next_from_list e next_from_file
-        e use o método write do TermOccurrence para armazenar cada ocorrencia do novo índice ordenado"""
+
+    def merge_runs(self):
+        """
+        Combina as runs pendentes (e o arquivo de índice atual, caso não esteja vazio) em um novo arquivo
+        de índice `{str_idx_file_name}_{idx_file_counter}`. Enquanto houver mais de `merge_fan_in`
+        arquivos, eles são combinados em grupos de `merge_fan_in` em runs intermediárias.
+        Todas as runs e o arquivo de índice anterior são removidos ao final.
+        """
+        if not self.lst_run_files:
+            return
+        # o arquivo de índice atual será substituído
+        self.close()
+        gc.disable()
+        str_old_idx_file = f"{self.str_idx_file_name}_{self.idx_file_counter}"
+        lst_files = list(self.lst_run_files)
+        if os.path.getsize(str_old_idx_file) > 0:
+            lst_files.insert(0, str_old_idx_file)
+
+        while len(lst_files) > self.merge_fan_in:
+            lst_next_files = []
+            for i in range(0, len(lst_files), self.merge_fan_in):
+                lst_group = lst_files[i : i + self.merge_fan_in]
+                if len(lst_group) == 1:
+                    lst_next_files.append(lst_group[0])
+                    continue
+                str_run_file = self.new_run_file_name()
+                self.merge_files(lst_group, str_run_file)
+                self.remove_files(lst_group)
+                lst_next_files.append(str_run_file)
+            lst_files = lst_next_files
+            self.merge_passes += 1
+
+        self.idx_file_counter += 1
+        self.merge_files(
+            lst_files, f"{self.str_idx_file_name}_{self.idx_file_counter}"
+        )
+        self.merge_passes += 1
+        self.remove_files(lst_files + [str_old_idx_file])
+        self.lst_run_files = []
+        gc.enable()
+
+    @staticmethod
+    def remove_files(lst_file_names: List[str]):
+        for file_name in lst_file_names:
+            if path.exists(file_name):
+                os.remove(file_name)
 
     def finish_indexing(self):
-        if len(self.lst_occurrences_tmp) > 0:
+        from index.statistics import DocumentStatsBuilder
+
+        if self.get_tmp_occur_size() > 0:
             self.save_tmp_occurrences()
+        self.merge_runs()
 
         # Sugestão: faça a navegação e obetenha um mapeamento
         # id_termo -> obj_termo armazene-o em dic_ids_por_termo
@@ -305,49 +844,186 @@ class FileIndex(Index):
         dic_ids_por_termo = {}
         for str_term, obj_term in self.dic_index.items():
             dic_ids_por_termo[obj_term.term_id] = str_term
+            # as posições são recalculadas a partir do novo arquivo de índice
+            obj_term.term_file_start_pos = None
+            obj_term.doc_count_with_term = None
+
+        # navega nas ocorrencias para atualizar cada termo em dic_ids_por_termo
+        # apropriadamente
+        # TermFilePosition: term_id: int, term_file_start_pos, doc_count_with_term
+        # na mesma passada, as normas dos documentos são acumuladas a cada termo concluído
+        stats_builder = DocumentStatsBuilder(self)
+        postings = Postings(None)
+        rec_size = TermOccurrence.STRUCT.size
+        seek_file = 0
+        last_term_id = None
+        obj_term = None
+        for doc_id, term_id, term_freq in self.iter_file(
+            f"{self.str_idx_file_name}_{self.idx_file_counter}"
+        ):
+            if term_id != last_term_id:
+                # as ocorrências estão ordenadas por termo: a primeira de cada termo marca sua posição
+                if len(postings):
+                    stats_builder.add_postings(postings.doc_ids, postings.term_freqs)
+                    postings = Postings(None)
+                obj_term = self.dic_index[dic_ids_por_termo[term_id]]
+                obj_term.term_file_start_pos = seek_file
+                obj_term.doc_count_with_term = 0
+                last_term_id = term_id
+            obj_term.doc_count_with_term += 1
+            postings.append(doc_id, term_freq)
+            seek_file += rec_size
+        if len(postings):
+            stats_builder.add_postings(postings.doc_ids, postings.term_freqs)
+        # são gravadas ao lado do índice exportado por write (ver index/wikipedia_indexer.py)
+        self.document_stats = stats_builder.build()
+
+    def open_for_serving(self):
+        """
+        Modo somente leitura para consultas: mapeia o arquivo de índice final em memória uma única vez.
+        Como finish_indexing registra a posição inicial e a quantidade de ocorrências de cada termo,
+        as ocorrências de um termo passam a ser obtidas por uma fatia do mapeamento,
+        sem abrir o arquivo ou fazer chamadas de sistema por registro.
+        """
+        self.close()
+        str_file_name = f"{self.str_idx_file_name}_{self.idx_file_counter}"
+        if path.getsize(str_file_name) == 0:
+            # não é possível mapear um arquivo vazio
+            self.view_postings = memoryview(b"")
+            return
+        with open(str_file_name, "rb") as idx_file:
+            self.mm_postings = mmap.mmap(idx_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view_postings = memoryview(self.mm_postings)
+
+    def close(self):
+        if self.view_postings is not None:
+            self.view_postings.release()
+            self.view_postings = None
+        if self.mm_postings is not None:
+            self.mm_postings.close()
+            self.mm_postings = None
+
+    @property
+    def is_serving(self) -> bool:
+        return self.view_postings is not None
 
-        with open(
-            f"{self.str_idx_file_name}_{self.idx_file_counter}", "rb"
-        ) as idx_file:
-            # navega nas ocorrencias para atualizar cada termo em dic_ids_por_termo
-            # apropriadamente
-
-            # TermFilePosition: term_id: int, term_file_start_pos, doc_count_with_term
-            next_from_file = self.next_from_file(idx_file)
-            seek_file = 0
-            while next_from_file is not None:
-                next_term = dic_ids_por_termo[next_from_file.term_id]
-                qtde = self.dic_index[next_term].doc_count_with_term
-                if qtde is None:
-                    qtde = 0
-                self.dic_index[next_term].doc_count_with_term = qtde + 1
-
-                if self.dic_index[next_term].term_file_start_pos is None:
-                    self.dic_index[next_term].term_file_start_pos = seek_file
-                next_from_file = self.next_from_file(idx_file)
-                # occur_idx_file_0 = 376 bytes  para 4 itens, logo cada registro tem 94 bytes
-                seek_file = seek_file + 12
-        # self.write("wiki.idx")
+    def get_postings_buffer(self, term: str) -> memoryview:
+        """
+        Retorna, sem cópia, a fatia do arquivo mapeado com as ocorrências do termo (requer open_for_serving)
+        """
+        if term not in self.dic_index:
+            return memoryview(b"")
+        obj_term = self.dic_index[term]
+        if obj_term.doc_count_with_term is None:
+            return memoryview(b"")
+        start = obj_term.term_file_start_pos
+        return self.view_postings[
+            start : start + obj_term.doc_count_with_term * TermOccurrence.STRUCT.size
+        ]
 
     def get_occurrence_list(self, term: str) -> List:
+        if self.is_serving:
+            return TermOccurrence.unpack_many(self.get_postings_buffer(term))
+
         occurrence_list = []
         if term in self.dic_index.keys():
             term_id = self.dic_index[term].term_id
-            idx_file = open(f"{self.str_idx_file_name}_{self.idx_file_counter}", "rb")
-            idx_file.seek(self.dic_index[term].term_file_start_pos)
-            next = self.next_from_file(idx_file)
-            # enquanto o next tiver o mesmo term_id do passado na busca vai add
-            while next != None and next.term_id == term_id:
-                occurrence_list.append(next)
-                # ja ta em ordem, so chamar a proxima ocorrencia
-                next = self.next_from_file(idx_file)
-
-            # ja add todos
-            idx_file.close()
+            with open(
+                f"{self.str_idx_file_name}_{self.idx_file_counter}", "rb"
+            ) as idx_file:
+                idx_file.seek(self.dic_index[term].term_file_start_pos)
+                # não é necessário ler além das ocorrências do termo
+                block_size = min(
+                    self.read_block_size,
+                    self.dic_index[term].doc_count_with_term
+                    * TermOccurrence.STRUCT.size,
+                )
+                # enquanto a ocorrência tiver o mesmo term_id do passado na busca vai add
+                for occur in OccurrenceBlockReader(idx_file, block_size):
+                    if occur.term_id != term_id:
+                        break
+                    occurrence_list.append(occur)
         else:
             pass  # se nao ta no dicionario, o termo nao ocorre no arquivo
         return occurrence_list
 
+    def get_postings(self, term: str) -> Postings:
+        if term not in self.dic_index:
+            return Postings(None)
+        if self.is_serving:
+            return Postings.from_buffer(
+                self.get_term_id(term), self.get_postings_buffer(term)
+            )
+        return super().get_postings(term)
+
+    def remove_index_files(self):
+        """
+        Remove o arquivo de índice e as runs pendentes (por exemplo, de um shard que já foi combinado)
+        """
+        self.close()
+        self.remove_files(
+            self.lst_run_files
+            + [f"{self.str_idx_file_name}_{self.idx_file_counter}"]
+        )
+        self.lst_run_files = []
+
+    def iter_postings(self):
+        # as ocorrências ainda na memória ou em runs precisam estar no arquivo de índice
+        if self.get_tmp_occur_size() > 0 or self.lst_run_files:
+            self.finish_indexing()
+        # percorre o arquivo de índice uma única vez: as ocorrências já estão agrupadas por termo
+        dic_terms_per_id = {
+            obj_term.term_id: str_term for str_term, obj_term in self.dic_index.items()
+        }
+        postings = None
+        for doc_id, term_id, term_freq in self.iter_file(
+            f"{self.str_idx_file_name}_{self.idx_file_counter}"
+        ):
+            if postings is None or term_id != postings.term_id:
+                if postings is not None:
+                    yield dic_terms_per_id[postings.term_id], postings
+                postings = Postings(term_id)
+            postings.append(doc_id, term_freq)
+        if postings is not None:
+            yield dic_terms_per_id[postings.term_id], postings
+
+    def __setstate__(self, state):
+        """
+        Índices gravados com pickle pela versão anterior não possuem os atributos do merge em runs,
+        do modo de consulta (open_for_serving) nem os parâmetros de leitura e escrita: recebem os valores padrão
+        """
+        lst_occurrences_tmp = state.get("lst_occurrences_tmp")
+        self.tmp_occurrences_limit = (
+            len(lst_occurrences_tmp) - 1
+            if lst_occurrences_tmp
+            else FileIndex.TMP_OCCURRENCES_LIMIT
+        )
+        self.merge_fan_in = FileIndex.MERGE_FAN_IN
+        self.read_block_size = OccurrenceBlockReader.BLOCK_SIZE
+        self.mm_postings = None
+        self.view_postings = None
+        self.lst_run_files = []
+        self.run_counter = 0
+        self.bytes_written = 0
+        self.merge_passes = 0
+        super().__setstate__(state)
+
+    def rebuild_documents(self, set_documents):
+        # as ocorrências de um FileIndex antigo estão em um arquivo externo ao pickle (relativo ao diretório
+        # atual): sem ele, apenas os documentos são registrados
+        if path.exists(f"{self.str_idx_file_name}_{self.idx_file_counter}"):
+            super().rebuild_documents(set_documents)
+            return
+        for doc_id in sorted(set_documents):
+            self.documents.register(doc_id)
+
+    def __getstate__(self):
+        # o mapeamento em memória não é serializável: deve ser reaberto com open_for_serving
+        dic_state = self.__dict__.copy()
+        dic_state["mm_postings"] = None
+        dic_state["view_postings"] = None
+        return dic_state
+
     def document_count_with_term(self, term: str) -> int:
         if term in self.dic_index:
             return self.dic_index[term].doc_count_with_term
@@ -1,14 +1,40 @@
-from indexer import HTMLIndexer, Cleaner
-from structure import FileIndex
+from index.indexer import HTMLIndexer, Cleaner
+from index.structure import FileIndex
+from index.segments import SegmentedIndex
+import sys
+
+# execute a partir da raiz do repositório: python -m index.wikipedia_indexer
+# indexação incremental em wiki_segments: python -m index.wikipedia_indexer update
+# compactação dos segmentos de wiki_segments: python -m index.wikipedia_indexer compact
 
 if __name__ == "__main__":
+    str_command = sys.argv[1] if len(sys.argv) > 1 else "index"
+    if str_command == "compact":
+        with SegmentedIndex("wiki_segments") as segmented_index:
+            segmented_index.compact()
+        sys.exit()
+
     HTMLIndexer.cleaner = Cleaner(
         stop_words_file="stopwords.txt",
         language="portuguese",
         perform_stop_words_removal=True,
         perform_accents_removal=True,
         perform_stemming=False,
+        fast_html_extraction=True,
+        fast_tokenizer=True,
     )
-    obj_index = FileIndex()
-    html_indexer = HTMLIndexer(obj_index)
-    html_indexer.index_text_dir("./wiki")
+    if str_command == "update":
+        html_indexer = HTMLIndexer(None)
+        with SegmentedIndex("wiki_segments") as segmented_index:
+            int_new, int_changed, int_removed = html_indexer.update_text_dir(
+                "./wiki", segmented_index
+            )
+        print(f"Novos: {int_new} Alterados: {int_changed} Removidos: {int_removed}")
+    else:
+        obj_index = FileIndex()
+        html_indexer = HTMLIndexer(obj_index)
+        html_indexer.index_text_dir("./wiki")
+        # exporta no formato em disco lido pelas consultas (ver Index.read), com as estatísticas
+        # dos documentos calculadas em finish_indexing ao lado (wiki.idx.stats)
+        obj_index.write("wiki.idx")
+        obj_index.remove_index_files()
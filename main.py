@@ -1,3 +1,5 @@
 from query.processing import QueryRunner
+import sys
 
-QueryRunner.main()
+# o índice pode ser informado: python main.py wiki.idx (ver QueryRunner.default_index_path)
+QueryRunner.main(sys.argv[1] if len(sys.argv) > 1 else None)
@@ -0,0 +1,260 @@
+"""
+Linguagem de consulta booleana: termos combinados por AND, OR e NOT (em maiúsculas), com parênteses.
+A precedência é NOT > AND > OR. Termos entre aspas são sempre termos, mesmo que sejam AND, OR ou NOT.
+Termos adjacentes sem operador explícito são combinados pelo operador padrão (ver BooleanQueryParser).
+
+    belo horizonte                  operador padrão entre os dois termos
+    (belo OR "são paulo") AND NOT irlanda
+
+Cada termo passa pela mesma normalização do texto indexado (Cleaner.preprocess_text): termos descartados
+(por exemplo, stop words) são ignorados e um texto que gera vários termos (como uma frase entre aspas)
+equivale ao AND desses termos, pois o índice não guarda a posição das ocorrências.
+
+A consulta é avaliada sobre as listas de doc_ids ordenadas do índice (ver BooleanQueryPlanner).
+"""
+from typing import List, Sequence
+import re
+
+from index.structure import Index
+from index.indexer import Cleaner
+from query.ranking_models import BooleanRankingModel, OPERATOR
+
+
+class QueryNode:
+    def __eq__(self, other) -> bool:
+        return type(self) is type(other) and vars(self) == vars(other)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({', '.join(repr(value) for value in vars(self).values())})"
+
+
+class TermNode(QueryNode):
+    def __init__(self, term: str):
+        self.term = term
+
+
+class NotNode(QueryNode):
+    def __init__(self, child: QueryNode):
+        self.child = child
+
+
+class AndNode(QueryNode):
+    def __init__(self, lst_children: List[QueryNode]):
+        self.lst_children = lst_children
+
+
+class OrNode(QueryNode):
+    def __init__(self, lst_children: List[QueryNode]):
+        self.lst_children = lst_children
+
+
+class BooleanQueryParser:
+    """
+    Converte o texto da consulta em uma árvore de QueryNode (None se nenhum termo restar após a normalização).
+    default_operator: operador entre termos adjacentes sem operador explícito
+    """
+
+    # parênteses, texto entre aspas ou uma palavra (qualquer sequência sem espaços, aspas e parênteses)
+    TOKEN_PATTERN = re.compile(r'\s*(?:(\()|(\))|"([^"]*)"|([^\s()"]+)|("))')
+    OPERATORS = {"AND", "OR", "NOT"}
+
+    def __init__(self, cleaner: Cleaner, default_operator: OPERATOR = OPERATOR.AND):
+        self.cleaner = cleaner
+        self.default_operator = default_operator
+
+    def tokenize(self, str_query: str) -> List[tuple]:
+        """
+        Lista de tokens (tipo, texto), em que o tipo é "(", ")", um dos OPERATORS ou "TERM"
+        """
+        lst_tokens = []
+        for match in BooleanQueryParser.TOKEN_PATTERN.finditer(str_query.rstrip()):
+            open_paren, close_paren, quoted, word, unclosed_quote = match.groups()
+            if unclosed_quote is not None:
+                raise ValueError(f"Aspas sem fechamento na consulta: {str_query}")
+            if open_paren or close_paren:
+                lst_tokens.append((open_paren or close_paren, None))
+            elif quoted is not None:
+                lst_tokens.append(("TERM", quoted))
+            elif word in BooleanQueryParser.OPERATORS:
+                lst_tokens.append((word, None))
+            else:
+                lst_tokens.append(("TERM", word))
+        return lst_tokens
+
+    def parse(self, str_query: str) -> QueryNode:
+        self.lst_tokens = self.tokenize(str_query)
+        self.position = 0
+        if not self.lst_tokens:
+            return None
+        node = self.parse_or()
+        if self.position < len(self.lst_tokens):
+            raise ValueError(
+                f"Token inesperado na consulta: {self.lst_tokens[self.position][0]} ({str_query})"
+            )
+        return node
+
+    def next_type(self) -> str:
+        if self.position < len(self.lst_tokens):
+            return self.lst_tokens[self.position][0]
+        return None
+
+    def starts_operand(self) -> bool:
+        return self.next_type() in ("TERM", "(", "NOT")
+
+    def parse_or(self) -> QueryNode:
+        lst_children = [self.parse_and()]
+        while self.next_type() == "OR" or (
+            self.default_operator == OPERATOR.OR and self.starts_operand()
+        ):
+            if self.next_type() == "OR":
+                self.position += 1
+            lst_children.append(self.parse_and())
+        return BooleanQueryParser.combine(OrNode, lst_children)
+
+    def parse_and(self) -> QueryNode:
+        lst_children = [self.parse_not()]
+        while self.next_type() == "AND" or (
+            self.default_operator == OPERATOR.AND and self.starts_operand()
+        ):
+            if self.next_type() == "AND":
+                self.position += 1
+            lst_children.append(self.parse_not())
+        return BooleanQueryParser.combine(AndNode, lst_children)
+
+    def parse_not(self) -> QueryNode:
+        if self.next_type() == "NOT":
+            self.position += 1
+            child = self.parse_not()
+            return NotNode(child) if child is not None else None
+        return self.parse_operand()
+
+    def parse_operand(self) -> QueryNode:
+        token_type = self.next_type()
+        if token_type == "(":
+            self.position += 1
+            node = self.parse_or()
+            if self.next_type() != ")":
+                raise ValueError("Parêntese sem fechamento na consulta")
+            self.position += 1
+            return node
+        if token_type == "TERM":
+            str_text = self.lst_tokens[self.position][1]
+            self.position += 1
+            return BooleanQueryParser.combine(
+                AndNode, [TermNode(term) for term in self.cleaner.preprocess_text(str_text)]
+            )
+        raise ValueError(f"Esperava-se um termo na consulta, encontrado: {token_type or 'fim da consulta'}")
+
+    @staticmethod
+    def combine(node_class, lst_children: List[QueryNode]) -> QueryNode:
+        """
+        Nó `node_class` com os filhos não descartados (None): o próprio filho, se restar apenas um,
+        ou None, se nenhum restar
+        """
+        lst_children = [child for child in lst_children if child is not None]
+        if not lst_children:
+            return None
+        if len(lst_children) == 1:
+            return lst_children[0]
+        return node_class(lst_children)
+
+
+class BooleanQueryPlanner:
+    """
+    Avalia uma árvore de QueryNode sobre `index`, retornando os doc_ids em ordem crescente.
+
+    Antes da avaliação, a árvore é simplificada (ver optimize): AND e OR aninhados são achatados,
+    NOT NOT x vira x e NOT (x OR y) vira NOT x AND NOT y. A quantidade estimada de documentos de cada nó
+    (ver estimate) define a ordem de avaliação:
+        AND  os operandos positivos, do menor para o maior, são intersectados (ver
+             BooleanRankingModel.intersect_sorted) e a avaliação para assim que não restar nenhum
+             candidato; os operandos NOT são então subtraídos do conjunto de candidatos
+             (ver BooleanRankingModel.difference_sorted)
+        OR   as listas dos operandos são intercaladas (ver BooleanRankingModel.iter_union_sorted)
+        NOT  fora de um AND, é a diferença em relação a todos os documentos do índice
+    """
+
+    def __init__(self, index: Index):
+        self.index = index
+        self.lst_all_doc_ids = None
+
+    def all_doc_ids(self) -> List[int]:
+        if self.lst_all_doc_ids is None:
+            self.lst_all_doc_ids = sorted(self.index.documents)
+        return self.lst_all_doc_ids
+
+    def optimize(self, node: QueryNode) -> QueryNode:
+        if isinstance(node, NotNode):
+            child = self.optimize(node.child)
+            if isinstance(child, NotNode):
+                return child.child
+            if isinstance(child, OrNode):
+                return self.optimize(AndNode([NotNode(grandchild) for grandchild in child.lst_children]))
+            return NotNode(child)
+        if isinstance(node, (AndNode, OrNode)):
+            lst_children = []
+            for child in map(self.optimize, node.lst_children):
+                if type(child) is type(node):
+                    lst_children.extend(child.lst_children)
+                else:
+                    lst_children.append(child)
+            return type(node)(lst_children)
+        return node
+
+    def estimate(self, node: QueryNode) -> int:
+        """
+        Quantidade estimada (limite superior) de documentos que satisfazem `node`
+        """
+        if isinstance(node, TermNode):
+            return self.index.document_count_with_term(node.term)
+        if isinstance(node, NotNode):
+            return self.index.document_count - self.estimate(node.child)
+        if isinstance(node, AndNode):
+            return min(self.estimate(child) for child in node.lst_children)
+        return min(
+            self.index.document_count,
+            sum(self.estimate(child) for child in node.lst_children),
+        )
+
+    def evaluate(self, node: QueryNode) -> List[int]:
+        if node is None:
+            return []
+        return list(self.evaluate_node(self.optimize(node)))
+
+    def evaluate_node(self, node: QueryNode) -> Sequence[int]:
+        if isinstance(node, TermNode):
+            return self.index.get_postings(node.term).doc_ids
+        if isinstance(node, NotNode):
+            return BooleanRankingModel.difference_sorted(
+                self.all_doc_ids(), self.evaluate_node(node.child)
+            )
+        if isinstance(node, OrNode):
+            return list(
+                BooleanRankingModel.iter_union_sorted(
+                    [self.evaluate_node(child) for child in node.lst_children]
+                )
+            )
+
+        lst_positive = sorted(
+            (child for child in node.lst_children if not isinstance(child, NotNode)),
+            key=self.estimate,
+        )
+        lst_negative = sorted(
+            (child.child for child in node.lst_children if isinstance(child, NotNode)),
+            key=self.estimate,
+        )
+        candidates = self.all_doc_ids() if not lst_positive else None
+        for child in lst_positive:
+            doc_ids = self.evaluate_node(child)
+            candidates = (
+                doc_ids
+                if candidates is None
+                else BooleanRankingModel.intersect_sorted([candidates, doc_ids])
+            )
+            if not candidates:
+                return []
+        for child in lst_negative:
+            candidates = BooleanRankingModel.difference_sorted(candidates, self.evaluate_node(child))
+            if not candidates:
+                return []
+        return candidates
@@ -6,17 +6,26 @@ from query.ranking_models import (
     VectorRankingModel,
     IndexPreComputedVals,
     BooleanRankingModel,
+    BM25RankingModel,
     OPERATOR,
 )
-from index.structure import Index, TermOccurrence
+from query.boolean_query import BooleanQueryParser, BooleanQueryPlanner
+from query.pruning import WandRetriever
+from index.structure import Index, TermOccurrence, Postings
 from index.indexer import Cleaner
+from index.segments import SegmentedIndex
 
 
 class QueryRunner:
+    # quantidade de documentos retornados por runQuery
+    TOP_K = 50
+
     def __init__(self, ranking_model: RankingModel, index: Index, cleaner: Cleaner):
         self.ranking_model = ranking_model
         self.index = index
         self.cleaner = cleaner
+        # top k com poda dinâmica (ver query.pruning), criado na primeira consulta com k
+        self.retriever = None
 
     def get_relevance_per_query(self) -> Dict[str, Set[int]]:
         """
@@ -83,24 +92,50 @@ class QueryRunner:
         """
         return {term: self.index.get_occurrence_list(term) for term in terms}
 
-    def get_docs_term(self, query: str) -> List[int]:
+    def get_postings_per_term(self, terms: List) -> Mapping[str, Postings]:
+        """
+        Mesmo que get_occurrence_list_per_term, com as ocorrências de cada termo em arrays (ver Index.get_postings)
+        """
+        return {term: self.index.get_postings(term) for term in terms}
+
+    def get_docs_term(self, query: str, k: int = None) -> List[int]:
         """
         A partir do indice, retorna a lista de ids de documentos desta consulta
-        usando o modelo especificado pelo atributo ranking_model
+        usando o modelo especificado pelo atributo ranking_model (somente os k primeiros, caso k seja informado).
+        Com k, os modelos vetorial e BM25 pontuam apenas os documentos que podem entrar no top k (ver WandRetriever):
+        somente os pesos desses documentos são retornados.
         """
+        if isinstance(self.ranking_model, BooleanRankingModel):
+            return self.get_docs_boolean_query(query, k)
+
         # Obtenha, para cada termo da consulta, sua ocorrencia por meio do método get_query_term_occurence
         dic_query_occur = self.get_query_term_occurence(query)
 
-        # obtenha a lista de ocorrencia dos termos da consulta
-        dic_occur_per_term_query = self.get_occurrence_list_per_term(
+        # com k, os modelos de pesos aditivos por termo pulam as ocorrências que não podem entrar no top k
+        if k is not None and isinstance(self.ranking_model, (VectorRankingModel, BM25RankingModel)):
+            if self.retriever is None:
+                self.retriever = WandRetriever(self.ranking_model, self.index)
+            return self.retriever.get_ordered_docs(dic_query_occur, k)
+
+        # obtenha as ocorrencias dos termos da consulta
+        dic_postings_per_term_query = self.get_postings_per_term(
             self.cleaner.preprocess_text(query)
         )
 
-        # utilize o ranking_model para retornar o documentos ordenados considrando dic_query_occur e dic_occur_per_term_query
-        return self.ranking_model.get_ordered_docs(
-            dic_query_occur, dic_occur_per_term_query
+        # utilize o ranking_model para retornar o documentos ordenados considrando dic_query_occur e dic_postings_per_term_query
+        return self.ranking_model.get_ordered_docs_from_postings(
+            dic_query_occur, dic_postings_per_term_query, k
         )
 
+    def get_docs_boolean_query(self, query: str, k: int = None) -> List[int]:
+        """
+        Avalia a consulta na linguagem booleana (ver query.boolean_query). O operador do BooleanRankingModel
+        é usado entre os termos sem operador explícito. Os documentos são retornados em ordem de doc_id.
+        """
+        parser = BooleanQueryParser(self.cleaner, self.ranking_model.operator)
+        doc_ids = BooleanQueryPlanner(self.index).evaluate(parser.parse(query))
+        return doc_ids[:k], None
+
     @staticmethod
     def runQuery(
         query: str,
@@ -125,25 +160,46 @@ class QueryRunner:
         time_checker.print_delta("Query Creation")
 
         # Utilize o método get_docs_term para obter a lista de documentos que responde esta consulta
-        resposta, _ = qr.get_docs_term(query)
-        time_checker.print_delta("anwered with {len(respostas)} docs")
+        # a precisão e a revocação são calculadas até o top 50: apenas esses documentos são selecionados
+        resposta, _ = qr.get_docs_term(query, k=QueryRunner.TOP_K)
+        time_checker.print_delta(f"anwered with {len(resposta)} docs")
 
         # nesse if, vc irá verificar se o termo possui documentos relevantes associados a ele
         # se possuir, vc deverá calcular a Precisao e revocação nos top 5, 10, 20, 50.
         # O for que fiz abaixo é só uma sugestao e o metododo countTopNRelevants podera auxiliar no calculo da revocacao e precisao
         key_query = query.lower().replace(" ", "_")
         if key_query in map_relevantes.keys():
+            # os documentos relevantes são identificados pelo nome original (ver DocumentRegistry.name)
+            lst_doc_names = [indice.documents.name(doc_id) for doc_id in resposta]
             arr_top = [5, 10, 20, 50]
             for n in arr_top:
-                precisao, revocacao = qr.compute_precision_recall(n, resposta, map_relevantes[key_query])
+                precisao, revocacao = qr.compute_precision_recall(n, lst_doc_names, map_relevantes[key_query])
                 print(f"Precisao {n}: {precisao}")
                 print(f"Recall {n}: {revocacao}")
             print(resposta[:10])
 
+    # índice incremental (ver index/wikipedia_indexer.py update) e índice completo
+    SEGMENTED_INDEX_DIR = "wiki_segments"
+    INDEX_FILE = "wiki.idx"
+
+    @staticmethod
+    def default_index_path() -> str:
+        """
+        O índice incremental, se existir (com os segmentos e as remoções gravados por update e compact),
+        ou o índice completo
+        """
+        if SegmentedIndex.is_segmented_index(QueryRunner.SEGMENTED_INDEX_DIR):
+            return QueryRunner.SEGMENTED_INDEX_DIR
+        return QueryRunner.INDEX_FILE
+
     @staticmethod
-    def main():
-        index = Index()
-        index = index.read("wiki.idx")
+    def main(str_index: str = None):
+        # wiki.idx é gravado no formato em disco (ver index/wikipedia_indexer.py) e aberto como um DiskIndex,
+        # que lê as ocorrências de cada termo diretamente do arquivo mapeado em memória;
+        # wiki_segments é aberto como um SegmentedIndex (ver Index.read)
+        str_index = str_index if str_index is not None else QueryRunner.default_index_path()
+        print(f"Índice: {str_index}")
+        index = Index.read(str_index)
 
         check_time = CheckTime()
         cleaner = Cleaner(
@@ -152,19 +208,20 @@ class QueryRunner:
             perform_stop_words_removal=True,
             perform_accents_removal=True,
             perform_stemming=False,
+            # mesma configuração usada na indexação (index/wikipedia_indexer.py)
+            fast_tokenizer=True,
         )
-        precomput = IndexPreComputedVals(index)
-        check_time.print_delta("Precomputou valores")
 
         tipo = -1
         while True:
             try:
                 tipo = int(
                     input(
-                        "Escolha seu RankingModel, digite o número correspondente\n0 - Boolean\n1 - VectorModel\n"
+                        "Escolha seu RankingModel, digite o número correspondente\n0 - Boolean\n1 - VectorModel\n2 - BM25\n"
+                        "3 - VectorModel e BM25 (comparação)\n"
                     )
                 )
-                if tipo != 0 and tipo != 1:
+                if tipo not in (0, 1, 2, 3):
                     print("Entrada inválida, tente novamente\n")
                 break
             except Exception as e:
@@ -175,7 +232,10 @@ class QueryRunner:
             while True:
                 try:
                     operator = int(
-                        input("Escolha o operador do seu RankingModel\n1 - AND\n2 - OR\n")
+                        input(
+                            "Escolha o operador entre os termos sem operador explícito\n1 - AND\n2 - OR\n"
+                            "(a consulta também aceita AND, OR, NOT, parênteses e termos entre aspas)\n"
+                        )
                     )
                     if operator != 1 and operator != 2:
                         print("Entrada inválida, tente novamente\n")
@@ -183,16 +243,29 @@ class QueryRunner:
                 except Exception as e:
                     print("Entrada inválida, tente novamente\n", e)
                     continue
-            ranking_model = BooleanRankingModel(OPERATOR(operator))
+            lst_ranking_models = [BooleanRankingModel(OPERATOR(operator))]
         else:
-            ranking_model = VectorRankingModel(precomput)
+            lst_ranking_models = []
+            if tipo in (1, 3):
+                # as normas dos documentos só são necessárias para o modelo vetorial
+                precomput = IndexPreComputedVals(index)
+                check_time.print_delta("Precomputou valores")
+                lst_ranking_models.append(VectorRankingModel(precomput))
+            if tipo in (2, 3):
+                lst_ranking_models.append(BM25RankingModel(index))
+                check_time.print_delta("Precomputou tamanhos normalizados (BM25)")
         query = ""
         while True:
             try:
                 query = str(input("Faça sua consulta\n"))
-                break
             except Exception as e:
                 print("Entrada inválida, tente novamente\n", e)
                 continue
-
-        QueryRunner.runQuery(query, index, cleaner, ranking_model)
+            try:
+                for ranking_model in lst_ranking_models:
+                    print(f"===== {type(ranking_model).__name__} =====")
+                    QueryRunner.runQuery(query, index, cleaner, ranking_model)
+                break
+            except ValueError as e:
+                # consulta booleana malformada (ver BooleanQueryParser)
+                print("Consulta inválida, tente novamente\n", e)
@@ -0,0 +1,247 @@
+"""
+Seleção dos k documentos mais relevantes documento a documento (DAAT) com poda dinâmica (WAND e Block-Max WAND).
+
+O peso de um termo em um documento é `peso do termo na consulta x peso da ocorrência`
+(ver RankingModel.query_term_weight e RankingModel.posting_scores). Para cada termo são mantidos o maior
+peso de suas ocorrências e, opcionalmente, o maior peso de cada bloco de BLOCK_SIZE ocorrências.
+Um documento só é pontuado se a soma desses limites superiores puder superar o k-ésimo maior peso
+encontrado até então; as ocorrências dos demais documentos são puladas. O resultado é o mesmo top k da
+pontuação exaustiva do modelo (get_ordered_docs_from_postings).
+"""
+from typing import List, Mapping, Tuple
+from array import array
+from bisect import bisect_left
+from operator import attrgetter
+import heapq
+import math
+
+from index.structure import Index, TermOccurrence
+from query.ranking_models import RankingModel
+
+
+class TermBounds:
+    """
+    Pesos das ocorrências de um termo (sem o peso da consulta) e seus limites superiores:
+    o maior peso do termo e, para cada bloco de `block_size` ocorrências, o maior peso e o último doc_id
+    """
+
+    def __init__(self, doc_ids: array, arr_scores: array, block_size: int):
+        self.doc_ids = doc_ids
+        self.arr_scores = arr_scores
+        self.max_score = max(arr_scores, default=0.0)
+        self.block_size = block_size
+        self.arr_block_max = array(
+            "d",
+            (
+                max(arr_scores[start : start + block_size])
+                for start in range(0, len(arr_scores), block_size)
+            ),
+        )
+        self.arr_block_last = array(
+            "I",
+            (
+                doc_ids[min(start + block_size, len(doc_ids)) - 1]
+                for start in range(0, len(doc_ids), block_size)
+            ),
+        )
+
+
+class TermCursor:
+    """
+    Posição atual na lista de ocorrências de um termo da consulta
+    """
+
+    __slots__ = (
+        "bounds",
+        "query_weight",
+        "max_score",
+        "position",
+        "doc_id",
+        "block_first",
+        "block_last",
+        "block_max",
+    )
+
+    def __init__(self, bounds: TermBounds, query_weight: float):
+        self.bounds = bounds
+        self.query_weight = query_weight
+        self.max_score = query_weight * bounds.max_score
+        self.position = 0
+        self.doc_id = bounds.doc_ids[0]
+        # último bloco consultado em block_bound: doc_ids no intervalo (block_first, block_last]
+        self.block_first = self.block_last = -1
+        self.block_max = 0.0
+
+    def score(self) -> float:
+        return self.query_weight * self.bounds.arr_scores[self.position]
+
+    def next(self):
+        self.position += 1
+        doc_ids = self.bounds.doc_ids
+        self.doc_id = doc_ids[self.position] if self.position < len(doc_ids) else None
+
+    def seek(self, doc_id: int) -> int:
+        """
+        Avança até a primeira ocorrência com doc_id >= `doc_id`. Retorna a quantidade de ocorrências puladas.
+        """
+        doc_ids = self.bounds.doc_ids
+        position = bisect_left(doc_ids, doc_id, self.position)
+        int_skipped = position - self.position
+        self.position = position
+        self.doc_id = doc_ids[position] if position < len(doc_ids) else None
+        return int_skipped
+
+    def block_bound(self, doc_id: int) -> Tuple[float, int]:
+        """
+        Limite superior do peso do termo no bloco que pode conter `doc_id` (a partir da posição atual)
+        e o último doc_id desse bloco
+        """
+        if self.block_first < doc_id <= self.block_last:
+            return self.block_max, self.block_last
+        bounds = self.bounds
+        block = bisect_left(bounds.arr_block_last, doc_id, self.position // bounds.block_size)
+        if block >= len(bounds.arr_block_last):
+            return 0.0, doc_id
+        self.block_first = bounds.arr_block_last[block - 1] if block > 0 else 0
+        self.block_last = bounds.arr_block_last[block]
+        self.block_max = self.query_weight * bounds.arr_block_max[block]
+        return self.block_max, self.block_last
+
+
+class WandRetriever:
+    """
+    Top k de um RankingModel com pesos aditivos por termo (VectorRankingModel ou BM25RankingModel) sobre `index`.
+    Os limites de cada termo são calculados na primeira consulta que o utiliza e mantidos em memória.
+    block_max: usa também os limites por bloco (Block-Max WAND)
+    """
+
+    BLOCK_SIZE = 128
+    # folga no limite superior de mais de um termo, para que erros de arredondamento da soma não descartem
+    # um documento
+    BOUND_SLACK = 1e-12
+
+    def __init__(
+        self,
+        ranking_model: RankingModel,
+        index: Index,
+        block_max: bool = True,
+        block_size: int = None,
+    ):
+        self.ranking_model = ranking_model
+        self.index = index
+        self.block_max = block_max
+        self.block_size = block_size if block_size is not None else WandRetriever.BLOCK_SIZE
+        self.dic_bounds = {}
+        # estatísticas da última consulta
+        self.postings_total = 0
+        self.postings_scored = 0
+        self.postings_skipped = 0
+
+    def get_bounds(self, term: str) -> TermBounds:
+        if term not in self.dic_bounds:
+            # os cursores avançam por busca binária: as ocorrências precisam estar em ordem de doc_id
+            postings = self.index.get_postings(term).sorted_by_doc_id()
+            self.dic_bounds[term] = TermBounds(
+                postings.doc_ids, self.ranking_model.posting_scores(postings), self.block_size
+            )
+        return self.dic_bounds[term]
+
+    def entry_cutoff(self, threshold: float, int_terms: int) -> float:
+        """
+        Valor que a soma dos limites superiores de `int_terms` termos precisa superar para que um documento
+        possa entrar no top k, cujo menor peso é `threshold`.
+        Os documentos são processados em ordem de doc_id: um empate (ver RankingModel.rank_document_ids)
+        é sempre perdido pelo documento novo, logo o peso precisa ser maior que o do k-ésimo. O limite de um
+        único termo é exato; uma soma de limites pode diferir da soma dos pesos por erros de arredondamento.
+        """
+        if int_terms == 1:
+            return threshold
+        return threshold - self.BOUND_SLACK * (abs(threshold) + 1)
+
+    def get_ordered_docs(
+        self, query: Mapping[str, TermOccurrence], k: int
+    ) -> (List[int], Mapping[int, float]):
+        """
+        Retorna os k documentos de maior peso (na ordem de RankingModel.rank_document_ids) e seus pesos
+        """
+        lst_cursors = []
+        for term, occur in query.items():
+            if term not in self.index.dic_index:
+                continue
+            bounds = self.get_bounds(term)
+            if len(bounds.doc_ids):
+                lst_cursors.append(
+                    TermCursor(bounds, self.ranking_model.query_term_weight(occur.term_freq))
+                )
+        self.postings_total = sum(len(cursor.bounds.doc_ids) for cursor in lst_cursors)
+        self.postings_scored = 0
+        self.postings_skipped = 0
+        if k <= 0:
+            return [], {}
+
+        by_doc_id = attrgetter("doc_id")
+        # heap com os k melhores: a raiz é o pior (menor peso e, no empate, maior doc_id)
+        lst_heap = []
+        # enquanto o heap não estiver cheio, qualquer documento entra
+        # (ver entry_cutoff: limites de um termo e de mais de um termo)
+        cutoff_single = cutoff = -math.inf
+        while lst_cursors:
+            lst_cursors.sort(key=by_doc_id)
+            # pivô: primeiro cursor em que a soma dos limites superiores pode superar o k-ésimo peso
+            bound = 0.0
+            pivot = None
+            for i, cursor in enumerate(lst_cursors):
+                bound += cursor.max_score
+                if bound > (cutoff if i else cutoff_single):
+                    pivot = i
+                    break
+            if pivot is None:
+                break
+            pivot_doc = lst_cursors[pivot].doc_id
+            while pivot + 1 < len(lst_cursors) and lst_cursors[pivot + 1].doc_id == pivot_doc:
+                pivot += 1
+
+            if self.block_max and cutoff > -math.inf:
+                # limites dos blocos que podem conter o pivô
+                block_bound = 0.0
+                next_doc = None
+                for cursor in lst_cursors[: pivot + 1]:
+                    cursor_bound, block_last = cursor.block_bound(pivot_doc)
+                    block_bound += cursor_bound
+                    next_doc = block_last if next_doc is None else min(next_doc, block_last)
+                if block_bound <= (cutoff if pivot else cutoff_single):
+                    # nenhum documento até o fim do menor desses blocos pode entrar no top k
+                    next_doc += 1
+                    if pivot + 1 < len(lst_cursors):
+                        next_doc = min(next_doc, lst_cursors[pivot + 1].doc_id)
+                    for cursor in lst_cursors[: pivot + 1]:
+                        self.postings_skipped += cursor.seek(next_doc)
+                    lst_cursors = [cursor for cursor in lst_cursors if cursor.doc_id is not None]
+                    continue
+
+            if lst_cursors[0].doc_id == pivot_doc:
+                # todos os cursores até o pivô estão no documento: pontuação completa
+                score = 0.0
+                for cursor in lst_cursors[: pivot + 1]:
+                    score += cursor.score()
+                    cursor.next()
+                    self.postings_scored += 1
+                entry = (score, -pivot_doc)
+                if len(lst_heap) < k:
+                    heapq.heappush(lst_heap, entry)
+                elif entry > lst_heap[0]:
+                    heapq.heapreplace(lst_heap, entry)
+                if len(lst_heap) == k:
+                    cutoff_single = self.entry_cutoff(lst_heap[0][0], 1)
+                    cutoff = self.entry_cutoff(lst_heap[0][0], 2)
+            else:
+                # os documentos anteriores ao pivô não podem entrar no top k
+                for cursor in lst_cursors[:pivot]:
+                    self.postings_skipped += cursor.seek(pivot_doc)
+            lst_cursors = [cursor for cursor in lst_cursors if cursor.doc_id is not None]
+
+        self.postings_skipped += sum(
+            len(cursor.bounds.doc_ids) - cursor.position for cursor in lst_cursors
+        )
+        documents_weight = {-neg_doc_id: score for score, neg_doc_id in lst_heap}
+        return self.ranking_model.rank_document_ids(documents_weight, k), documents_weight
@@ -1,9 +1,14 @@
 from typing import List
 from abc import abstractmethod
-from typing import List, Set, Mapping
-from index.structure import TermOccurrence
-import math
+from typing import List, Set, Mapping, Sequence, Iterable, Iterator
+from index.structure import TermOccurrence, Postings
+from index.statistics import tf_weight, idf_weight, WeightTable
+from array import array
+from bisect import bisect_left
+from itertools import islice
 from enum import Enum
+import math
+import heapq
 
 
 class IndexPreComputedVals:
@@ -15,28 +20,12 @@ class IndexPreComputedVals:
         """
         Inicializa os atributos por meio do indice (idx):
             doc_count: o numero de documentos que o indice possui
-            document_norm: A norma por documento (cada termo é presentado pelo seu peso (tfxidf))
+            document_norm: A norma por documento (cada termo é presentado pelo seu peso (tfxidf)), indexada pelo doc_id
+        As normas são calculadas ao final da indexação (ver index.statistics) e apenas carregadas aqui;
+        só são recalculadas caso não existam ou estejam desatualizadas em relação ao índice.
         """
-        document_norm = {}
-        doc_count = self.index.document_count
-        for key, entry in self.index.dic_index.items():
-            occ_list = self.index.get_occurrence_list(key)
-            for occ in occ_list:
-                # print(occ)
-                tfxidf = (
-                    VectorRankingModel.tf_idf(
-                        self.index.document_count, occ.term_freq, len(occ_list)
-                    )
-                    ** 2
-                )
-                document_norm[occ.doc_id] = (
-                    document_norm[occ.doc_id] + tfxidf
-                    if occ.doc_id in document_norm
-                    else tfxidf
-                )
-        for doc in document_norm.keys():
-            document_norm[doc] = document_norm[doc] ** 0.5
-        return document_norm, doc_count
+        self.document_stats = self.index.get_document_stats()
+        return self.document_stats.norms, self.document_stats.doc_count
 
 
 class RankingModel:
@@ -45,15 +34,71 @@ class RankingModel:
         self,
         query: Mapping[str, TermOccurrence],
         docs_occur_per_term: Mapping[str, List[TermOccurrence]],
+        k: int = None,
     ) -> (List[int], Mapping[int, float]):
+        """
+        Retorna os documentos ordenados (somente os k primeiros, caso k seja informado) e seus pesos
+        """
         raise NotImplementedError(
             "Voce deve criar uma subclasse e a mesma deve sobrepor este método"
         )
 
-    def rank_document_ids(self, documents_weight):
-        doc_ids = list(documents_weight.keys())
-        doc_ids.sort(key=lambda x: -documents_weight[x])
-        return doc_ids
+    def rank_document_ids(self, documents_weight, k: int = None):
+        """
+        Ordena os doc_ids por peso decrescente e, em caso de empate (pesos exatamente iguais),
+        por doc_id crescente.
+        Com k, somente os k primeiros são selecionados (por meio de um heap, em O(n log k) comparações);
+        sem k, todos são ordenados (por exemplo, para avaliação).
+        """
+
+        def rank_key(doc_id):
+            return (-documents_weight[doc_id], doc_id)
+
+        if k is None or k >= len(documents_weight):
+            return sorted(documents_weight, key=rank_key)
+        if k <= 0:
+            return []
+        # o heap compara apenas os pesos (sem chave); os documentos que empatam com o k-ésimo
+        # são então ordenados pela chave completa
+        min_weight = heapq.nlargest(k, documents_weight.values())[-1]
+        lst_candidates = [
+            doc_id for doc_id, weight in documents_weight.items() if weight >= min_weight
+        ]
+        return sorted(lst_candidates, key=rank_key)[:k]
+
+    def query_term_weight(self, query_term_freq: int) -> float:
+        """
+        Modelos em que o peso de um documento é a soma, para cada termo da consulta, de
+        query_term_weight(frequência do termo na consulta) x posting_scores(ocorrências do termo)[i]
+        podem ser processados com poda dinâmica (ver query.pruning)
+        """
+        raise NotImplementedError(
+            f"{type(self).__name__} não possui pesos aditivos por termo"
+        )
+
+    def posting_scores(self, postings: Postings) -> array:
+        """
+        Peso de cada ocorrência de `postings`, sem o peso do termo na consulta (ver query_term_weight)
+        """
+        raise NotImplementedError(
+            f"{type(self).__name__} não possui pesos aditivos por termo"
+        )
+
+    def get_ordered_docs_from_postings(
+        self,
+        query: Mapping[str, TermOccurrence],
+        postings_per_term: Mapping[str, Postings],
+        k: int = None,
+    ) -> (List[int], Mapping[int, float]):
+        """
+        Mesmo que get_ordered_docs, a partir das ocorrências de cada termo em arrays (ver Index.get_postings).
+        Modelos que processam os arrays diretamente devem sobrepor este método.
+        """
+        return self.get_ordered_docs(
+            query,
+            {term: list(postings) for term, postings in postings_per_term.items()},
+            k,
+        )
 
 
 class OPERATOR(Enum):
@@ -62,75 +107,175 @@ class OPERATOR(Enum):
 
 
 # Atividade 1
+class OccurrenceDocIds:
+    """
+    doc_ids de uma lista de TermOccurrence, acessados por posição (sem copiar a lista), para que ela possa
+    ser percorrida por busca binária como os arrays de Postings
+    """
+
+    def __init__(self, lst_occurrences: List[TermOccurrence]):
+        self.lst_occurrences = lst_occurrences
+
+    def __len__(self) -> int:
+        return len(self.lst_occurrences)
+
+    def __getitem__(self, position: int) -> int:
+        return self.lst_occurrences[position].doc_id
+
+
 class BooleanRankingModel(RankingModel):
+    """
+    As ocorrências de cada termo devem estar em ordem de doc_id (como as obtidas do índice)
+    """
+
     def __init__(self, operator: OPERATOR):
         self.operator = operator
 
+    @staticmethod
+    def galloping_search(doc_ids: Sequence[int], doc_id: int, start: int = 0) -> int:
+        """
+        Primeira posição a partir de `start` com doc_id >= `doc_id` (len(doc_ids) se não houver).
+        Avança em saltos que dobram de tamanho e então faz a busca binária no último salto:
+        o custo é proporcional ao log da distância percorrida, e não ao tamanho da lista.
+        """
+        int_len = len(doc_ids)
+        low, high, step = start, start, 1
+        while high < int_len and doc_ids[high] < doc_id:
+            low = high + 1
+            high += step
+            step <<= 1
+        return bisect_left(doc_ids, doc_id, low, min(high, int_len))
+
+    @staticmethod
+    def intersect_sorted(lst_doc_ids: List[Sequence[int]]) -> List[int]:
+        """
+        Interseção de listas de doc_ids ordenadas. Parte da menor lista e procura cada um de seus
+        doc_ids nas demais, da menor para a maior, por meio de galloping_search: o custo cresce com o
+        tamanho da menor lista (e com o log das demais), e não com o total de ocorrências.
+        """
+        if not lst_doc_ids:
+            return []
+        lst_doc_ids = sorted(lst_doc_ids, key=len)
+        galloping_search = BooleanRankingModel.galloping_search
+        lst_common = list(lst_doc_ids[0])
+        for doc_ids in lst_doc_ids[1:]:
+            if not lst_common or not doc_ids:
+                return []
+            int_len = len(doc_ids)
+            lst_found = []
+            position = 0
+            for doc_id in lst_common:
+                if doc_ids[position] < doc_id:
+                    position = galloping_search(doc_ids, doc_id, position + 1)
+                    if position == int_len:
+                        break
+                if doc_ids[position] == doc_id:
+                    lst_found.append(doc_id)
+                    position += 1
+                    if position == int_len:
+                        break
+            lst_common = lst_found
+        return lst_common
+
+    @staticmethod
+    def difference_sorted(doc_ids: Sequence[int], excluded_doc_ids: Sequence[int]) -> List[int]:
+        """
+        doc_ids (ordenados) que não estão em `excluded_doc_ids` (também ordenados). Cada doc_id é procurado
+        por galloping_search: o custo cresce com o tamanho de `doc_ids`, e não com o de `excluded_doc_ids`.
+        """
+        int_len = len(excluded_doc_ids)
+        if not int_len:
+            return list(doc_ids)
+        lst_remaining = []
+        position = 0
+        for i, doc_id in enumerate(doc_ids):
+            position = BooleanRankingModel.galloping_search(excluded_doc_ids, doc_id, position)
+            if position == int_len:
+                lst_remaining.extend(doc_ids[i:])
+                break
+            if excluded_doc_ids[position] != doc_id:
+                lst_remaining.append(doc_id)
+        return lst_remaining
+
     def intersection_all(
         self, map_lst_occurrences: Mapping[str, List[TermOccurrence]]
     ) -> List[int]:
-        print(f"map_occ: {map_lst_occurrences}")
-        if not map_lst_occurrences:
-            return []
-        first_term = list(map_lst_occurrences)[0]
-        first_list = map_lst_occurrences[first_term]
-        list_id = []
-        for term_occ in first_list:
-            list_id.append(term_occ.doc_id)
-        set_ids = set(list_id)
-        for term, lst_occurrences in map_lst_occurrences.items():
-            # print(lst_occurrences)
-            occ_list = []
-            for term_occ in lst_occurrences:
-                occ_list.append(term_occ.doc_id)
-            set_ids = set_ids.intersection(set(occ_list))
-        print(f"interseção: {set_ids}")
-        return list(set_ids)
+        return BooleanRankingModel.intersect_sorted(
+            [OccurrenceDocIds(lst_occurrences) for lst_occurrences in map_lst_occurrences.values()]
+        )
+
+    @staticmethod
+    def iter_union_sorted(lst_doc_ids: List[Iterable[int]]) -> Iterator[int]:
+        """
+        União de sequências de doc_ids ordenadas, gerada em ordem de doc_id e sem repetições.
+        As sequências são intercaladas por um heap com o próximo doc_id de cada uma (heapq.merge),
+        sem montar conjuntos intermediários: quem consome pode parar assim que tiver o necessário.
+        As repetições só são descartadas corretamente se cada sequência estiver em ordem de doc_id
+        (como as ocorrências obtidas do índice, ver HashIndex).
+        """
+        last_doc_id = None
+        for doc_id in heapq.merge(*lst_doc_ids):
+            if doc_id != last_doc_id:
+                yield doc_id
+                last_doc_id = doc_id
 
     def union_all(
-        self, map_lst_occurrences: Mapping[str, List[TermOccurrence]]
+        self, map_lst_occurrences: Mapping[str, List[TermOccurrence]], limit: int = None
     ) -> List[int]:
-        print(f"map_occ: {map_lst_occurrences}")
-        if not map_lst_occurrences:
-            return []
-        first_term = list(map_lst_occurrences)[0]
-        first_list = map_lst_occurrences[first_term]
-        list_id = []
-        for term_occ in first_list:
-            list_id.append(term_occ.doc_id)
-        set_ids = set(list_id)
-        for term, lst_occurrences in map_lst_occurrences.items():
-            occ_list = []
-            for term_occ in lst_occurrences:
-                occ_list.append(term_occ.doc_id)
-            set_ids = set_ids.union(set(occ_list))
-        print(f"união: {set_ids}")
-        return list(set_ids)
+        """
+        Documentos com algum dos termos, em ordem de doc_id (somente os `limit` primeiros, caso informado)
+        """
+        return list(
+            islice(
+                BooleanRankingModel.iter_union_sorted(
+                    [
+                        (occurrence.doc_id for occurrence in lst_occurrences)
+                        for lst_occurrences in map_lst_occurrences.values()
+                    ]
+                ),
+                limit,
+            )
+        )
 
     def get_ordered_docs(
         self,
         query: Mapping[str, TermOccurrence],
         map_lst_occurrences: Mapping[str, List[TermOccurrence]],
+        k: int = None,
+    ) -> (List[int], Mapping[int, float]):
+        """
+        Considere que map_lst_occurrences possui as ocorrencias apenas dos termos que existem na consulta.
+        Os documentos não possuem peso: são retornados em ordem de doc_id (somente os k primeiros, caso k seja informado).
+        """
+        if self.operator == OPERATOR.AND:
+            return self.intersection_all(map_lst_occurrences)[:k], None
+        return self.union_all(map_lst_occurrences, k), None
+
+    def get_ordered_docs_from_postings(
+        self,
+        query: Mapping[str, TermOccurrence],
+        postings_per_term: Mapping[str, Postings],
+        k: int = None,
     ) -> (List[int], Mapping[int, float]):
-        """Considere que map_lst_occurrences possui as ocorrencias apenas dos termos que existem na consulta"""
+        lst_doc_ids = [postings.doc_ids for postings in postings_per_term.values()]
         if self.operator == OPERATOR.AND:
-            return self.intersection_all(map_lst_occurrences), None
-        else:
-            return self.union_all(map_lst_occurrences), None
+            return BooleanRankingModel.intersect_sorted(lst_doc_ids)[:k], None
+        return list(islice(BooleanRankingModel.iter_union_sorted(lst_doc_ids), k)), None
 
 
 # Atividade 2
 class VectorRankingModel(RankingModel):
     def __init__(self, idx_pre_comp_vals: IndexPreComputedVals):
         self.idx_pre_comp_vals = idx_pre_comp_vals
+        self.tf_weights = WeightTable(tf_weight)
 
     @staticmethod
     def tf(freq_term: int) -> float:
-        return 1 + math.log2(freq_term) if freq_term > 0 else 0.0
+        return tf_weight(freq_term)
 
     @staticmethod
     def idf(doc_count: int, num_docs_with_term: int) -> float:
-        return math.log2(doc_count / num_docs_with_term)
+        return idf_weight(doc_count, num_docs_with_term)
 
     @staticmethod
     def tf_idf(doc_count: int, freq_term: int, num_docs_with_term) -> float:
@@ -143,6 +288,7 @@ class VectorRankingModel(RankingModel):
         self,
         query: Mapping[str, TermOccurrence],
         docs_occur_per_term: Mapping[str, List[TermOccurrence]],
+        k: int = None,
     ) -> (List[int], Mapping[int, float]):
         documents_weight = {}
 
@@ -164,4 +310,149 @@ class VectorRankingModel(RankingModel):
                 )
         # for key, value in documents_weight.items():
         #     documents_weight[key] = value / self.idx_pre_comp_vals.document_norm[key]
-        return self.rank_document_ids(documents_weight), documents_weight
+        return self.rank_document_ids(documents_weight, k), documents_weight
+
+    def query_term_weight(self, query_term_freq: int) -> float:
+        return self.tf(query_term_freq)
+
+    def posting_scores(self, postings: Postings) -> array:
+        # tf x idf do termo no documento x idf do termo na consulta, normalizado pela norma do documento
+        idf = self.idf(self.idx_pre_comp_vals.doc_count, len(postings))
+        idf_square = idf * idf
+        document_norm = self.idx_pre_comp_vals.document_norm
+        get_tf = self.tf_weights.get(max(postings.term_freqs, default=0)).__getitem__
+        return array(
+            "d",
+            (
+                tf * idf_square / document_norm[doc_id]
+                for doc_id, tf in zip(postings.doc_ids, map(get_tf, postings.term_freqs))
+            ),
+        )
+
+    def get_ordered_docs_from_postings(
+        self,
+        query: Mapping[str, TermOccurrence],
+        postings_per_term: Mapping[str, Postings],
+        k: int = None,
+    ) -> (List[int], Mapping[int, float]):
+        """
+        Processamento termo a termo sobre os arrays de ocorrências: o idf e o peso do termo na consulta são
+        calculados uma vez por termo, o tf de cada ocorrência vem de uma tabela e os pesos são somados em
+        um acumulador denso indexado pelo doc_id. A divisão pela norma é feita uma única vez por documento.
+        O resultado é o mesmo de get_ordered_docs.
+        """
+        doc_count = self.idx_pre_comp_vals.doc_count
+        lst_postings = [
+            (query[term].term_freq, postings)
+            for term, postings in postings_per_term.items()
+            if term in query and len(postings)
+        ]
+        if not lst_postings:
+            return [], {}
+        arr_scores = array(
+            "d",
+            bytes(8 * (max(max(postings.doc_ids) for _, postings in lst_postings) + 1)),
+        )
+        set_candidates = set()
+        for query_term_freq, postings in lst_postings:
+            idf = self.idf(doc_count, len(postings))
+            # peso do termo no documento (tf x idf) x peso do termo na consulta
+            term_scale = idf * self.tf(query_term_freq) * idf
+            get_tf = self.tf_weights.get(max(postings.term_freqs)).__getitem__
+            for doc_id, tf in zip(postings.doc_ids, map(get_tf, postings.term_freqs)):
+                arr_scores[doc_id] += tf * term_scale
+            set_candidates.update(postings.doc_ids)
+
+        document_norm = self.idx_pre_comp_vals.document_norm
+        documents_weight = {
+            doc_id: arr_scores[doc_id] / document_norm[doc_id] for doc_id in set_candidates
+        }
+        return self.rank_document_ids(documents_weight, k), documents_weight
+
+
+class BM25RankingModel(RankingModel):
+    """
+    BM25: cada termo da consulta contribui com idf x tf x (k1 + 1) / (tf + k1 x (1 - b + b x tamanho / tamanho médio)).
+    O tamanho de cada documento (total de ocorrências de termos) é o registrado na indexação
+    (ver DocumentRegistry) e a parte do denominador que depende apenas do documento é pré-calculada
+    em um array indexado pelo doc_id. A quantidade de documentos e o tamanho médio vêm das mesmas
+    estatísticas usadas nas normas do modelo vetorial (ver Index.get_document_stats).
+    """
+
+    def __init__(self, index, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        registry = index.documents
+        document_stats = index.get_document_stats()
+        self.doc_count = document_stats.doc_count
+        self.avg_length = document_stats.avg_length
+        self.arr_length_norm = array("d", bytes(8 * (max(registry, default=0) + 1)))
+        for doc_id, length in zip(registry.lst_doc_ids, registry.arr_length):
+            self.arr_length_norm[doc_id] = k1 * (
+                1 - b + b * length / self.avg_length if self.avg_length else 1.0
+            )
+
+    def idf(self, num_docs_with_term: int) -> float:
+        return math.log(
+            (self.doc_count - num_docs_with_term + 0.5) / (num_docs_with_term + 0.5) + 1
+        )
+
+    def query_term_weight(self, query_term_freq: int) -> float:
+        return query_term_freq
+
+    def posting_scores(self, postings: Postings) -> array:
+        term_scale = self.idf(len(postings)) * (self.k1 + 1)
+        arr_length_norm = self.arr_length_norm
+        return array(
+            "d",
+            (
+                term_scale * term_freq / (term_freq + arr_length_norm[doc_id])
+                for doc_id, term_freq in zip(postings.doc_ids, postings.term_freqs)
+            ),
+        )
+
+    def get_ordered_docs(
+        self,
+        query: Mapping[str, TermOccurrence],
+        docs_occur_per_term: Mapping[str, List[TermOccurrence]],
+        k: int = None,
+    ) -> (List[int], Mapping[int, float]):
+        documents_weight = {}
+        arr_length_norm = self.arr_length_norm
+        k1_plus_one = self.k1 + 1
+        for term, occ_list in docs_occur_per_term.items():
+            if term not in query or not occ_list:
+                continue
+            term_scale = query[term].term_freq * self.idf(len(occ_list)) * k1_plus_one
+            for occ in occ_list:
+                weight = term_scale * occ.term_freq / (occ.term_freq + arr_length_norm[occ.doc_id])
+                documents_weight[occ.doc_id] = documents_weight.get(occ.doc_id, 0.0) + weight
+        return self.rank_document_ids(documents_weight, k), documents_weight
+
+    def get_ordered_docs_from_postings(
+        self,
+        query: Mapping[str, TermOccurrence],
+        postings_per_term: Mapping[str, Postings],
+        k: int = None,
+    ) -> (List[int], Mapping[int, float]):
+        """
+        Processamento termo a termo sobre os arrays de ocorrências, acumulando os pesos em um array denso
+        """
+        lst_postings = [
+            (query[term].term_freq, postings)
+            for term, postings in postings_per_term.items()
+            if term in query and len(postings)
+        ]
+        if not lst_postings:
+            return [], {}
+        arr_scores = array("d", bytes(8 * len(self.arr_length_norm)))
+        arr_length_norm = self.arr_length_norm
+        k1_plus_one = self.k1 + 1
+        set_candidates = set()
+        for query_term_freq, postings in lst_postings:
+            term_scale = query_term_freq * self.idf(len(postings)) * k1_plus_one
+            for doc_id, term_freq in zip(postings.doc_ids, postings.term_freqs):
+                arr_scores[doc_id] += term_scale * term_freq / (term_freq + arr_length_norm[doc_id])
+            set_candidates.update(postings.doc_ids)
+        documents_weight = {doc_id: arr_scores[doc_id] for doc_id in set_candidates}
+        return self.rank_document_ids(documents_weight, k), documents_weight
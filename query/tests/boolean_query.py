@@ -0,0 +1,151 @@
+from query.boolean_query import (
+    BooleanQueryParser,
+    BooleanQueryPlanner,
+    TermNode,
+    NotNode,
+    AndNode,
+    OrNode,
+)
+from query.ranking_models import OPERATOR
+from index.structure import HashIndex, CompactHashIndex
+from index.indexer import Cleaner
+from index.index_structure_test import use_temporary_dir
+from random import randrange, seed, shuffle
+import unittest
+
+
+class BooleanQueryTest(unittest.TestCase):
+    def setUp(self):
+        use_temporary_dir(self, ["stopwords.txt"])
+        self.cleaner = Cleaner(
+            stop_words_file="stopwords.txt",
+            language="portuguese",
+            perform_stop_words_removal=True,
+            perform_accents_removal=True,
+            perform_stemming=False,
+        )
+        self.parser = BooleanQueryParser(self.cleaner)
+
+        seed(10)
+        self.dic_docs_per_term = {}
+        self.index = CompactHashIndex()
+        for doc_id in range(1, 501):
+            for term, probability in [("casa", 2), ("verde", 5), ("azul", 20), ("sao", 3), ("paulo", 4)]:
+                if randrange(probability) == 0:
+                    self.index.index(term, doc_id, randrange(1, 5))
+                    self.dic_docs_per_term.setdefault(term, set()).add(doc_id)
+            # documentos sem nenhum dos termos acima
+            self.index.index("outro", doc_id, 1)
+        self.index.finish_indexing()
+        self.set_all_docs = set(range(1, 501))
+
+    def test_parse(self):
+        self.assertEqual(self.parser.parse("casa"), TermNode("casa"))
+        self.assertEqual(
+            self.parser.parse("Casa verde OR NOT azul"),
+            OrNode([AndNode([TermNode("casa"), TermNode("verde")]), NotNode(TermNode("azul"))]),
+        )
+        self.assertEqual(
+            self.parser.parse("casa AND (verde OR azul)"),
+            AndNode([TermNode("casa"), OrNode([TermNode("verde"), TermNode("azul")])]),
+        )
+        # termos entre aspas não são operadores e são normalizados como o texto indexado
+        self.assertEqual(
+            self.parser.parse('"São Paulo" NOT "OR"'),
+            AndNode([AndNode([TermNode("sao"), TermNode("paulo")]), NotNode(TermNode("or"))]),
+        )
+        # stop words são descartadas
+        self.assertEqual(self.parser.parse("a casa OR é"), TermNode("casa"))
+        self.assertIsNone(self.parser.parse("a OR NOT é"))
+        self.assertIsNone(self.parser.parse("  "))
+
+        parser_or = BooleanQueryParser(self.cleaner, OPERATOR.OR)
+        self.assertEqual(
+            parser_or.parse("casa verde AND azul"),
+            OrNode([TermNode("casa"), AndNode([TermNode("verde"), TermNode("azul")])]),
+        )
+
+        for str_query in ["casa AND", "(casa OR verde", "casa)", '"casa', "NOT", "OR casa"]:
+            with self.assertRaises(ValueError, msg=f"A consulta '{str_query}' é inválida"):
+                self.parser.parse(str_query)
+
+    def test_optimize(self):
+        planner = BooleanQueryPlanner(self.index)
+        self.assertEqual(
+            planner.optimize(NotNode(NotNode(TermNode("casa")))), TermNode("casa")
+        )
+        self.assertEqual(
+            planner.optimize(
+                AndNode([TermNode("casa"), NotNode(OrNode([TermNode("verde"), TermNode("azul")]))])
+            ),
+            AndNode([TermNode("casa"), NotNode(TermNode("verde")), NotNode(TermNode("azul"))]),
+        )
+        self.assertEqual(planner.estimate(TermNode("azul")), len(self.dic_docs_per_term["azul"]))
+        self.assertEqual(
+            planner.estimate(AndNode([TermNode("casa"), TermNode("azul")])),
+            len(self.dic_docs_per_term["azul"]),
+        )
+
+    def expected_docs(self, node) -> set:
+        if isinstance(node, TermNode):
+            return self.dic_docs_per_term.get(node.term, set())
+        if isinstance(node, NotNode):
+            return self.set_all_docs - self.expected_docs(node.child)
+        lst_sets = [self.expected_docs(child) for child in node.lst_children]
+        if isinstance(node, AndNode):
+            return set.intersection(*lst_sets)
+        return set.union(*lst_sets)
+
+    def test_evaluate(self):
+        planner = BooleanQueryPlanner(self.index)
+        for str_query in [
+            "casa",
+            "casa verde",
+            "casa OR verde OR azul",
+            "casa NOT verde",
+            "NOT casa",
+            "NOT (casa OR verde) AND azul",
+            "(casa OR azul) AND NOT (verde AND paulo)",
+            '"são paulo" OR (casa AND NOT NOT azul)',
+            "NOT casa NOT verde",
+            "crocodilo OR azul",
+            "crocodilo azul",
+            "NOT crocodilo",
+        ]:
+            node = self.parser.parse(str_query)
+            self.assertListEqual(
+                planner.evaluate(node),
+                sorted(self.expected_docs(node)),
+                msg=f"Resposta inesperada para a consulta '{str_query}'",
+            )
+        self.assertListEqual(planner.evaluate(self.parser.parse("é")), [])
+
+    def test_evaluate_out_of_order(self):
+        # os mesmos documentos, indexados fora de ordem de doc_id
+        lst_doc_ids = list(range(1, 501))
+        shuffle(lst_doc_ids)
+        index = HashIndex()
+        for doc_id in lst_doc_ids:
+            for term, set_doc_ids in self.dic_docs_per_term.items():
+                if doc_id in set_doc_ids:
+                    index.index(term, doc_id, 1)
+            index.index("outro", doc_id, 1)
+        planner = BooleanQueryPlanner(index)
+        for str_query in [
+            "casa verde",
+            "casa NOT verde",
+            "NOT casa",
+            "casa azul NOT paulo",
+            "casa OR verde OR azul",
+            "(casa OR azul) AND NOT (verde AND paulo)",
+        ]:
+            node = self.parser.parse(str_query)
+            self.assertListEqual(
+                planner.evaluate(node),
+                sorted(self.expected_docs(node)),
+                msg=f"Resposta inesperada para a consulta '{str_query}'",
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,210 @@
+from query.ranking_models import (
+    VectorRankingModel,
+    BM25RankingModel,
+    BooleanRankingModel,
+    IndexPreComputedVals,
+    OPERATOR,
+)
+from query.pruning import WandRetriever
+from index.structure import CompactHashIndex, Postings, TermOccurrence
+from util.performance import CheckPerformance, CHECK_TIMINGS
+from array import array
+from random import random, randrange, sample, seed
+import unittest
+
+
+class TopKPerformanceTest(unittest.TestCase):
+    K = 50
+    REPETITIONS = 5
+
+    def test_top_k_latency(self):
+        # latência da seleção dos K primeiros em relação à ordenação completa, por tamanho do conjunto de candidatos
+        seed(10)
+        model = VectorRankingModel(None)
+        for num_candidates in [1000, 10000, 100000, 500000]:
+            documents_weight = {doc_id: random() for doc_id in range(1, num_candidates + 1)}
+
+            perfomance = CheckPerformance()
+            for i in range(TopKPerformanceTest.REPETITIONS):
+                lst_full = model.rank_document_ids(documents_weight)
+            time_full = perfomance.elapsed_seconds() / TopKPerformanceTest.REPETITIONS
+
+            perfomance = CheckPerformance()
+            for i in range(TopKPerformanceTest.REPETITIONS):
+                lst_top_k = model.rank_document_ids(documents_weight, TopKPerformanceTest.K)
+            time_top_k = perfomance.elapsed_seconds() / TopKPerformanceTest.REPETITIONS
+
+            self.assertListEqual(lst_top_k, lst_full[: TopKPerformanceTest.K])
+            print(
+                f"{num_candidates} candidatos: ordenação completa {time_full * 1000:.1f} ms, "
+                f"top {TopKPerformanceTest.K} {time_top_k * 1000:.1f} ms"
+            )
+            if CHECK_TIMINGS and num_candidates >= 100000:
+                self.assertLess(time_top_k, time_full)
+
+
+class VectorScoringPerformanceTest(unittest.TestCase):
+    NUM_DOCS = 100000
+    # quantidade de documentos de cada termo do índice sintético
+    ARR_DOC_COUNT_PER_TERM = [50000, 20000, 5000, 1000, 100]
+    K = 50
+
+    def setUp(self):
+        seed(10)
+        self.index = CompactHashIndex()
+        for int_term_id, doc_count in enumerate(
+            VectorScoringPerformanceTest.ARR_DOC_COUNT_PER_TERM, start=1
+        ):
+            doc_ids = array(
+                "I", sorted(sample(range(1, VectorScoringPerformanceTest.NUM_DOCS + 1), doc_count))
+            )
+            term_freqs = array("I", (randrange(1, 20) for doc_id in doc_ids))
+            self.index.dic_index[f"t{int_term_id}"] = Postings(int_term_id, doc_ids, term_freqs)
+            for doc_id, term_freq in zip(doc_ids, term_freqs):
+                self.index.documents.add(doc_id, term_freq)
+        self.vector_model = VectorRankingModel(IndexPreComputedVals(self.index))
+        self.bm25_model = BM25RankingModel(self.index)
+
+    def assert_same_ranking(self, lst_response, dic_response, lst_expected, dic_expected):
+        # os caminhos somam os pesos em ordens diferentes: documentos empatados podem diferir nos últimos bits
+        # e trocar de posição, mas os pesos de cada posição são os mesmos
+        self.assertEqual(len(lst_response), len(lst_expected))
+        for doc_id, expected_doc_id in zip(lst_response, lst_expected):
+            self.assertAlmostEqual(dic_response[doc_id], dic_expected[expected_doc_id], places=9)
+
+    def test_query_latency(self):
+        # latência por consulta: ocorrências em TermOccurrence (get_ordered_docs) x processamento termo a termo dos arrays
+        for lst_terms in [["t1"], ["t2", "t4"], ["t1", "t2", "t3"], ["t3", "t4", "t5"]]:
+            map_query = {
+                term: TermOccurrence(None, self.index.get_term_id(term), 1) for term in lst_terms
+            }
+            perfomance = CheckPerformance()
+            lst_expected, dic_expected = self.vector_model.get_ordered_docs(
+                map_query,
+                {term: self.index.get_occurrence_list(term) for term in lst_terms},
+                VectorScoringPerformanceTest.K,
+            )
+            time_occurrences = perfomance.elapsed_seconds()
+
+            perfomance = CheckPerformance()
+            lst_response, dic_response = self.vector_model.get_ordered_docs_from_postings(
+                map_query,
+                {term: self.index.get_postings(term) for term in lst_terms},
+                VectorScoringPerformanceTest.K,
+            )
+            time_postings = perfomance.elapsed_seconds()
+
+            perfomance = CheckPerformance()
+            self.bm25_model.get_ordered_docs_from_postings(
+                map_query,
+                {term: self.index.get_postings(term) for term in lst_terms},
+                VectorScoringPerformanceTest.K,
+            )
+            time_bm25 = perfomance.elapsed_seconds()
+
+            self.assert_same_ranking(lst_response, dic_response, lst_expected, dic_expected)
+            int_postings = sum(len(self.index.get_postings(term)) for term in lst_terms)
+            print(
+                f"Consulta {lst_terms} ({int_postings} ocorrências): TermOccurrence {time_occurrences * 1000:.1f} ms, "
+                f"arrays {time_postings * 1000:.1f} ms, BM25 {time_bm25 * 1000:.1f} ms"
+            )
+            if CHECK_TIMINGS:
+                self.assertLess(time_postings, time_occurrences)
+
+    def test_wand_latency(self):
+        # latência e ocorrências puladas com poda dinâmica (WAND e Block-Max WAND) x pontuação exaustiva
+        for model in [self.vector_model, self.bm25_model]:
+            arr_retrievers = [
+                WandRetriever(model, self.index, block_max=False),
+                WandRetriever(model, self.index, block_max=True),
+            ]
+            for lst_terms in [["t1", "t5"], ["t2", "t4"], ["t1", "t2", "t3"], ["t3", "t4", "t5"]]:
+                map_query = {
+                    term: TermOccurrence(None, self.index.get_term_id(term), 1) for term in lst_terms
+                }
+                perfomance = CheckPerformance()
+                lst_expected, dic_expected = model.get_ordered_docs_from_postings(
+                    map_query,
+                    {term: self.index.get_postings(term) for term in lst_terms},
+                    VectorScoringPerformanceTest.K,
+                )
+                time_exhaustive = perfomance.elapsed_seconds()
+
+                str_times = ""
+                for retriever in arr_retrievers:
+                    # os limites de cada termo são calculados na primeira consulta
+                    retriever.get_ordered_docs(map_query, VectorScoringPerformanceTest.K)
+                    perfomance = CheckPerformance()
+                    lst_response, dic_response = retriever.get_ordered_docs(
+                        map_query, VectorScoringPerformanceTest.K
+                    )
+                    time_wand = perfomance.elapsed_seconds()
+                    self.assert_same_ranking(lst_response, dic_response, lst_expected, dic_expected)
+                    str_name = "BMW" if retriever.block_max else "WAND"
+                    str_times += (
+                        f", {str_name} {time_wand * 1000:.1f} ms "
+                        f"({retriever.postings_skipped}/{retriever.postings_total} ocorrências puladas)"
+                    )
+                print(
+                    f"{type(model).__name__} consulta {lst_terms}: exaustiva {time_exhaustive * 1000:.1f} ms{str_times}"
+                )
+
+    def test_boolean_and_latency(self):
+        # interseção por conjuntos de todas as ocorrências x galloping search a partir do termo mais raro
+        model_and = BooleanRankingModel(OPERATOR.AND)
+        for lst_terms in [["t1", "t5"], ["t1", "t2", "t4"], ["t1", "t2"], ["t3", "t4", "t5"]]:
+            map_postings = {term: self.index.get_postings(term) for term in lst_terms}
+            perfomance = CheckPerformance()
+            set_expected = set(map_postings[lst_terms[0]].doc_ids)
+            for postings in map_postings.values():
+                set_expected &= set(postings.doc_ids)
+            time_sets = perfomance.elapsed_seconds()
+
+            perfomance = CheckPerformance()
+            lst_response, _ = model_and.get_ordered_docs_from_postings({}, map_postings)
+            time_galloping = perfomance.elapsed_seconds()
+
+            self.assertListEqual(lst_response, sorted(set_expected))
+            int_min_postings = min(len(postings) for postings in map_postings.values())
+            int_max_postings = max(len(postings) for postings in map_postings.values())
+            print(
+                f"AND {lst_terms} (menor lista com {int_min_postings} ocorrências): "
+                f"conjuntos {time_sets * 1000:.2f} ms, galloping {time_galloping * 1000:.2f} ms"
+            )
+            if CHECK_TIMINGS and int_min_postings * 100 <= int_max_postings:
+                self.assertLess(time_galloping, time_sets)
+
+    def test_boolean_or_latency(self):
+        # união por conjuntos (seguida de ordenação) x intercalação por heap, completa e só dos K primeiros
+        model_or = BooleanRankingModel(OPERATOR.OR)
+        for lst_terms in [["t1", "t5"], ["t2", "t3", "t4"], ["t1", "t2", "t3"]]:
+            map_postings = {term: self.index.get_postings(term) for term in lst_terms}
+            perfomance = CheckPerformance()
+            set_expected = set()
+            for postings in map_postings.values():
+                set_expected |= set(postings.doc_ids)
+            lst_expected = sorted(set_expected)
+            time_sets = perfomance.elapsed_seconds()
+
+            perfomance = CheckPerformance()
+            lst_response, _ = model_or.get_ordered_docs_from_postings({}, map_postings)
+            time_merge = perfomance.elapsed_seconds()
+
+            perfomance = CheckPerformance()
+            lst_top_k, _ = model_or.get_ordered_docs_from_postings(
+                {}, map_postings, VectorScoringPerformanceTest.K
+            )
+            time_top_k = perfomance.elapsed_seconds()
+
+            self.assertListEqual(lst_response, lst_expected)
+            self.assertListEqual(lst_top_k, lst_expected[: VectorScoringPerformanceTest.K])
+            print(
+                f"OR {lst_terms} ({len(lst_expected)} documentos): conjuntos {time_sets * 1000:.2f} ms, "
+                f"heap {time_merge * 1000:.2f} ms, primeiros {VectorScoringPerformanceTest.K} {time_top_k * 1000:.2f} ms"
+            )
+            if CHECK_TIMINGS:
+                self.assertLess(time_top_k, time_sets)
+
+
+if __name__ == "__main__":
+    unittest.main()
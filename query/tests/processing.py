@@ -1,12 +1,23 @@
-from index.structure import FileIndex, TermOccurrence
-from query.processing import QueryRunner, VectorRankingModel, IndexPreComputedVals
+from index.structure import Index, FileIndex, TermOccurrence
+from index.segments import SegmentedIndex
+from query.processing import (
+    QueryRunner,
+    VectorRankingModel,
+    IndexPreComputedVals,
+    BooleanRankingModel,
+    OPERATOR,
+)
 from index.indexer import Cleaner
+from index.index_structure_test import use_temporary_dir
 from typing import Mapping
+from unittest.mock import patch
+import tempfile
 import unittest
 
 
 class ProcessingTest(unittest.TestCase):
     def setUp(self):
+        use_temporary_dir(self, ["stopwords.txt", "relevant_docs"])
         self.index = FileIndex()
         self.index.index("adoro", 1, 1)
         self.index.index("vocês", 2, 3)
@@ -190,6 +201,57 @@ class ProcessingTest(unittest.TestCase):
                 f"A resposta a consulta '{query}' deveria ser {arr_expected_response[i]} e não {resposta}",
             )
 
+    def test_get_docs_term_top_k(self):
+        _, pesos_completos = self.queryRunner.get_docs_term("Vocês estejam")
+        resposta, pesos = self.queryRunner.get_docs_term("Vocês estejam", k=1)
+        self.assertListEqual(resposta, [3])
+        # com k, a consulta é processada com poda dinâmica (ver WandRetriever)
+        self.assertIsNotNone(self.queryRunner.retriever)
+        self.assertAlmostEqual(pesos[3], pesos_completos[3])
+        self.assertListEqual(self.queryRunner.get_docs_term("Vocês estejam", k=5)[0], [3, 2])
+
+    def test_default_index_path(self):
+        # o índice incremental, quando existe, é usado no lugar do índice completo
+        with tempfile.TemporaryDirectory() as str_dir:
+            str_segments = f"{str_dir}/wiki_segments"
+            with patch.object(QueryRunner, "SEGMENTED_INDEX_DIR", str_segments):
+                self.assertEqual(QueryRunner.default_index_path(), QueryRunner.INDEX_FILE)
+                with SegmentedIndex(str_segments) as segmented_index:
+                    segmented_index.add_segment(
+                        self.index,
+                        [(f"a/{doc_id}.html", doc_id, 1.0, f"h{doc_id}") for doc_id in [1, 2, 3]],
+                    )
+                self.assertEqual(QueryRunner.default_index_path(), str_segments)
+                with Index.read(QueryRunner.default_index_path()) as index:
+                    self.assertEqual(index.document_count, 3)
+
+    def test_main_invalid_boolean_query(self):
+        # uma consulta malformada não encerra a sessão: a consulta é pedida novamente
+        lst_inputs = ["0", "1", "vocês AND", '"vocês', "(vocês estejam"]
+        with patch.object(Index, "read", return_value=self.index), patch(
+            "builtins.input", side_effect=lst_inputs + ["vocês estejam"]
+        ) as mock_input, patch.object(QueryRunner, "runQuery", wraps=QueryRunner.runQuery) as mock_run:
+            QueryRunner.main("wiki.idx")
+        self.assertEqual(mock_input.call_count, len(lst_inputs) + 1)
+        self.assertEqual(mock_run.call_args[0][0], "vocês estejam")
+
+    def test_get_docs_boolean_query(self):
+        # consultas do modelo booleano usam a linguagem de consulta (ver query.boolean_query)
+        query_runner = QueryRunner(
+            BooleanRankingModel(OPERATOR.OR), self.index, self.queryRunner.cleaner
+        )
+        dic_expected_per_query = {
+            "vocês adoro": [1, 2, 3],
+            "vocês AND NOT estejam": [2],
+            "(adoro OR estejam) AND NOT espero": [1, 3],
+            "NOT vocês": [1],
+            "crocodilo": [],
+        }
+        for query, expected in dic_expected_per_query.items():
+            resposta, _ = query_runner.get_docs_term(query)
+            self.assertListEqual(resposta, expected, f"Resposta inesperada para a consulta '{query}'")
+        self.assertListEqual(query_runner.get_docs_term("vocês adoro", k=2)[0], [1, 2])
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,98 @@
+from query.ranking_models import VectorRankingModel, BM25RankingModel, IndexPreComputedVals
+from query.pruning import WandRetriever
+from index.structure import HashIndex, CompactHashIndex, Postings, TermOccurrence
+from array import array
+from random import randrange, sample, seed, shuffle
+import unittest
+
+
+class WandRetrieverTest(unittest.TestCase):
+    NUM_DOCS = 2000
+
+    def setUp(self):
+        seed(10)
+        self.index = CompactHashIndex()
+        for int_term_id, doc_count in enumerate([1500, 800, 300, 40, 5], start=1):
+            doc_ids = array("I", sorted(sample(range(1, WandRetrieverTest.NUM_DOCS + 1), doc_count)))
+            # frequências repetidas geram empates de peso
+            term_freqs = array("I", (randrange(1, 6) for doc_id in doc_ids))
+            self.index.dic_index[f"t{int_term_id}"] = Postings(int_term_id, doc_ids, term_freqs)
+            for doc_id, term_freq in zip(doc_ids, term_freqs):
+                self.index.documents.add(doc_id, term_freq)
+        self.arr_models = [
+            VectorRankingModel(IndexPreComputedVals(self.index)),
+            BM25RankingModel(self.index),
+        ]
+
+    def test_same_top_k(self):
+        # o resultado com poda deve ser o mesmo da pontuação exaustiva
+        for model in self.arr_models:
+            for block_max in [False, True]:
+                retriever = WandRetriever(model, self.index, block_max=block_max, block_size=16)
+                for lst_terms in [["t1"], ["t1", "t2"], ["t1", "t4", "t5"], ["t1", "t2", "t3", "inexistente"]]:
+                    map_query = {
+                        term: TermOccurrence(None, None, randrange(1, 3)) for term in lst_terms
+                    }
+                    map_postings = {
+                        term: self.index.get_postings(term)
+                        for term in lst_terms
+                        if term in self.index.dic_index
+                    }
+                    for k in [1, 10, 100]:
+                        lst_expected, dic_expected = model.get_ordered_docs_from_postings(
+                            map_query, map_postings, k
+                        )
+                        lst_response, dic_weights = retriever.get_ordered_docs(map_query, k)
+                        # os pesos são somados em outra ordem: documentos empatados na pontuação exaustiva
+                        # podem diferir nos últimos bits e trocar de posição, mas os pesos de cada posição
+                        # são os mesmos
+                        str_msg = f"Resposta inesperada ({type(model).__name__}, block_max={block_max}, consulta {lst_terms}, k={k})"
+                        self.assertEqual(len(lst_response), len(lst_expected), msg=str_msg)
+                        for doc_id, expected_doc_id in zip(lst_response, lst_expected):
+                            self.assertAlmostEqual(
+                                dic_weights[doc_id], dic_expected[expected_doc_id], places=9, msg=str_msg
+                            )
+                            self.assertAlmostEqual(dic_weights[doc_id], dic_expected[doc_id], places=9)
+                        self.assertListEqual(
+                            lst_response,
+                            sorted(lst_response, key=lambda doc_id: (-dic_weights[doc_id], doc_id)),
+                            msg=str_msg,
+                        )
+                        self.assertEqual(
+                            retriever.postings_scored + retriever.postings_skipped,
+                            retriever.postings_total,
+                        )
+
+    def test_out_of_order_postings(self):
+        # os mesmos documentos, indexados fora de ordem de doc_id
+        lst_postings = [(term, self.index.get_postings(term)) for term in self.index.vocabulary]
+        lst_doc_ids = list(range(1, WandRetrieverTest.NUM_DOCS + 1))
+        shuffle(lst_doc_ids)
+        dic_positions = {doc_id: position for position, doc_id in enumerate(lst_doc_ids)}
+        index = HashIndex()
+        for term, postings in lst_postings:
+            for doc_id, term_freq in sorted(
+                zip(postings.doc_ids, postings.term_freqs), key=lambda pair: dic_positions[pair[0]]
+            ):
+                index.index(term, doc_id, term_freq)
+        for model in [VectorRankingModel(IndexPreComputedVals(index)), BM25RankingModel(index)]:
+            retriever = WandRetriever(model, index, block_size=16)
+            map_query = {term: TermOccurrence(None, None, 1) for term in ["t1", "t2", "t4"]}
+            lst_expected, dic_expected = model.get_ordered_docs_from_postings(
+                map_query, {term: index.get_postings(term) for term in map_query}, 10
+            )
+            lst_response, dic_weights = retriever.get_ordered_docs(map_query, 10)
+            for doc_id, expected_doc_id in zip(lst_response, lst_expected):
+                self.assertAlmostEqual(dic_weights[doc_id], dic_expected[expected_doc_id], places=9)
+            self.assertEqual(len(lst_response), len(lst_expected))
+
+    def test_skips_postings(self):
+        # com poucos documentos no top k, a maior parte das ocorrências dos termos frequentes é pulada
+        retriever = WandRetriever(self.arr_models[1], self.index, block_size=16)
+        map_query = {term: TermOccurrence(None, None, 1) for term in ["t1", "t5"]}
+        retriever.get_ordered_docs(map_query, 5)
+        self.assertGreater(retriever.postings_skipped, retriever.postings_scored)
+
+
+if __name__ == "__main__":
+    unittest.main()
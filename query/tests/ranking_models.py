@@ -2,14 +2,18 @@ from query.ranking_models import (
     IndexPreComputedVals,
     VectorRankingModel,
     BooleanRankingModel,
+    BM25RankingModel,
     OPERATOR,
 )
-from index.structure import HashIndex, FileIndex, TermOccurrence
+from index.structure import HashIndex, CompactHashIndex, FileIndex, TermOccurrence, Postings
+from index.index_structure_test import use_temporary_dir
+from random import randrange, seed
 import unittest
 
 
 class RankingModelTest(unittest.TestCase):
     def setUp(self):
+        use_temporary_dir(self)
         self.arr_indexes = [
             {
                 "a": [TermOccurrence(1, 1, 1), TermOccurrence(3, 1, 1)],
@@ -120,6 +124,126 @@ class RankingModelTest(unittest.TestCase):
                     msg=f"Consulta com operador OR obteve um resultado inesperado ({set_response}) para o indice {idx} consulta {query_position}. Esperava-se: {arr_set_esperado_or_per_query[idx][query_position]} ",
                 )
 
+    def test_boolean_intersection(self):
+        seed(10)
+        doc_ids = list(range(3, 3000, 3))
+        for doc_id in [0, 2, 3, 4, 1500, 2997, 2998, 5000]:
+            expected = next((i for i, d in enumerate(doc_ids) if d >= doc_id), len(doc_ids))
+            for start in [0, min(expected, 7)]:
+                self.assertEqual(
+                    BooleanRankingModel.galloping_search(doc_ids, doc_id, start), expected
+                )
+
+        # listas ordenadas de tamanhos bem diferentes, em qualquer ordem
+        lst_doc_ids = [
+            sorted({randrange(1, 5000) for i in range(int_size)}) for int_size in [4000, 30, 1500]
+        ]
+        expected = set(lst_doc_ids[0]) & set(lst_doc_ids[1]) & set(lst_doc_ids[2])
+        self.assertListEqual(BooleanRankingModel.intersect_sorted(lst_doc_ids), sorted(expected))
+        self.assertListEqual(BooleanRankingModel.intersect_sorted(lst_doc_ids[:1]), lst_doc_ids[0])
+        self.assertListEqual(BooleanRankingModel.intersect_sorted(lst_doc_ids + [[]]), [])
+        self.assertListEqual(BooleanRankingModel.intersect_sorted([]), [])
+        self.assertListEqual(
+            BooleanRankingModel.difference_sorted(lst_doc_ids[0], lst_doc_ids[2]),
+            sorted(set(lst_doc_ids[0]) - set(lst_doc_ids[2])),
+        )
+        self.assertListEqual(BooleanRankingModel.difference_sorted([1, 5, 9], [2, 5]), [1, 9])
+        self.assertListEqual(BooleanRankingModel.difference_sorted([1, 5], []), [1, 5])
+
+        # arrays de Postings e listas de TermOccurrence geram a mesma resposta
+        map_query = self.arr_queries_per_idx[0][0]
+        map_index_for_query = self.obtem_index_for_query(map_query, self.arr_indexes[0])
+        model_and = BooleanRankingModel(OPERATOR.AND)
+        self.assertListEqual(
+            model_and.get_ordered_docs_from_postings(
+                map_query, self.to_postings(map_index_for_query)
+            )[0],
+            [2, 4],
+        )
+
+    def index_out_of_order(self, index_class):
+        # documentos indexados fora de ordem de doc_id, como nos índices antigos (ordem de os.listdir)
+        index = index_class()
+        for doc_id in [5, 2, 9, 1]:
+            index.index("a", doc_id, 1)
+        for doc_id in [9, 1, 5]:
+            index.index("b", doc_id, 2)
+        return index
+
+    def test_boolean_intersection_out_of_order(self):
+        map_query = {term: TermOccurrence(None, None, 1) for term in ["a", "b"]}
+        model_and = BooleanRankingModel(OPERATOR.AND)
+        for index_class in [HashIndex, CompactHashIndex]:
+            index = self.index_out_of_order(index_class)
+            self.assertListEqual(list(index.get_postings("a").doc_ids), [1, 2, 5, 9])
+            self.assertListEqual(
+                [occur.doc_id for occur in index.get_occurrence_list("b")], [1, 5, 9]
+            )
+            self.assertListEqual(
+                model_and.get_ordered_docs(
+                    map_query, {term: index.get_occurrence_list(term) for term in map_query}
+                )[0],
+                [1, 5, 9],
+            )
+            self.assertListEqual(
+                model_and.get_ordered_docs_from_postings(
+                    map_query, {term: index.get_postings(term) for term in map_query}
+                )[0],
+                [1, 5, 9],
+            )
+
+    def test_boolean_union_out_of_order(self):
+        map_query = {term: TermOccurrence(None, None, 1) for term in ["a", "b"]}
+        model_or = BooleanRankingModel(OPERATOR.OR)
+        for index_class in [HashIndex, CompactHashIndex]:
+            index = self.index_out_of_order(index_class)
+            self.assertListEqual(
+                model_or.get_ordered_docs(
+                    map_query, {term: index.get_occurrence_list(term) for term in map_query}
+                )[0],
+                [1, 2, 5, 9],
+            )
+            self.assertListEqual(
+                model_or.get_ordered_docs_from_postings(
+                    map_query, {term: index.get_postings(term) for term in map_query}
+                )[0],
+                [1, 2, 5, 9],
+            )
+
+    def test_boolean_union(self):
+        seed(10)
+        lst_doc_ids = [
+            sorted({randrange(1, 5000) for i in range(int_size)}) for int_size in [4000, 30, 1500]
+        ]
+        expected = sorted(set(lst_doc_ids[0]) | set(lst_doc_ids[1]) | set(lst_doc_ids[2]))
+        self.assertListEqual(list(BooleanRankingModel.iter_union_sorted(lst_doc_ids)), expected)
+        self.assertListEqual(list(BooleanRankingModel.iter_union_sorted([])), [])
+
+        # a união é gerada sob demanda: para obter os primeiros doc_ids, só o início de cada lista é lido
+        lst_read = []
+
+        def iter_reading(doc_ids):
+            for doc_id in doc_ids:
+                lst_read.append(doc_id)
+                yield doc_id
+
+        iter_union = BooleanRankingModel.iter_union_sorted(
+            [iter_reading(doc_ids) for doc_ids in lst_doc_ids]
+        )
+        self.assertListEqual([next(iter_union) for i in range(10)], expected[:10])
+        self.assertLess(len(lst_read), 30)
+
+        map_query = self.arr_queries_per_idx[0][0]
+        map_index_for_query = self.obtem_index_for_query(map_query, self.arr_indexes[0])
+        model_or = BooleanRankingModel(OPERATOR.OR)
+        for k in [None, 2]:
+            self.assertListEqual(
+                model_or.get_ordered_docs_from_postings(
+                    map_query, self.to_postings(map_index_for_query), k
+                )[0],
+                [1, 2, 4][:k],
+            )
+
     def test_vector_model(self):
         index = FileIndex()
         precomp = IndexPreComputedVals(index)
@@ -169,6 +293,104 @@ class RankingModelTest(unittest.TestCase):
                             msg=f"Peso inesperado do documento {doc_id} consulta {query_position} índice {idx}. Peso calculado:{doc_weights[doc_id]} deveria ser: {peso}",
                         )
 
+    def to_postings(self, map_index):
+        map_postings = {}
+        for term, lst_occur in map_index.items():
+            postings = Postings(lst_occur[0].term_id)
+            for occur in lst_occur:
+                postings.append(occur.doc_id, occur.term_freq)
+            map_postings[term] = postings
+        return map_postings
+
+    def test_vector_model_postings(self):
+        # o processamento termo a termo sobre os arrays deve gerar a mesma resposta de get_ordered_docs
+        seed(10)
+        map_index = {}
+        for term_id in range(1, 40):
+            lst_doc_ids = sorted({randrange(1, 300) for i in range(randrange(1, 150))})
+            map_index[f"termo{term_id}"] = [
+                TermOccurrence(doc_id, term_id, randrange(1, 100)) for doc_id in lst_doc_ids
+            ]
+        precomp = IndexPreComputedVals(FileIndex())
+        precomp.doc_count = 300
+        precomp.document_norm = {doc_id: 1 + randrange(0, 1000) / 100 for doc_id in range(300)}
+        vector_model = VectorRankingModel(precomp)
+        map_postings = self.to_postings(map_index)
+        for lst_terms in [["termo1"], ["termo2", "termo3", "termo5"], list(map_index)]:
+            map_query = {
+                term: TermOccurrence(None, int(term[5:]), randrange(1, 3)) for term in lst_terms
+            }
+            for k in [None, 10]:
+                lst_expected, dic_expected = vector_model.get_ordered_docs(
+                    map_query, self.obtem_index_for_query(map_query, map_index), k
+                )
+                lst_response, dic_weights = vector_model.get_ordered_docs_from_postings(
+                    map_query, self.obtem_index_for_query(map_query, map_postings), k
+                )
+                self.assertListEqual(lst_response, lst_expected)
+                self.assertCountEqual(dic_weights, dic_expected)
+                for doc_id, weight in dic_expected.items():
+                    self.assertAlmostEqual(dic_weights[doc_id], weight, places=9)
+
+    def test_bm25_model(self):
+        index = CompactHashIndex()
+        for map_index in self.arr_indexes[1:]:
+            for term, lst_occur in map_index.items():
+                for occur in lst_occur:
+                    index.index(term, occur.doc_id, occur.term_freq)
+        bm25_model = BM25RankingModel(index, k1=1.2, b=0.75)
+        self.assertAlmostEqual(bm25_model.avg_length, 4)
+        # o tamanho médio vem das estatísticas dos documentos do índice, também usadas pelo modelo vetorial
+        self.assertIsNotNone(index.document_stats)
+        self.assertEqual(bm25_model.avg_length, index.document_stats.avg_length)
+        self.assertIs(IndexPreComputedVals(index).document_stats, index.document_stats)
+
+        map_query = self.arr_queries_per_idx[1][0]
+        peso_por_doc_esperado = {1: 1.122, 2: 0.524, 3: 0.524}
+        lst_response, doc_weights = bm25_model.get_ordered_docs(
+            map_query, {term: index.get_occurrence_list(term) for term in map_query}
+        )
+        self.assertListEqual(lst_response, [1, 2, 3])
+        for doc_id, peso in peso_por_doc_esperado.items():
+            self.assertAlmostEqual(doc_weights[doc_id], peso, places=3)
+
+        lst_postings_response, postings_weights = bm25_model.get_ordered_docs_from_postings(
+            map_query, {term: index.get_postings(term) for term in map_query}, k=2
+        )
+        self.assertListEqual(lst_postings_response, [1, 2])
+        for doc_id, peso in doc_weights.items():
+            self.assertAlmostEqual(postings_weights[doc_id], peso, places=9)
+
+        # sem normalização pelo tamanho (b=0), o documento 3 tem o mesmo peso do documento 2
+        lst_response, doc_weights = BM25RankingModel(index, b=0).get_ordered_docs(
+            map_query, {term: index.get_occurrence_list(term) for term in map_query}
+        )
+        self.assertAlmostEqual(doc_weights[2], doc_weights[3])
+
+    def test_top_k(self):
+        seed(10)
+        # muitos empates: os pesos assumem apenas 20 valores
+        documents_weight = {doc_id: randrange(0, 20) / 4 for doc_id in range(1, 2000)}
+        model = VectorRankingModel(None)
+        lst_full = model.rank_document_ids(documents_weight)
+        self.assertListEqual(
+            lst_full,
+            sorted(documents_weight, key=lambda doc_id: (-documents_weight[doc_id], doc_id)),
+        )
+        # os pesos são comparados exatamente: 0.1 + 0.2 é maior que 0.3
+        self.assertListEqual(
+            model.rank_document_ids({3: 0.1 + 0.2, 1: 0.3, 2: 0.29}), [3, 1, 2]
+        )
+        self.assertListEqual(model.rank_document_ids({3: 0.1 + 0.2, 1: 0.3, 2: 0.29}, 1), [3])
+        for k in [1, 10, 50, 1999, 5000]:
+            self.assertListEqual(model.rank_document_ids(documents_weight, k), lst_full[:k])
+
+        map_query = self.arr_queries_per_idx[1][0]
+        map_index_for_query = self.obtem_index_for_query(map_query, self.arr_indexes[1])
+        model_or = BooleanRankingModel(OPERATOR.OR)
+        lst_response, _ = model_or.get_ordered_docs(map_query, map_index_for_query, k=2)
+        self.assertListEqual(lst_response, [1, 2])
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,32 @@
+from IPython.display import clear_output
+from datetime import datetime
+import os
+
+# comparações de tempo dos testes de desempenho: variam muito em máquinas carregadas, por isso os tempos
+# são apenas impressos, a não ser que a variável de ambiente CHECK_TIMINGS=1 seja definida
+CHECK_TIMINGS = os.environ.get("CHECK_TIMINGS") == "1"
+
+
+class CheckPerformance(object):
+    def __init__(self, count_total: int = None, clear_output: bool = False):
+        self.count_total = count_total
+        self.clear_output = clear_output
+        self.time = datetime.now()
+
+    def elapsed_seconds(self) -> float:
+        return (datetime.now() - self.time).total_seconds()
+
+    def print_step(self, task: str, count: int):
+        """
+        Imprime o progresso de `task` após `count` itens processados: tempo decorrido,
+        itens por segundo e, caso `count_total` tenha sido informado, o tempo restante estimado.
+        """
+        elapsed = self.elapsed_seconds()
+        rate = count / elapsed if elapsed > 0 else 0.0
+        message = f"{task}: {count} itens em {elapsed:.2f}s ({rate:.0f} itens/s)"
+        if self.count_total:
+            remaining = (self.count_total - count) / rate if rate > 0 else 0.0
+            message += f" {100 * count / self.count_total:.1f}% - faltam {remaining:.1f}s"
+        if self.clear_output:
+            clear_output(wait=True)
+        print(message)